@@ -0,0 +1,104 @@
+"""Сравнение времени кадра: immediate-режим (glBegin/glEnd), геометрия в VBO
+и инстансинг, а также прямое и отложенное освещение
+
+Запуск: python benchmark.py --frames 300 --extra 200 --lights 100
+"""
+import argparse
+import time
+
+# headless - раньше OpenGL: по --headless выбирает платформу PyOpenGL
+from headless import HEADLESS_BACKENDS
+import pygame
+from OpenGL.GL import *
+
+from main import CornellBoxApp
+
+
+def measure(app, frames, warmup=10):
+    """Среднее и медианное время отрисовки сцены (без HUD) в миллисекундах"""
+    times = []
+    for i in range(warmup + frames):
+        pygame.event.pump()
+        start = time.perf_counter()
+
+        app.gl.begin_frame()
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        glMatrixMode(GL_MODELVIEW)
+        glLoadIdentity()
+        app.camera.get_view_matrix()
+        app.draw_cornell_box()
+        glFinish()  # Ждём GPU, чтобы мерить полный кадр
+
+        if i >= warmup:
+            times.append((time.perf_counter() - start) * 1000.0)
+        app.present()
+
+    times.sort()
+    return sum(times) / len(times), times[len(times) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк immediate-режима, VBO и инстансинга")
+    parser.add_argument('--frames', type=int, default=300, help="число измеряемых кадров")
+    parser.add_argument('--extra', type=int, default=0, help="дополнительные случайные объекты")
+    parser.add_argument('--lights', type=int, default=0,
+                        help="дополнительные точечные источники (для сравнения освещения)")
+    parser.add_argument('--headless', choices=HEADLESS_BACKENDS,
+                        help="без окна и видеокарты: EGL без поверхности или программный OSMesa")
+    args = parser.parse_args()
+
+    app = CornellBoxApp(headless=args.headless)
+    pygame.event.set_grab(False)
+    # Фоновое запекание лайтмапов отнимало бы процессор у измерений
+    app.lightmapping = False
+    if args.extra:
+        app.create_stress_objects(args.extra)
+    if args.lights:
+        app.create_stress_lights(args.lights)
+
+    # (название, геометрия в VBO, инстансинг)
+    modes = [
+        ("glBegin/glEnd", False, False),
+        ("VBO/VAO", True, False),
+        ("инстансинг", True, True)
+    ]
+
+    print(f"Объектов: {len(app.objects)} ({app.objects.bytes_per_object()} байт на объект), "
+          f"кадров: {args.frames}")
+    results = {}
+    for name, retained, instanced in modes:
+        app.retained_geometry = retained
+        app.instanced_rendering = instanced
+        mean, median = measure(app, args.frames)
+        results[name] = mean
+        print(f"{name:>14}: среднее {mean:.2f} мс, медиана {median:.2f} мс")
+
+    # Что сэкономил кэш состояния OpenGL на последнем кадре (режим VBO/VAO)
+    app.retained_geometry = True
+    app.instanced_rendering = False
+    measure(app, 1, warmup=0)
+    app.gl.begin_frame()
+    stats = app.gl.stats()
+    print(f"Кэш состояния GL за кадр: выполнено {stats['frame_issued']}, "
+          f"пропущено {stats['frame_elided']}")
+
+    base = results["glBegin/glEnd"]
+    for name, retained, instanced in modes[1:]:
+        print(f"Ускорение ({name}): x{base / results[name]:.2f}")
+    
+    # Прямое кластерное освещение против отложенного (инстансинг, все источники)
+    print(f"Источников: {len(app.lights)}")
+    app.instanced_rendering = True
+    app.clustered_lighting = True
+    lighting = {}
+    for name, deferred in (("прямое", False), ("отложенное", True)):
+        app.deferred_shading = deferred
+        mean, median = measure(app, args.frames)
+        lighting[name] = mean
+        print(f"{name:>14}: среднее {mean:.2f} мс, медиана {median:.2f} мс")
+    print(f"Ускорение (отложенное): x{lighting['прямое'] / lighting['отложенное']:.2f}")
+    app.shutdown()
+
+
+if __name__ == "__main__":
+    main()
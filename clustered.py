@@ -0,0 +1,423 @@
+import math
+
+import numpy as np
+from OpenGL.GL import *
+
+from instancing import INSTANCE_ATTRIBUTES
+from shaders import ShaderProgram
+from shadows import MAX_SHADOW_LIGHTS
+
+
+# Данные источника в текстуре: 5 текселей RGBA32F на источник
+# (позиция в координатах вида + радиус, diffuse, specular, ambient, номер карты теней)
+LIGHT_TEXELS = 5
+
+# Ширина текстуры списка номеров источников
+INDEX_WIDTH = 1024
+
+# Текстурные блоки данных кластеров (блок 0 остаётся за текстурами сцены)
+LIGHT_UNIT = 1
+CLUSTER_UNIT = 2
+INDEX_UNIT = 3
+
+# Карты теней - после слоёв G-буфера (см. deferred.py)
+SHADOW_FIRST_UNIT = 10
+
+# Допуск сравнения с картой теней (доля расстояния + константа), против "acne"
+SHADOW_BIAS = (0.02, 0.02)
+
+# Выбор карты теней: в GLSL 1.30 массив sampler можно индексировать только константой
+SHADOW_LOOKUP_GLSL = "".join(
+    "uniform samplerCube shadow_map%d;\n" % i for i in range(MAX_SHADOW_LIGHTS)
+) + """
+float shadow_distance(int slot, vec3 direction)
+{
+""" + "".join(
+    "    if (slot == %d) return textureLod(shadow_map%d, direction, 0.0).r;\n" % (i, i)
+    for i in range(MAX_SHADOW_LIGHTS)
+) + """    return 1e30;
+}
+"""
+
+# Освещение по фрагментам: формула фиксированного конвейера (локальный
+# наблюдатель), но источники берутся только из списка своего кластера
+CLUSTERED_LIGHTING_GLSL = """
+uniform sampler2D light_data;
+uniform sampler2D cluster_data;
+uniform sampler2D light_indices;
+uniform vec2 viewport;
+uniform vec3 grid;          // плиток по x, по y, срезов по глубине
+uniform vec2 depth_slicing; // ближняя граница, срезов на единицу log(z)
+uniform mat3 view_to_world; // Направление из координат вида в мировые (карты теней)
+%(shadow_lookup)s
+vec3 clustered_lighting(vec3 eye, vec3 normal, vec3 ambient, vec3 diffuse,
+                        vec3 specular, float shininess)
+{
+    ivec2 tile = clamp(ivec2(gl_FragCoord.xy / viewport * grid.xy),
+                       ivec2(0), ivec2(grid.xy) - 1);
+    float depth = max(-eye.z, depth_slicing.x);
+    int slice = clamp(int(log(depth / depth_slicing.x) * depth_slicing.y), 0, int(grid.z) - 1);
+    vec2 cluster = texelFetch(cluster_data, ivec2(tile.y * int(grid.x) + tile.x, slice), 0).xy;
+    int offset = int(cluster.x);
+    int count = int(cluster.y);
+
+    vec3 view = normalize(-eye);
+    vec3 color = ambient * gl_LightModel.ambient.rgb;
+    for (int k = 0; k < count; k++) {
+        int entry = offset + k;
+        int light = int(texelFetch(light_indices, ivec2(entry %% %(index_width)d,
+                                                        entry / %(index_width)d), 0).r);
+        vec4 position = texelFetch(light_data, ivec2(0, light), 0);
+        vec3 light_diffuse = texelFetch(light_data, ivec2(1, light), 0).rgb;
+        vec3 light_specular = texelFetch(light_data, ivec2(2, light), 0).rgb;
+        vec3 light_ambient = texelFetch(light_data, ivec2(3, light), 0).rgb;
+        int shadow_slot = int(texelFetch(light_data, ivec2(4, light), 0).x);
+
+        vec3 to_light = position.xyz - eye;
+        float dist = length(to_light);
+        to_light /= dist;
+
+        // Радиус < 0 - источник без затухания (как GL_LIGHT0..7)
+        float attenuation = 1.0;
+        if (position.w > 0.0) {
+            float x = clamp(dist / position.w, 0.0, 1.0);
+            attenuation = (1.0 - x * x) * (1.0 - x * x);
+        }
+
+        // В тени остаётся только ambient источника
+        float shadow = 1.0;
+        if (shadow_slot >= 0) {
+            float occluder = shadow_distance(shadow_slot, view_to_world * -to_light);
+            if (dist * (1.0 - %(bias_scale)f) - %(bias)f > occluder)
+                shadow = 0.0;
+        }
+
+        float n_dot_l = max(dot(normal, to_light), 0.0);
+        vec3 lit = diffuse * light_diffuse * n_dot_l;
+        if (n_dot_l > 0.0) {
+            float n_dot_h = max(dot(normal, normalize(to_light + view)), 0.0);
+            lit += specular * light_specular * pow(n_dot_h, shininess);
+        }
+        color += (ambient * light_ambient + lit * shadow) * attenuation;
+    }
+    return color;
+}
+""" % {'index_width': INDEX_WIDTH, 'shadow_lookup': SHADOW_LOOKUP_GLSL,
+       'bias_scale': SHADOW_BIAS[0], 'bias': SHADOW_BIAS[1]}
+
+CLUSTERED_VERTEX_SHADER = """
+#version 130
+
+out vec3 v_eye;
+out vec3 v_normal;
+
+void main()
+{
+    vec4 eye = gl_ModelViewMatrix * gl_Vertex;
+    v_eye = eye.xyz;
+    v_normal = gl_NormalMatrix * gl_Normal;
+    gl_ClipVertex = eye;  // Для glClipPlane (проход отражения)
+    gl_Position = gl_ProjectionMatrix * eye;
+}
+"""
+
+# Материал берётся из glMaterial (через gl_FrontMaterial), как у стен и объектов
+CLUSTERED_FRAGMENT_SHADER = """
+#version 130
+
+in vec3 v_eye;
+in vec3 v_normal;
+""" + CLUSTERED_LIGHTING_GLSL + """
+void main()
+{
+    vec3 normal = normalize(v_normal);
+    vec3 color = gl_FrontMaterial.emission.rgb + clustered_lighting(
+        v_eye, normal, gl_FrontMaterial.ambient.rgb, gl_FrontMaterial.diffuse.rgb,
+        gl_FrontMaterial.specular.rgb, gl_FrontMaterial.shininess);
+    gl_FragColor = vec4(clamp(color, 0.0, 1.0), gl_FrontMaterial.diffuse.a);
+}
+"""
+
+# Инстансинг: материал из атрибутов экземпляра (см. instancing.py)
+CLUSTERED_INSTANCED_VERTEX_SHADER = """
+#version 130
+
+in vec4 instance_position;  // xyz - позиция, w - блеск
+in vec4 instance_scale;     // xyz - масштаб, w - 1.0 для зеркала
+in vec4 instance_color;
+
+out vec3 v_eye;
+out vec3 v_normal;
+out vec4 v_diffuse;
+out vec3 v_ambient;
+out vec4 v_specular;  // rgb - цвет блика, a - блеск
+
+void main()
+{
+    vec4 world = vec4(gl_Vertex.xyz * instance_scale.xyz + instance_position.xyz, 1.0);
+    vec4 eye = gl_ModelViewMatrix * world;
+    v_eye = eye.xyz;
+    v_normal = gl_NormalMatrix * (gl_Normal / instance_scale.xyz);
+
+    float shininess = min(instance_position.w, 128.0);
+    if (instance_scale.w > 0.5) {
+        v_diffuse = vec4(vec3(0.1), instance_color.a);
+        v_ambient = vec3(0.1);
+        v_specular = vec4(vec3(0.9), shininess);
+    } else {
+        v_diffuse = instance_color;
+        v_ambient = instance_color.rgb * 0.3;
+        v_specular = vec4(vec3(0.3), shininess);
+    }
+    gl_ClipVertex = eye;  // Для glClipPlane (проход отражения)
+    gl_Position = gl_ProjectionMatrix * eye;
+}
+"""
+
+CLUSTERED_INSTANCED_FRAGMENT_SHADER = """
+#version 130
+
+in vec3 v_eye;
+in vec3 v_normal;
+in vec4 v_diffuse;
+in vec3 v_ambient;
+in vec4 v_specular;
+""" + CLUSTERED_LIGHTING_GLSL + """
+void main()
+{
+    vec3 normal = normalize(v_normal);
+    vec3 color = clustered_lighting(v_eye, normal, v_ambient, v_diffuse.rgb,
+                                    v_specular.rgb, v_specular.a);
+    gl_FragColor = vec4(clamp(color, 0.0, 1.0), v_diffuse.a);
+}
+"""
+
+
+def light_cluster_ranges(eye_positions, radii, projection, grid, near, slice_scale):
+    """Диапазоны кластеров каждого источника: (x0, x1, y0, y1, z0, z1), включительно
+
+    Источник с бесконечным радиусом покрывает всю сетку. Конечная сфера
+    заменяется описанным боксом в координатах вида, и на экран
+    проецируются 8 углов его части перед ближней плоскостью. Возвращает
+    массив (N, 6) и маску источников, задевающих хоть один кластер.
+    """
+    tiles_x, tiles_y, slices = grid
+    n = len(eye_positions)
+    ranges = np.zeros((n, 6), dtype=np.int64)
+    ranges[:, 1] = tiles_x - 1
+    ranges[:, 3] = tiles_y - 1
+    ranges[:, 5] = slices - 1
+    active = np.ones(n, dtype=bool)
+
+    finite = np.flatnonzero(np.isfinite(radii))
+    if len(finite) == 0:
+        return ranges, active
+
+    centers = eye_positions[finite]
+    r = radii[finite][:, None]
+    nearest = -(centers[:, 2] + r[:, 0])   # Расстояние до ближней точки сферы
+    farthest = -(centers[:, 2] - r[:, 0])
+
+    # Целиком за ближней плоскостью - не освещает ничего видимого
+    active[finite[farthest < near]] = False
+
+    # Проекция углов бокса; часть бокса за ближней плоскостью не видна,
+    # поэтому углы прижимаются к ней - проекция остаётся конечной
+    signs = np.array([[x, y, z] for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)],
+                     dtype=np.float64)
+    corners = centers[:, None, :] + signs[None, :, :] * r[:, :, None]  # (N, 8, 3)
+    corners[..., 2] = np.minimum(corners[..., 2], -near)
+    homogeneous = np.concatenate([corners, np.ones(corners.shape[:2] + (1,))], axis=2)
+    clip = homogeneous @ projection.T
+    ndc = clip[..., :2] / clip[..., 3:4]
+    low = ndc.min(axis=1)
+    high = ndc.max(axis=1)
+
+    # Вне экрана по x/y
+    active[finite[np.any(high < -1.0, axis=1) | np.any(low > 1.0, axis=1)]] = False
+
+    x0 = np.floor((low[:, 0] + 1.0) * 0.5 * tiles_x)
+    x1 = np.floor((high[:, 0] + 1.0) * 0.5 * tiles_x)
+    y0 = np.floor((low[:, 1] + 1.0) * 0.5 * tiles_y)
+    y1 = np.floor((high[:, 1] + 1.0) * 0.5 * tiles_y)
+    z0 = np.floor(np.log(np.maximum(nearest, near) / near) * slice_scale)
+    z1 = np.floor(np.log(np.maximum(farthest, near) / near) * slice_scale)
+
+    ranges[finite, 0] = np.clip(x0, 0, tiles_x - 1)
+    ranges[finite, 1] = np.clip(x1, 0, tiles_x - 1)
+    ranges[finite, 2] = np.clip(y0, 0, tiles_y - 1)
+    ranges[finite, 3] = np.clip(y1, 0, tiles_y - 1)
+    ranges[finite, 4] = np.clip(z0, 0, slices - 1)
+    ranges[finite, 5] = np.clip(z1, 0, slices - 1)
+    return ranges, active
+
+
+def build_cluster_lists(ranges, lights, grid):
+    """Списки источников кластеров (векторно): (offsets, counts, indices)
+
+    ranges - диапазоны кластеров источников lights (см. light_cluster_ranges).
+    Кластер c = (z * tiles_y + y) * tiles_x + x; его источники - это
+    indices[offsets[c]:offsets[c] + counts[c]].
+    """
+    tiles_x, tiles_y, slices = grid
+    total_clusters = tiles_x * tiles_y * slices
+    nx = ranges[:, 1] - ranges[:, 0] + 1
+    ny = ranges[:, 3] - ranges[:, 2] + 1
+    nz = ranges[:, 5] - ranges[:, 4] + 1
+    sizes = nx * ny * nz
+
+    # Пара (источник, кластер) на каждую ячейку бокса источника
+    owner = np.repeat(np.arange(len(ranges)), sizes)
+    local = np.arange(int(sizes.sum())) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    ix = ranges[owner, 0] + local % nx[owner]
+    iy = ranges[owner, 2] + (local // nx[owner]) % ny[owner]
+    iz = ranges[owner, 4] + local // (nx[owner] * ny[owner])
+    cluster = (iz * tiles_y + iy) * tiles_x + ix
+
+    order = np.argsort(cluster, kind='stable')
+    counts = np.bincount(cluster, minlength=total_clusters)
+    offsets = np.cumsum(counts) - counts
+    return offsets, counts, lights[owner[order]]
+
+
+class ClusteredLighting:
+    """Освещение по фрагментам с кластерным списком источников.
+
+    Экран делится на tiles плиток, глубина вида - на slices срезов в
+    логарифмическом масштабе. Для каждого кластера на CPU (NumPy)
+    строится список задевающих его источников; шейдер перебирает только
+    источники своего кластера, поэтому время кадра растёт с числом
+    источников рядом с пикселем, а не с их общим числом.
+    Списки и данные источников лежат в текстурах RGBA32F/RG32F/R32F и
+    перестраиваются, только когда меняются источники, вид или viewport.
+    """
+    def __init__(self, tiles=(16, 9), slices=24, near=0.1, depth_far=20.0):
+        self.grid = (tiles[0], tiles[1], slices)
+        self.near = near
+        self.slice_scale = slices / math.log(depth_far / near)
+
+        self.program = ShaderProgram(CLUSTERED_VERTEX_SHADER, CLUSTERED_FRAGMENT_SHADER)
+        self.instanced_program = ShaderProgram(CLUSTERED_INSTANCED_VERTEX_SHADER,
+                                               CLUSTERED_INSTANCED_FRAGMENT_SHADER,
+                                               INSTANCE_ATTRIBUTES)
+        self.light_texture = self.create_texture()
+        self.cluster_texture = self.create_texture()
+        self.index_texture = self.create_texture()
+
+        self.key = None
+        self.viewport = (1, 1)
+        self.view_to_world = np.identity(3, dtype=np.float32)
+        self.shadow_textures = [0] * MAX_SHADOW_LIGHTS
+        self.builds = 0
+        self.light_count = 0
+        self.pair_count = 0
+
+    @staticmethod
+    def create_texture():
+        texture = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, texture)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        glBindTexture(GL_TEXTURE_2D, 0)
+        return texture
+
+    @staticmethod
+    def upload(texture, internal_format, data_format, data):
+        """Загружает массив (высота, ширина, каналы) float32 в текстуру"""
+        data = np.ascontiguousarray(data, dtype=np.float32)
+        glBindTexture(GL_TEXTURE_2D, texture)
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 4)
+        glTexImage2D(GL_TEXTURE_2D, 0, internal_format, data.shape[1], data.shape[0], 0,
+                     data_format, GL_FLOAT, data)
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+    def update(self, lights, view, projection, key, shadows=None):
+        """Перестраивает кластеры, если источники, вид или viewport изменились.
+
+        view/projection - матрицы текущего прохода (NumPy 4x4), key - значение,
+        однозначно задающее вид (как у GLStateCache.set_view);
+        shadows - ShadowMaps с картами теней источников или None.
+        """
+        enabled = np.flatnonzero(lights.enabled)
+        if shadows is not None:
+            slots = shadows.slots(lights, enabled)
+            self.shadow_textures = shadows.textures()
+        else:
+            slots = np.full(len(enabled), -1, dtype=np.int64)
+            self.shadow_textures = [0] * MAX_SHADOW_LIGHTS
+
+        viewport = tuple(int(v) for v in glGetIntegerv(GL_VIEWPORT))
+        full_key = (key, lights.version, viewport, slots.tobytes())
+        if full_key == self.key:
+            return
+        self.key = full_key
+        self.viewport = viewport[2:]
+        self.view_to_world = np.linalg.inv(view[:3, :3]).astype(np.float32)
+
+        eye = lights.positions[enabled].astype(np.float64) @ view.T
+        radii = lights.radius[enabled].astype(np.float64)
+
+        ranges, active = light_cluster_ranges(eye[:, :3], radii, projection, self.grid,
+                                              self.near, self.slice_scale)
+        offsets, counts, indices = build_cluster_lists(ranges[active],
+                                                       np.flatnonzero(active), self.grid)
+
+        # Источники: по строке из LIGHT_TEXELS текселей
+        light_data = np.zeros((max(len(enabled), 1), LIGHT_TEXELS, 4), dtype=np.float32)
+        light_data[:len(enabled), 0, :3] = eye[:, :3]
+        light_data[:len(enabled), 0, 3] = np.where(np.isfinite(radii), radii, -1.0)
+        light_data[:len(enabled), 1] = lights.diffuse[enabled]
+        light_data[:len(enabled), 2] = lights.specular[enabled]
+        light_data[:len(enabled), 3] = lights.ambient[enabled]
+        light_data[:len(enabled), 4, 0] = slots
+        self.upload(self.light_texture, GL_RGBA32F, GL_RGBA, light_data)
+
+        tiles_x, tiles_y, slices = self.grid
+        cluster_data = np.stack([offsets, counts], axis=1).reshape(slices, tiles_x * tiles_y, 2)
+        self.upload(self.cluster_texture, GL_RG32F, GL_RG, cluster_data)
+
+        rows = max(1, -(-len(indices) // INDEX_WIDTH))
+        index_data = np.zeros(rows * INDEX_WIDTH, dtype=np.float32)
+        index_data[:len(indices)] = indices
+        self.upload(self.index_texture, GL_R32F, GL_RED, index_data.reshape(rows, INDEX_WIDTH, 1))
+
+        self.builds += 1
+        self.light_count = len(enabled)
+        self.pair_count = len(indices)
+
+    def use(self, instanced=False):
+        """Включает программу освещения и привязывает текстуры кластеров"""
+        program = self.instanced_program if instanced else self.program
+        program.use()
+        self.bind(program)
+        return program
+
+    def bind(self, program):
+        """Привязывает текстуры и uniform-переменные кластеров к включённой программе
+        (любой программе, в которую вставлен CLUSTERED_LIGHTING_GLSL)"""
+        for unit, texture, name in ((LIGHT_UNIT, self.light_texture, 'light_data'),
+                                    (CLUSTER_UNIT, self.cluster_texture, 'cluster_data'),
+                                    (INDEX_UNIT, self.index_texture, 'light_indices')):
+            glActiveTexture(GL_TEXTURE0 + unit)
+            glBindTexture(GL_TEXTURE_2D, texture)
+            glUniform1i(program.location(name), unit)
+        for i, texture in enumerate(self.shadow_textures):
+            glActiveTexture(GL_TEXTURE0 + SHADOW_FIRST_UNIT + i)
+            glBindTexture(GL_TEXTURE_CUBE_MAP, texture)
+            glUniform1i(program.location(f'shadow_map{i}'), SHADOW_FIRST_UNIT + i)
+        glActiveTexture(GL_TEXTURE0)
+
+        # GL_TRUE: матрица NumPy построчная
+        glUniformMatrix3fv(program.location('view_to_world'), 1, GL_TRUE, self.view_to_world)
+        glUniform2f(program.location('viewport'), *self.viewport)
+        glUniform3f(program.location('grid'), *self.grid)
+        glUniform2f(program.location('depth_slicing'), self.near, self.slice_scale)
+
+    @staticmethod
+    def stop():
+        ShaderProgram.stop()
+
+    def delete(self):
+        self.program.delete()
+        self.instanced_program.delete()
+        glDeleteTextures([self.light_texture, self.cluster_texture, self.index_texture])
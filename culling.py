@@ -0,0 +1,252 @@
+import numpy as np
+
+from transforms import perspective_matrix, camera_view_matrix
+
+
+def object_bounds(store):
+    """Ограничивающие боксы объектов SceneStore: (минимумы, максимумы), по (N, 3)
+
+    Куб и сфера строятся в единичном кубе [-1, 1], поэтому полуразмер
+    бокса - это просто модуль масштаба.
+    """
+    positions = store.positions
+    extents = np.abs(store.scales)
+    return positions - extents, positions + extents
+
+
+class Frustum:
+    """Пирамида видимости: шесть плоскостей ax + by + cz + d >= 0 внутри"""
+    def __init__(self, planes):
+        self.planes = np.asarray(planes, dtype=np.float64)
+        self.normals = self.planes[:, :3]
+        self.offsets = self.planes[:, 3]
+        self.abs_normals = np.abs(self.normals)
+
+    @classmethod
+    def from_matrix(cls, clip):
+        """Плоскости из матрицы проекция * вид (метод Гриба-Хартманна)"""
+        clip = np.asarray(clip, dtype=np.float64)
+        planes = np.array([
+            clip[3] + clip[0],  # Левая
+            clip[3] - clip[0],  # Правая
+            clip[3] + clip[1],  # Нижняя
+            clip[3] - clip[1],  # Верхняя
+            clip[3] + clip[2],  # Ближняя
+            clip[3] - clip[2]   # Дальняя
+        ])
+        planes /= np.linalg.norm(planes[:, :3], axis=1)[:, None]
+        return cls(planes)
+
+    @classmethod
+    def from_camera(cls, camera, fov_y, aspect, near, far):
+        """Пирамида камеры с той же проекцией, что у gluPerspective"""
+        clip = perspective_matrix(fov_y, aspect, near, far) @ camera_view_matrix(camera)
+        return cls.from_matrix(clip)
+
+    def classify(self, mins, maxs):
+        """Боксы относительно пирамиды: (снаружи, целиком внутри) - маски длины N"""
+        centers = (mins + maxs) * 0.5
+        extents = (maxs - mins) * 0.5
+        distances = centers @ self.normals.T + self.offsets  # (N, 6)
+        radii = extents @ self.abs_normals.T
+        outside = np.any(distances + radii < 0.0, axis=1)
+        inside = np.all(distances - radii >= 0.0, axis=1)
+        return outside, inside
+
+
+class BVH:
+    """Иерархия ограничивающих боксов над объектами SceneStore.
+
+    Узлы хранятся плоскими массивами: боксы, левый/правый потомок (-1 у
+    листа), глубина и диапазон [start, start + count) в массиве order -
+    объекты любого поддерева лежат в order подряд. Строится делением
+    пополам по медиане вдоль самой длинной оси центров. Когда объекты
+    сдвигаются, перестраиваются только боксы затронутых листьев и их
+    предков (refit), топология остаётся прежней.
+    """
+    def __init__(self, mins, maxs, leaf_size=8):
+        self.leaf_size = leaf_size
+        self.build(mins, maxs)
+
+    def build(self, mins, maxs):
+        """Полное построение дерева"""
+        n = len(mins)
+        self.object_mins = np.array(mins, dtype=np.float32).reshape(n, 3)
+        self.object_maxs = np.array(maxs, dtype=np.float32).reshape(n, 3)
+        self.order = np.arange(n)
+
+        node_mins, node_maxs = [], []
+        lefts, rights, parents, depths, starts, counts = [], [], [], [], [], []
+        centers = (self.object_mins + self.object_maxs) * 0.5
+
+        # Стек (начало, конец, родитель, глубина, левый ли потомок)
+        stack = [(0, n, -1, 0, True)]
+        while stack:
+            start, end, parent, depth, is_left = stack.pop()
+            node = len(starts)
+            items = self.order[start:end]
+            if len(items):
+                node_mins.append(self.object_mins[items].min(axis=0))
+                node_maxs.append(self.object_maxs[items].max(axis=0))
+            else:
+                node_mins.append(np.zeros(3, dtype=np.float32))
+                node_maxs.append(np.zeros(3, dtype=np.float32))
+            lefts.append(-1)
+            rights.append(-1)
+            parents.append(parent)
+            depths.append(depth)
+            starts.append(start)
+            counts.append(end - start)
+            if parent >= 0:
+                if is_left:
+                    lefts[parent] = node
+                else:
+                    rights[parent] = node
+
+            if end - start <= self.leaf_size:
+                continue
+
+            # Медиана вдоль самой длинной оси разброса центров
+            item_centers = centers[items]
+            axis = int(np.argmax(item_centers.max(axis=0) - item_centers.min(axis=0)))
+            half = (end - start) // 2
+            split = np.argpartition(item_centers[:, axis], half)
+            self.order[start:end] = items[split]
+            middle = start + half
+
+            # Правый кладём первым, чтобы левый получил меньший номер
+            stack.append((middle, end, node, depth + 1, False))
+            stack.append((start, middle, node, depth + 1, True))
+
+        self.node_mins = np.array(node_mins, dtype=np.float32).reshape(-1, 3)
+        self.node_maxs = np.array(node_maxs, dtype=np.float32).reshape(-1, 3)
+        self.lefts = np.array(lefts, dtype=np.int64)
+        self.rights = np.array(rights, dtype=np.int64)
+        self.parents = np.array(parents, dtype=np.int64)
+        self.depths = np.array(depths, dtype=np.int64)
+        self.starts = np.array(starts, dtype=np.int64)
+        self.counts = np.array(counts, dtype=np.int64)
+
+        # Лист каждого объекта (для refit)
+        self.leaf_of = np.empty(n, dtype=np.int64)
+        for leaf in np.flatnonzero(self.lefts < 0):
+            start = self.starts[leaf]
+            self.leaf_of[self.order[start:start + self.counts[leaf]]] = leaf
+        self.refits = 0
+
+    def __len__(self):
+        return len(self.object_mins)
+
+    def refit(self, indices, mins, maxs):
+        """Обновляет боксы объектов indices и всех узлов над ними"""
+        indices = np.asarray(indices)
+        if len(indices) == 0:
+            return
+        self.object_mins[indices] = mins
+        self.object_maxs[indices] = maxs
+
+        # Листья - заново по своим объектам
+        for leaf in np.unique(self.leaf_of[indices]):
+            items = self.order[self.starts[leaf]:self.starts[leaf] + self.counts[leaf]]
+            self.node_mins[leaf] = self.object_mins[items].min(axis=0)
+            self.node_maxs[leaf] = self.object_maxs[items].max(axis=0)
+
+        # Предки - по уровням снизу вверх, каждый уровень одной операцией
+        nodes = np.unique(self.parents[self.leaf_of[indices]])
+        nodes = nodes[nodes >= 0]
+        ancestors = set()
+        while len(nodes):
+            ancestors.update(nodes.tolist())
+            nodes = np.unique(self.parents[nodes])
+            nodes = nodes[nodes >= 0]
+        ancestors = np.array(sorted(ancestors), dtype=np.int64)
+        for depth in np.unique(self.depths[ancestors])[::-1]:
+            level = ancestors[self.depths[ancestors] == depth]
+            left, right = self.lefts[level], self.rights[level]
+            self.node_mins[level] = np.minimum(self.node_mins[left], self.node_mins[right])
+            self.node_maxs[level] = np.maximum(self.node_maxs[left], self.node_maxs[right])
+        self.refits += 1
+
+    def query(self, frustum):
+        """Номера объектов, чьи боксы пересекают пирамиду (по возрастанию)
+
+        Обход идёт по уровням: весь фронт узлов проверяется одной
+        векторной операцией. Узел целиком внутри отдаёт своё поддерево без
+        дальнейших проверок, у пересекающихся листьев проверяются объекты.
+        """
+        if len(self) == 0:
+            return np.empty(0, dtype=np.int64)
+
+        ranges = []
+        partial_leaves = []
+        frontier = np.array([0], dtype=np.int64)
+        while len(frontier):
+            outside, inside = frustum.classify(self.node_mins[frontier],
+                                               self.node_maxs[frontier])
+            accepted = frontier[inside]
+            ranges.extend(zip(self.starts[accepted].tolist(), self.counts[accepted].tolist()))
+
+            crossing = frontier[~outside & ~inside]
+            is_leaf = self.lefts[crossing] < 0
+            partial_leaves.append(crossing[is_leaf])
+            inner = crossing[~is_leaf]
+            frontier = np.concatenate([self.lefts[inner], self.rights[inner]])
+
+        parts = [self.order[start:start + count] for start, count in ranges]
+
+        leaves = np.concatenate(partial_leaves)
+        if len(leaves):
+            candidates = np.concatenate([
+                self.order[start:start + count]
+                for start, count in zip(self.starts[leaves].tolist(), self.counts[leaves].tolist())
+            ])
+            outside, _ = frustum.classify(self.object_mins[candidates],
+                                          self.object_maxs[candidates])
+            parts.append(candidates[~outside])
+
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate(parts))
+
+
+class FrustumCuller:
+    """Отсечение объектов SceneStore по пирамиде видимости камеры.
+
+    Держит BVH в актуальном состоянии: при смене числа объектов строит
+    его заново, при изменении только позиций/масштабов - делает refit
+    для сдвинувшихся объектов. Счётчики drawn/culled относятся к
+    последнему запросу.
+    """
+    def __init__(self, leaf_size=8):
+        self.leaf_size = leaf_size
+        self.bvh = None
+        self.version = None
+        self.builds = 0
+        self.drawn = 0
+        self.culled = 0
+
+    def sync(self, store):
+        """Приводит BVH в соответствие с объектами (ничего не делает без изменений)"""
+        if store.version == self.version:
+            return
+        self.version = store.version
+
+        mins, maxs = object_bounds(store)
+        if self.bvh is None or len(self.bvh) != len(store):
+            self.bvh = BVH(mins, maxs, self.leaf_size)
+            self.builds += 1
+            return
+
+        # Версия меняется и от флагов/цветов - refit только если боксы сдвинулись
+        moved = np.flatnonzero(np.any(mins != self.bvh.object_mins, axis=1) |
+                               np.any(maxs != self.bvh.object_maxs, axis=1))
+        if len(moved):
+            self.bvh.refit(moved, mins[moved], maxs[moved])
+
+    def visible(self, store, frustum):
+        """Номера видимых объектов (по возрастанию) и обновление счётчиков"""
+        self.sync(store)
+        indices = self.bvh.query(frustum)
+        self.drawn = len(indices)
+        self.culled = len(store) - self.drawn
+        return indices
@@ -0,0 +1,211 @@
+from OpenGL.GL import *
+
+from clustered import (CLUSTERED_LIGHTING_GLSL, CLUSTERED_VERTEX_SHADER,
+                       CLUSTERED_INSTANCED_VERTEX_SHADER)
+from instancing import INSTANCE_ATTRIBUTES
+from shaders import ShaderProgram
+
+
+# Слои G-буфера: (имя sampler в шейдере освещения, внутренний формат)
+GBUFFER_LAYERS = [
+    ('g_position', GL_RGBA32F),  # xyz - позиция в координатах вида, w = 1 там, где есть геометрия
+    ('g_normal', GL_RGBA16F),    # xyz - нормаль в координатах вида
+    ('g_diffuse', GL_RGBA8),     # rgb - diffuse материала, a - альфа
+    ('g_ambient', GL_RGBA8),     # rgb - ambient материала
+    ('g_specular', GL_RGBA16F)   # rgb - specular материала, a - блеск
+]
+
+# Текстурные блоки слоёв G-буфера и глубины (1..3 заняты кластерами)
+GBUFFER_FIRST_UNIT = 4
+DEPTH_UNIT = GBUFFER_FIRST_UNIT + len(GBUFFER_LAYERS)
+
+# Проход геометрии: материал из glMaterial (через gl_FrontMaterial)
+GEOMETRY_FRAGMENT_SHADER = """
+#version 130
+
+in vec3 v_eye;
+in vec3 v_normal;
+
+void main()
+{
+    gl_FragData[0] = vec4(v_eye, 1.0);
+    gl_FragData[1] = vec4(normalize(v_normal), 0.0);
+    gl_FragData[2] = gl_FrontMaterial.diffuse;
+    gl_FragData[3] = vec4(gl_FrontMaterial.ambient.rgb, 1.0);
+    gl_FragData[4] = vec4(gl_FrontMaterial.specular.rgb, gl_FrontMaterial.shininess);
+}
+"""
+
+# Проход геометрии для инстансинга: материал из атрибутов экземпляра
+GEOMETRY_INSTANCED_FRAGMENT_SHADER = """
+#version 130
+
+in vec3 v_eye;
+in vec3 v_normal;
+in vec4 v_diffuse;
+in vec3 v_ambient;
+in vec4 v_specular;
+
+void main()
+{
+    gl_FragData[0] = vec4(v_eye, 1.0);
+    gl_FragData[1] = vec4(normalize(v_normal), 0.0);
+    gl_FragData[2] = v_diffuse;
+    gl_FragData[3] = vec4(v_ambient, 1.0);
+    gl_FragData[4] = v_specular;
+}
+"""
+
+# Проход освещения: треугольник на весь экран, вершины сразу в координатах отсечения
+LIGHTING_VERTEX_SHADER = """
+#version 130
+
+void main()
+{
+    gl_Position = gl_Vertex;
+}
+"""
+
+LIGHTING_FRAGMENT_SHADER = """
+#version 130
+
+uniform sampler2D g_position;
+uniform sampler2D g_normal;
+uniform sampler2D g_diffuse;
+uniform sampler2D g_ambient;
+uniform sampler2D g_specular;
+uniform sampler2D g_depth;
+""" + CLUSTERED_LIGHTING_GLSL + """
+void main()
+{
+    ivec2 pixel = ivec2(gl_FragCoord.xy);
+    vec4 position = texelFetch(g_position, pixel, 0);
+    if (position.w == 0.0)
+        discard;  // Фон: пиксель остаётся цветом очистки
+
+    vec3 normal = texelFetch(g_normal, pixel, 0).xyz;
+    vec4 diffuse = texelFetch(g_diffuse, pixel, 0);
+    vec3 ambient = texelFetch(g_ambient, pixel, 0).rgb;
+    vec4 specular = texelFetch(g_specular, pixel, 0);
+
+    vec3 color = clustered_lighting(position.xyz, normal, ambient, diffuse.rgb,
+                                    specular.rgb, specular.a);
+    gl_FragColor = vec4(clamp(color, 0.0, 1.0), diffuse.a);
+    // Глубина G-буфера - для прозрачных объектов и точек источников после освещения
+    gl_FragDepth = texelFetch(g_depth, pixel, 0).r;
+}
+"""
+
+
+class GBuffer:
+    """Отложенное освещение: G-буфер и проход освещения на весь экран.
+
+    Проход геометрии пишет в G-буфер позицию и нормаль в координатах
+    вида и материал (diffuse, ambient, specular и блеск) - без расчёта
+    света. Проход освещения один раз на пиксель перебирает источники его
+    кластера (списки ClusteredLighting), поэтому стоимость освещения
+    зависит от площади экрана, а не от числа объектов. Прозрачные и
+    текстурированные отражениями объекты рисуются после него обычным
+    прямым проходом по глубине из G-буфера.
+    """
+    def __init__(self, width, height):
+        self.width = 0
+        self.height = 0
+        self.textures = list(glGenTextures(len(GBUFFER_LAYERS)))
+        self.depth = glGenTextures(1)
+        self.fbo = glGenFramebuffers(1)
+        self.saved_fbo = 0
+
+        self.program = ShaderProgram(CLUSTERED_VERTEX_SHADER, GEOMETRY_FRAGMENT_SHADER)
+        self.instanced_program = ShaderProgram(CLUSTERED_INSTANCED_VERTEX_SHADER,
+                                               GEOMETRY_INSTANCED_FRAGMENT_SHADER,
+                                               INSTANCE_ATTRIBUTES)
+        self.lighting_program = ShaderProgram(LIGHTING_VERTEX_SHADER, LIGHTING_FRAGMENT_SHADER)
+        self.resize(width, height)
+
+    def resize(self, width, height):
+        """Пересоздаёт слои G-буфера под размер width x height"""
+        self.width = width
+        self.height = height
+
+        for texture, (_, internal_format) in zip(self.textures, GBUFFER_LAYERS):
+            glBindTexture(GL_TEXTURE_2D, texture)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+            glTexImage2D(GL_TEXTURE_2D, 0, internal_format, width, height, 0,
+                         GL_RGBA, GL_FLOAT, None)
+        glBindTexture(GL_TEXTURE_2D, self.depth)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_DEPTH_COMPONENT24, width, height, 0,
+                     GL_DEPTH_COMPONENT, GL_FLOAT, None)
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+        previous = glGetIntegerv(GL_DRAW_FRAMEBUFFER_BINDING)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        for i, texture in enumerate(self.textures):
+            glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0 + i, GL_TEXTURE_2D,
+                                   texture, 0)
+        glFramebufferTexture2D(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, GL_TEXTURE_2D,
+                               self.depth, 0)
+        status = glCheckFramebufferStatus(GL_FRAMEBUFFER)
+        glBindFramebuffer(GL_FRAMEBUFFER, previous)
+        if status != GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError(f"G-буфер неполный: 0x{int(status):x}")
+
+    def begin(self):
+        """Начинает проход геометрии: framebuffer G-буфера и его программа"""
+        self.saved_fbo = glGetIntegerv(GL_DRAW_FRAMEBUFFER_BINDING)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        glDrawBuffers(len(GBUFFER_LAYERS),
+                      [GL_COLOR_ATTACHMENT0 + i for i in range(len(GBUFFER_LAYERS))])
+        glClearColor(0.0, 0.0, 0.0, 0.0)
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        glClearColor(0.0, 0.0, 0.0, 1.0)
+        self.use()
+
+    def use(self, instanced=False):
+        """Включает программу прохода геометрии"""
+        program = self.instanced_program if instanced else self.program
+        program.use()
+        return program
+
+    def end(self):
+        """Заканчивает проход геометрии и возвращает прежний framebuffer"""
+        ShaderProgram.stop()
+        glBindFramebuffer(GL_FRAMEBUFFER, self.saved_fbo)
+
+    def shade(self, clustered):
+        """Проход освещения в текущий framebuffer по кластерам clustered.
+
+        Пишет цвет и глубину G-буфера во все пиксели с геометрией;
+        вызывается после end() при включённом GL_DEPTH_TEST.
+        """
+        program = self.lighting_program
+        program.use()
+        clustered.bind(program)
+        for i, ((name, _), texture) in enumerate(zip(GBUFFER_LAYERS, self.textures)):
+            glActiveTexture(GL_TEXTURE0 + GBUFFER_FIRST_UNIT + i)
+            glBindTexture(GL_TEXTURE_2D, texture)
+            glUniform1i(program.location(name), GBUFFER_FIRST_UNIT + i)
+        glActiveTexture(GL_TEXTURE0 + DEPTH_UNIT)
+        glBindTexture(GL_TEXTURE_2D, self.depth)
+        glUniform1i(program.location('g_depth'), DEPTH_UNIT)
+        glActiveTexture(GL_TEXTURE0)
+
+        # Глубина переносится как есть, проверка глубины не нужна
+        glDepthFunc(GL_ALWAYS)
+        glBegin(GL_TRIANGLES)
+        glVertex2f(-1.0, -1.0)
+        glVertex2f(3.0, -1.0)
+        glVertex2f(-1.0, 3.0)
+        glEnd()
+        glDepthFunc(GL_LESS)
+        ShaderProgram.stop()
+
+    def delete(self):
+        self.program.delete()
+        self.instanced_program.delete()
+        self.lighting_program.delete()
+        glDeleteFramebuffers(1, [self.fbo])
+        glDeleteTextures(self.textures + [self.depth])
@@ -0,0 +1,233 @@
+import ctypes
+import math
+
+import numpy as np
+from OpenGL.GL import *
+
+
+class Mesh:
+    """Меш в видеопамяти: вершины и нормали в VBO, индексы в IBO, состояние в VAO.
+
+    Данные загружаются один раз при создании, а рисуется меш одним вызовом
+    glDrawElements вместо сотен glVertex3f/glNormal3f за кадр.
+    """
+    def __init__(self, vertices, normals, indices, mode=GL_TRIANGLES):
+        # Чередуем данные: x, y, z, nx, ny, nz
+        data = np.hstack([
+            np.asarray(vertices, dtype=np.float32).reshape(-1, 3),
+            np.asarray(normals, dtype=np.float32).reshape(-1, 3)
+        ])
+        data = np.ascontiguousarray(data, dtype=np.float32)
+        indices = np.ascontiguousarray(indices, dtype=np.uint32).ravel()
+
+        self.mode = mode
+        self.index_count = len(indices)
+        self.vertex_count = len(data)
+        self.stride = data.strides[0]
+
+        self.vao = glGenVertexArrays(1)
+        glBindVertexArray(self.vao)
+
+        self.vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, data.nbytes, data, GL_STATIC_DRAW)
+
+        self.ibo = glGenBuffers(1)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, GL_STATIC_DRAW)
+
+        self.bind_arrays()
+
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+
+    def bind_arrays(self):
+        """Привязывает буферы меша к текущему VAO.
+
+        Указатели фиксированного конвейера запоминаются во VAO, поэтому
+        этим же методом буферы меша подключаются к чужим VAO (например,
+        к VAO с данными экземпляров).
+        """
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(3, GL_FLOAT, self.stride, ctypes.c_void_p(0))
+        glEnableClientState(GL_NORMAL_ARRAY)
+        glNormalPointer(GL_FLOAT, self.stride, ctypes.c_void_p(3 * 4))
+
+    def draw(self):
+        """Рисует меш одним вызовом"""
+        glBindVertexArray(self.vao)
+        glDrawElements(self.mode, self.index_count, GL_UNSIGNED_INT, None)
+        glBindVertexArray(0)
+
+    def delete(self):
+        """Освобождает буферы в видеопамяти"""
+        glDeleteBuffers(2, [self.vbo, self.ibo])
+        glDeleteVertexArrays(1, [self.vao])
+
+
+# Грани куба [-1, 1]^3: нормаль и четыре вершины (тот же порядок, что в draw_cube)
+CUBE_FACES = [
+    ((0, 0, 1), [(-1, -1, 1), (1, -1, 1), (1, 1, 1), (-1, 1, 1)]),        # Передняя
+    ((0, 0, -1), [(-1, -1, -1), (-1, 1, -1), (1, 1, -1), (1, -1, -1)]),   # Задняя
+    ((0, 1, 0), [(-1, 1, -1), (-1, 1, 1), (1, 1, 1), (1, 1, -1)]),        # Верхняя
+    ((0, -1, 0), [(-1, -1, -1), (1, -1, -1), (1, -1, 1), (-1, -1, 1)]),   # Нижняя
+    ((1, 0, 0), [(1, -1, -1), (1, 1, -1), (1, 1, 1), (1, -1, 1)]),        # Правая
+    ((-1, 0, 0), [(-1, -1, -1), (-1, -1, 1), (-1, 1, 1), (-1, 1, -1)])    # Левая
+]
+
+
+def quads_to_triangles(quad_count):
+    """Индексы двух треугольников для каждого четырёхугольника
+
+    Диагональ 1-3 совпадает с тем, как драйвер режет GL_QUADS, поэтому
+    интерполяция освещения по стенам не меняется.
+    """
+    base = np.arange(quad_count, dtype=np.uint32)[:, None] * 4
+    return (base + np.array([0, 1, 3, 1, 2, 3], dtype=np.uint32)).ravel()
+
+
+def create_cube_mesh():
+    """Единичный куб [-1, 1]^3 с нормалями граней"""
+    vertices = []
+    normals = []
+    for normal, quad in CUBE_FACES:
+        for vertex in quad:
+            vertices.append(vertex)
+            normals.append(normal)
+    return Mesh(vertices, normals, quads_to_triangles(len(CUBE_FACES)))
+
+
+def unit_sphere_arrays(slices=16, stacks=16):
+    """Вершины и индексы единичной сферы (векторизовано через NumPy)
+
+    Сетка та же, что у draw_sphere в immediate-режиме: (stacks + 1) колец
+    по (slices + 1) вершин, каждая пара колец - бывшая GL_QUAD_STRIP.
+    """
+    lat = np.pi * (-0.5 + np.arange(stacks + 1) / stacks)
+    lng = 2 * np.pi * np.arange(slices + 1) / slices
+
+    zr = np.cos(lat)[:, None]
+    vertices = np.empty((stacks + 1, slices + 1, 3), dtype=np.float32)
+    vertices[..., 0] = np.cos(lng)[None, :] * zr
+    vertices[..., 1] = np.sin(lng)[None, :] * zr
+    vertices[..., 2] = np.sin(lat)[:, None]
+
+    # Индексы квадов (та же диагональ, что у драйвера)
+    row = slices + 1
+    a = (np.arange(stacks)[:, None] * row + np.arange(slices)[None, :]).ravel()
+    b = a + row
+    indices = np.stack([a, b, b + 1, a, b + 1, a + 1], axis=1).astype(np.uint32)
+
+    return vertices.reshape(-1, 3), indices.ravel()
+
+
+def create_sphere_mesh(slices=16, stacks=16):
+    """Единичная сфера в видеопамяти"""
+    vertices, indices = unit_sphere_arrays(slices, stacks)
+    # У единичной сферы нормаль совпадает с позицией
+    return Mesh(vertices, vertices, indices)
+
+
+class SphereMeshCache:
+    """Кэш мешей единичной сферы по ключу (slices, stacks) с выбором LOD.
+
+    Меш каждого уровня строится один раз; уровень детализации выбирается
+    по радиусу сферы на экране в пикселях.
+    """
+    # Уровни детализации от грубого к подробному: (slices, stacks)
+    LEVELS = [(6, 6), (8, 8), (12, 12), (16, 16)]
+
+    def __init__(self, levels=None, pixels_per_segment=6.0):
+        self.levels = list(levels or self.LEVELS)
+        self.pixels_per_segment = pixels_per_segment  # Желаемая длина ребра на экране
+        self.meshes = {}
+
+    def get(self, slices, stacks):
+        """Возвращает меш (создаётся при первом запросе)"""
+        key = (slices, stacks)
+        mesh = self.meshes.get(key)
+        if mesh is None:
+            mesh = create_sphere_mesh(slices, stacks)
+            self.meshes[key] = mesh
+        return mesh
+
+    def select_level(self, radius_pixels):
+        """Подбирает (slices, stacks) по радиусу сферы на экране"""
+        # Длина экватора на экране, поделённая на желаемую длину ребра
+        wanted = 2 * math.pi * radius_pixels / self.pixels_per_segment
+        for level in self.levels:
+            if level[0] >= wanted:
+                return level
+        return self.levels[-1]
+
+    def delete(self):
+        """Освобождает все меши"""
+        for mesh in self.meshes.values():
+            mesh.delete()
+        self.meshes.clear()
+
+
+def projected_radius(position, radius, eye, fov_y, viewport_height):
+    """Радиус сферы на экране в пикселях при перспективной проекции"""
+    distance = math.sqrt(
+        (position[0] - eye[0]) ** 2 +
+        (position[1] - eye[1]) ** 2 +
+        (position[2] - eye[2]) ** 2
+    )
+    if distance <= radius:
+        return float(viewport_height)  # Камера внутри сферы - максимум деталей
+    half_height = math.tan(math.radians(fov_y) / 2.0)
+    return radius / (distance * half_height) * viewport_height / 2.0
+
+
+def create_quad_mesh(vertices, normal):
+    """Плоский четырёхугольник (стена комнаты)"""
+    return Mesh(vertices, [normal] * 4, quads_to_triangles(1))
+
+
+def draw_cube_immediate():
+    """Куб в immediate-режиме (исходный путь, оставлен для сравнения)"""
+    glBegin(GL_QUADS)
+    for normal, quad in CUBE_FACES:
+        glNormal3f(*normal)
+        for vertex in quad:
+            glVertex3f(*vertex)
+    glEnd()
+
+
+def draw_sphere_immediate(slices=16, stacks=16):
+    """Сфера в immediate-режиме (исходный путь, оставлен для сравнения)"""
+    for i in range(stacks):
+        lat0 = math.pi * (-0.5 + float(i) / stacks)
+        z0 = math.sin(lat0)
+        zr0 = math.cos(lat0)
+
+        lat1 = math.pi * (-0.5 + float(i + 1) / stacks)
+        z1 = math.sin(lat1)
+        zr1 = math.cos(lat1)
+
+        glBegin(GL_QUAD_STRIP)
+        for j in range(slices + 1):
+            lng = 2 * math.pi * float(j) / slices
+            x = math.cos(lng)
+            y = math.sin(lng)
+
+            glNormal3f(x * zr0, y * zr0, z0)
+            glVertex3f(x * zr0, y * zr0, z0)
+
+            glNormal3f(x * zr1, y * zr1, z1)
+            glVertex3f(x * zr1, y * zr1, z1)
+        glEnd()
+
+
+def draw_quad_immediate(vertices, normal=None):
+    """Четырёхугольник в immediate-режиме (исходный путь стен)"""
+    if normal:
+        glNormal3fv(normal)
+    glBegin(GL_QUADS)
+    for vertex in vertices:
+        glVertex3fv(vertex)
+    glEnd()
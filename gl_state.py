@@ -0,0 +1,155 @@
+import numbers
+
+from OpenGL.GL import *
+
+
+# Параметры источника, которые OpenGL переводит в систему координат камеры
+# в момент вызова: их кэш действителен только при той же матрице вида
+VIEW_DEPENDENT_LIGHT_PARAMS = (GL_POSITION, GL_SPOT_DIRECTION)
+
+
+class GLStateCache:
+    """Обёртка над состоянием OpenGL, которая пропускает повторные вызовы.
+
+    Помнит текущие значения материалов, источников света, флагов
+    glEnable/glDisable, glDepthMask и glBlendFunc и вызывает OpenGL только
+    когда значение действительно меняется. Считает выполненные и
+    пропущенные вызовы.
+
+    Весь код, меняющий эти состояния, должен идти через кэш; если что-то
+    поменяло их в обход, нужно вызвать invalidate().
+    """
+    def __init__(self):
+        self.caps = {}          # cap -> bool
+        self.materials = {}     # (face, pname) -> значение
+        self.lights = {}        # (light, pname) -> значение
+        self.light_models = {}  # pname -> значение
+        self.depth_mask_value = None
+        self.blend_func_value = None
+        self.view_token = None
+
+        # Счётчики за всё время и за текущий кадр
+        self.issued = 0
+        self.elided = 0
+        self.frame_issued = 0
+        self.frame_elided = 0
+        # Итоги последнего завершённого кадра (для HUD)
+        self.last_frame_issued = 0
+        self.last_frame_elided = 0
+
+    def begin_frame(self):
+        """Закрывает счётчики прошлого кадра и начинает новый"""
+        self.last_frame_issued = self.frame_issued
+        self.last_frame_elided = self.frame_elided
+        self.frame_issued = 0
+        self.frame_elided = 0
+
+    def invalidate(self):
+        """Забывает всё состояние (следующие вызовы точно дойдут до OpenGL)"""
+        self.caps.clear()
+        self.materials.clear()
+        self.lights.clear()
+        self.light_models.clear()
+        self.depth_mask_value = None
+        self.blend_func_value = None
+        self.view_token = None
+
+    def set_view(self, token):
+        """Сообщает, какая матрица вида сейчас загружена.
+
+        Позиции источников зависят от матрицы вида, поэтому при её смене
+        закэшированные позиции сбрасываются. token - любое сравнимое значение,
+        однозначно задающее матрицу (например, позиция и углы камеры).
+        """
+        if token != self.view_token:
+            self.view_token = token
+            for key in [k for k in self.lights if k[1] in VIEW_DEPENDENT_LIGHT_PARAMS]:
+                del self.lights[key]
+
+    def count(self, issued):
+        """Учитывает вызов в счётчиках"""
+        if issued:
+            self.issued += 1
+            self.frame_issued += 1
+        else:
+            self.elided += 1
+            self.frame_elided += 1
+        return issued
+
+    def enable(self, cap):
+        if self.count(self.caps.get(cap) is not True):
+            glEnable(cap)
+            self.caps[cap] = True
+
+    def disable(self, cap):
+        if self.count(self.caps.get(cap) is not False):
+            glDisable(cap)
+            self.caps[cap] = False
+
+    def set_enabled(self, cap, enabled):
+        """glEnable или glDisable в зависимости от флага"""
+        if enabled:
+            self.enable(cap)
+        else:
+            self.disable(cap)
+
+    def depth_mask(self, flag):
+        flag = bool(flag)
+        if self.count(self.depth_mask_value != flag):
+            glDepthMask(GL_TRUE if flag else GL_FALSE)
+            self.depth_mask_value = flag
+
+    def blend_func(self, src, dst):
+        if self.count(self.blend_func_value != (src, dst)):
+            glBlendFunc(src, dst)
+            self.blend_func_value = (src, dst)
+
+    def material(self, face, pname, value):
+        """glMaterialfv для векторов и glMaterialf для чисел (например, GL_SHININESS)"""
+        value = freeze(value)
+        key = (face, pname)
+        if self.count(self.materials.get(key) != value):
+            if isinstance(value, tuple):
+                glMaterialfv(face, pname, value)
+            else:
+                glMaterialf(face, pname, value)
+            self.materials[key] = value
+
+    def light(self, light, pname, value):
+        """glLightfv/glLightf для источника light (GL_LIGHT0 + i)"""
+        value = freeze(value)
+        key = (light, pname)
+        if self.count(self.lights.get(key) != value):
+            if isinstance(value, tuple):
+                glLightfv(light, pname, value)
+            else:
+                glLightf(light, pname, value)
+            self.lights[key] = value
+
+    def light_model(self, pname, value):
+        """glLightModeli/glLightModelfv"""
+        value = freeze(value)
+        if self.count(self.light_models.get(pname) != value):
+            if isinstance(value, tuple):
+                glLightModelfv(pname, value)
+            else:
+                glLightModeli(pname, value)
+            self.light_models[pname] = value
+
+    def stats(self):
+        """Счётчики: выполнено/пропущено за всё время и за последний кадр"""
+        return {
+            'issued': self.issued,
+            'elided': self.elided,
+            'frame_issued': self.last_frame_issued,
+            'frame_elided': self.last_frame_elided
+        }
+
+
+def freeze(value):
+    """Приводит значение к сравнимому виду: последовательности - к кортежу float"""
+    if isinstance(value, numbers.Integral):
+        return int(value)
+    if isinstance(value, numbers.Real):
+        return float(value)
+    return tuple(float(v) for v in value)
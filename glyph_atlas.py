@@ -0,0 +1,205 @@
+import ctypes
+
+import numpy as np
+import pygame
+from OpenGL.GL import *
+
+
+# Символы, которые растеризуются в атлас при запуске
+DEFAULT_CHARSET = (
+    ''.join(chr(c) for c in range(32, 127)) +                    # ASCII
+    'АБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ' +
+    'абвгдеёжзийклмнопрстуфхцчшщъыьэюя' +                      # Кириллица
+    '✓·←→↑↓—–«»№°×'                                               # Значки HUD
+)
+
+# Вершина текста: x, y, u, v, r, g, b, a (float32)
+VERTEX_FLOATS = 8
+
+
+class GlyphAtlas:
+    """Атлас глифов: все символы всех шрифтов в одной текстуре.
+
+    Глифы растеризуются через pygame один раз при создании; дальше строки
+    собираются из текстурированных квадов без растеризации и без загрузки
+    текстур.
+    """
+    def __init__(self, fonts, charset=DEFAULT_CHARSET, atlas_width=1024, padding=1,
+                 fallback='?'):
+        self.fonts = list(fonts)
+        self.fallback = fallback
+        self.index = {}  # (шрифт, символ) -> номер глифа
+
+        charset = ''.join(dict.fromkeys(charset + fallback))  # Без повторов
+
+        # Растеризуем глифы белым цветом, альфа - покрытие
+        surfaces = []
+        advances = []
+        for font in self.fonts:
+            for char in charset:
+                self.index[(font, char)] = len(surfaces)
+                surface = font.render(char, True, (255, 255, 255))
+                surfaces.append(surface)
+                # Сдвиг пера берём из метрик шрифта (ширина картинки может быть больше)
+                metrics = font.metrics(char)
+                if metrics and metrics[0] is not None:
+                    advances.append(metrics[0][4])
+                else:
+                    advances.append(surface.get_width())
+
+        # Раскладываем глифы по полкам
+        positions = []
+        x, y, shelf_height = padding, padding, 0
+        for surface in surfaces:
+            w, h = surface.get_size()
+            if x + w + padding > atlas_width:
+                x = padding
+                y += shelf_height + padding
+                shelf_height = 0
+            positions.append((x, y))
+            x += w + padding
+            shelf_height = max(shelf_height, h)
+        atlas_height = y + shelf_height + padding
+
+        atlas = pygame.Surface((atlas_width, atlas_height), pygame.SRCALPHA)
+        atlas.fill((255, 255, 255, 0))
+        for surface, position in zip(surfaces, positions):
+            atlas.blit(surface, position)
+
+        # Метрики глифов для векторной раскладки строк
+        sizes = np.array([s.get_size() for s in surfaces], dtype=np.float32)
+        origins = np.array(positions, dtype=np.float32)
+        self.size = sizes                                   # Ширина/высота в пикселях
+        self.advance = np.array(advances, dtype=np.float32) # Сдвиг пера
+        self.uv0 = origins / (atlas_width, atlas_height)
+        self.uv1 = (origins + sizes) / (atlas_width, atlas_height)
+
+        self.width = atlas_width
+        self.height = atlas_height
+
+        # Текстура: строка 0 поверхности = строка 0 текстуры (v растёт вниз)
+        self.texture = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, atlas_width, atlas_height, 0,
+                     GL_RGBA, GL_UNSIGNED_BYTE, pygame.image.tostring(atlas, "RGBA", False))
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+    def glyph_indices(self, font, text):
+        """Номера глифов строки (неизвестные символы заменяются на fallback)"""
+        index = self.index
+        missing = index[(font, self.fallback)]
+        return np.fromiter((index.get((font, char), missing) for char in text),
+                           dtype=np.intp, count=len(text))
+
+    def text_width(self, font, text):
+        """Ширина строки в пикселях"""
+        return float(self.advance[self.glyph_indices(font, text)].sum())
+
+    def layout(self, font, text, color, x, y):
+        """Квады строки: массив (4 * len(text), VERTEX_FLOATS).
+
+        Координаты экранные с осью Y вниз, (x, y) - левый верхний угол строки.
+        """
+        glyphs = self.glyph_indices(font, text)
+        count = len(glyphs)
+        if count == 0:
+            return np.empty((0, VERTEX_FLOATS), dtype=np.float32)
+
+        advance = self.advance[glyphs]
+        x0 = x + np.cumsum(advance) - advance
+        x1 = x0 + self.size[glyphs, 0]
+        y0 = np.full(count, float(y), dtype=np.float32)
+        y1 = y0 + self.size[glyphs, 1]
+        u0, v0 = self.uv0[glyphs].T
+        u1, v1 = self.uv1[glyphs].T
+
+        quads = np.empty((count, 4, VERTEX_FLOATS), dtype=np.float32)
+        quads[:, :, 0] = np.stack([x0, x1, x1, x0], axis=1)
+        quads[:, :, 1] = np.stack([y0, y0, y1, y1], axis=1)
+        quads[:, :, 2] = np.stack([u0, u1, u1, u0], axis=1)
+        quads[:, :, 3] = np.stack([v0, v0, v1, v1], axis=1)
+        rgba = [c / 255.0 for c in color[:3]] + [color[3] / 255.0 if len(color) > 3 else 1.0]
+        quads[:, :, 4:] = rgba
+        return quads.reshape(-1, VERTEX_FLOATS)
+
+    def delete(self):
+        """Освобождает текстуру атласа"""
+        glDeleteTextures([self.texture])
+
+
+class TextBatch:
+    """Пакет строк, который рисуется одним вызовом glDrawArrays.
+
+    Вершины лежат в VBO и догружаются только после изменения пакета.
+    """
+    def __init__(self, atlas):
+        self.atlas = atlas
+        self.parts = []
+        self.vertex_count = 0
+        self.dirty = False
+        self.uploads = 0
+
+        self.vbo = glGenBuffers(1)
+        self.vao = glGenVertexArrays(1)
+        glBindVertexArray(self.vao)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        stride = VERTEX_FLOATS * 4
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(2, GL_FLOAT, stride, ctypes.c_void_p(0))
+        glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+        glTexCoordPointer(2, GL_FLOAT, stride, ctypes.c_void_p(2 * 4))
+        glEnableClientState(GL_COLOR_ARRAY)
+        glColorPointer(4, GL_FLOAT, stride, ctypes.c_void_p(4 * 4))
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def clear(self):
+        """Очищает пакет"""
+        self.parts = []
+        self.dirty = True
+
+    def add_text(self, font, text, color, x, y):
+        """Добавляет строку; (x, y) - левый верхний угол, ось Y вниз"""
+        self.parts.append(self.atlas.layout(font, text, color, x, y))
+        self.dirty = True
+
+    def add_vertices(self, vertices):
+        """Добавляет заранее разложенные квады (см. GlyphAtlas.layout)"""
+        self.parts.append(vertices)
+        self.dirty = True
+
+    def upload(self):
+        """Загружает вершины в VBO, если пакет менялся"""
+        if not self.dirty:
+            return
+        if self.parts:
+            data = np.ascontiguousarray(np.concatenate(self.parts), dtype=np.float32)
+        else:
+            data = np.empty((0, VERTEX_FLOATS), dtype=np.float32)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, max(data.nbytes, 4), data if data.nbytes else None,
+                     GL_DYNAMIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self.vertex_count = len(data)
+        self.dirty = False
+        self.uploads += 1
+
+    def draw(self):
+        """Рисует пакет (нужна ортопроекция с осью Y вниз и включённый блендинг)"""
+        self.upload()
+        if self.vertex_count == 0:
+            return
+        glEnable(GL_TEXTURE_2D)
+        glBindTexture(GL_TEXTURE_2D, self.atlas.texture)
+        glTexEnvi(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_MODULATE)
+        glBindVertexArray(self.vao)
+        glDrawArrays(GL_QUADS, 0, self.vertex_count)
+        glBindVertexArray(0)
+        glDisable(GL_TEXTURE_2D)
+
+    def delete(self):
+        """Освобождает буферы"""
+        glDeleteBuffers(1, [self.vbo])
+        glDeleteVertexArrays(1, [self.vao])
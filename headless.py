@@ -0,0 +1,173 @@
+"""Отрисовка без окна: контекст EGL без поверхности или программный OSMesa
+
+Платформу PyOpenGL задаёт переменная PYOPENGL_PLATFORM, и прочитать её
+PyOpenGL успевает при первом импорте OpenGL. Поэтому этот модуль при
+импорте сам разбирает --headless из командной строки - main.py и
+скрипты, импортирующие main, должны импортировать его раньше OpenGL.
+
+Кадр рисуется во framebuffer object произвольного размера и читается в
+массив NumPy или PNG - окно, дисплей и видеокарта не нужны (EGL
+surfaceless работает и на программном llvmpipe Mesa).
+
+Запуск: python main.py --headless egl --size 1920x1080 --frames 120 --output frame.png
+"""
+import argparse
+import ctypes
+import os
+import sys
+
+
+HEADLESS_BACKENDS = ('egl', 'osmesa')
+
+# EGL_PLATFORM_SURFACELESS_MESA: дисплей без оконной системы
+EGL_PLATFORM_SURFACELESS = 0x31DD
+
+
+def select_platform(argv):
+    """Разбирает --headless из argv и настраивает окружение; возвращает бэкенд или None"""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--headless', choices=HEADLESS_BACKENDS)
+    args, _ = parser.parse_known_args(argv)
+    if args.headless:
+        if 'OpenGL.GL' in sys.modules and os.environ.get('PYOPENGL_PLATFORM') != args.headless:
+            raise RuntimeError("headless нужно импортировать раньше OpenGL")
+        os.environ['PYOPENGL_PLATFORM'] = args.headless
+        # pygame нужен только для шрифтов, событий и часов - без окна и звука
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    return args.headless
+
+
+# Бэкенд из командной строки (None - обычное окно pygame)
+SELECTED_BACKEND = select_platform(sys.argv[1:])
+
+import numpy as np
+from OpenGL.GL import *
+
+from pathtracer import write_png
+
+
+def parse_size(text):
+    """'1920x1080' -> (1920, 1080)"""
+    try:
+        width, height = (int(part) for part in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"размер должен быть ШИРИНАxВЫСОТА: {text!r}")
+    if width <= 0 or height <= 0:
+        raise argparse.ArgumentTypeError(f"размер должен быть положительным: {text!r}")
+    return width, height
+
+
+class HeadlessContext:
+    """Контекст OpenGL без окна и framebuffer кадра width x height.
+
+    После создания контекст текущий и framebuffer кадра привязан, так что
+    код, рисующий в окно, рисует в него; проходы в свои framebuffer
+    (отражения, G-буфер, тени) возвращаются к нему сами.
+    """
+    def __init__(self, backend, width, height):
+        if backend != os.environ.get('PYOPENGL_PLATFORM'):
+            raise RuntimeError(f"платформа PyOpenGL не {backend}: запустите с --headless {backend}")
+        self.backend = backend
+        self.width = width
+        self.height = height
+        self.display = None
+        self.context = None
+        self.buffer = None
+
+        if backend == 'egl':
+            self.create_egl_context()
+        else:
+            self.create_osmesa_context()
+
+        self.color = glGenRenderbuffers(1)
+        glBindRenderbuffer(GL_RENDERBUFFER, self.color)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_RGBA8, width, height)
+        self.depth = glGenRenderbuffers(1)
+        glBindRenderbuffer(GL_RENDERBUFFER, self.depth)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH_COMPONENT24, width, height)
+        glBindRenderbuffer(GL_RENDERBUFFER, 0)
+
+        self.fbo = glGenFramebuffers(1)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_RENDERBUFFER,
+                                  self.color)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, GL_RENDERBUFFER,
+                                  self.depth)
+        status = glCheckFramebufferStatus(GL_FRAMEBUFFER)
+        if status != GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError(f"Framebuffer кадра неполный: 0x{int(status):x}")
+        glViewport(0, 0, width, height)
+
+    def create_egl_context(self):
+        """EGL без поверхности: контекст полного OpenGL (не ES) без окна"""
+        # Модуль EGL есть только на платформе egl
+        from OpenGL import EGL
+
+        display = EGL.eglGetPlatformDisplayEXT(EGL_PLATFORM_SURFACELESS,
+                                               EGL.EGL_DEFAULT_DISPLAY, None)
+        if not display:
+            display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        major, minor = EGL.EGLint(), EGL.EGLint()
+        if not EGL.eglInitialize(display, ctypes.pointer(major), ctypes.pointer(minor)):
+            raise RuntimeError("eglInitialize не удался")
+
+        # По умолчанию eglChooseConfig ищет конфигурации окон - без оконной системы их нет
+        attributes = (EGL.EGLint * 7)(EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+                                      EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+                                      EGL.EGL_DEPTH_SIZE, 24, EGL.EGL_NONE)
+        config = EGL.EGLConfig()
+        count = EGL.EGLint()
+        if not EGL.eglChooseConfig(display, attributes, ctypes.pointer(config), 1,
+                                   ctypes.pointer(count)) or count.value == 0:
+            raise RuntimeError("нет конфигурации EGL с OpenGL")
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        context = EGL.eglCreateContext(display, config, EGL.EGL_NO_CONTEXT, None)
+        if not context:
+            raise RuntimeError("eglCreateContext не удался")
+        EGL.eglMakeCurrent(display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, context)
+        self.display = display
+        self.context = context
+
+    def create_osmesa_context(self):
+        """Программный OSMesa: рисует в буфер в памяти процесса"""
+        from OpenGL import arrays, osmesa
+
+        context = osmesa.OSMesaCreateContextExt(osmesa.OSMESA_RGBA, 24, 0, 0, None)
+        if not context:
+            raise RuntimeError("OSMesaCreateContextExt не удался")
+        # Кадр рисуется во framebuffer object, буфер контекста нужен только для активации
+        self.buffer = arrays.GLubyteArray.zeros((1, 1, 4))
+        if not osmesa.OSMesaMakeCurrent(context, self.buffer, GL_UNSIGNED_BYTE, 1, 1):
+            raise RuntimeError("OSMesaMakeCurrent не удался")
+        self.context = context
+
+    def read_pixels(self):
+        """Кадр массивом (height, width, 3) uint8, строка 0 - верх изображения"""
+        glFinish()
+        previous = glGetIntegerv(GL_READ_FRAMEBUFFER_BINDING)
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, self.fbo)
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        data = glReadPixels(0, 0, self.width, self.height, GL_RGB, GL_UNSIGNED_BYTE)
+        glPixelStorei(GL_PACK_ALIGNMENT, 4)
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, previous)
+        pixels = np.frombuffer(data, dtype=np.uint8).reshape(self.height, self.width, 3)
+        return pixels[::-1].copy()
+
+    def save_png(self, path):
+        """Сохраняет кадр в PNG"""
+        write_png(path, self.read_pixels() / 255.0)
+
+    def delete(self):
+        """Удаляет framebuffer кадра и контекст"""
+        glDeleteFramebuffers(1, [self.fbo])
+        glDeleteRenderbuffers(2, [self.color, self.depth])
+        if self.backend == 'egl':
+            from OpenGL import EGL
+            EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE,
+                               EGL.EGL_NO_CONTEXT)
+            EGL.eglDestroyContext(self.display, self.context)
+            EGL.eglTerminate(self.display)
+        else:
+            from OpenGL import osmesa
+            osmesa.OSMesaDestroyContext(self.context)
@@ -0,0 +1,96 @@
+import numpy as np
+from OpenGL.GL import *
+
+from glyph_atlas import TextBatch, VERTEX_FLOATS
+
+
+class InfoPanel:
+    """Текстовая панель, собранная из квадов атласа глифов.
+
+    Панель состоит из секций, уложенных сверху вниз. Строки секции
+    раскладываются заново только когда меняется её состояние (или её позиция);
+    растеризации текста и загрузки текстур во время работы нет совсем.
+    """
+    def __init__(self, atlas, width, height, background=(0, 0, 0, 200), top_margin=10):
+        self.atlas = atlas
+        self.width = width
+        self.height = height
+        self.background = background
+        self.top_margin = top_margin
+
+        self.batch = TextBatch(atlas)
+        self.sections = []      # [(имя, состояние, верх, высота, вершины)]
+
+        # Статистика для отладки
+        self.section_renders = 0
+
+    def update(self, sections):
+        """Обновляет панель.
+
+        sections - список (имя, состояние, функция), где функция возвращает
+        (высота, строки), а строка - это (шрифт, текст, цвет, x, y внутри секции).
+        Функция вызывается только если состояние секции изменилось.
+        """
+        top = self.top_margin
+        new_sections = []
+        changed = len(sections) != len(self.sections)
+
+        for i, (name, state, build) in enumerate(sections):
+            old = self.sections[i] if i < len(self.sections) else None
+
+            if old is not None and old[0] == name and old[1] == state and old[2] == top:
+                height, vertices = old[3], old[4]
+            else:
+                height, lines = build()
+                vertices = self.layout_section(top, height, lines)
+                changed = True
+
+            new_sections.append((name, state, top, height, vertices))
+            top += height
+
+        self.sections = new_sections
+        if changed:
+            self.batch.clear()
+            for section in self.sections:
+                self.batch.add_vertices(section[4])
+
+    def layout_section(self, top, height, lines):
+        """Раскладывает строки секции в квады (обрезая то, что не влезло в панель)"""
+        self.section_renders += 1
+        parts = []
+        for font, text, color, x, y in lines:
+            if top + y >= self.height:
+                continue
+            parts.append(self.atlas.layout(font, text, color, x, top + y))
+        if not parts:
+            return np.empty((0, VERTEX_FLOATS), dtype=np.float32)
+        return np.concatenate(parts)
+
+    def draw(self, x, y):
+        """Рисует панель; (x, y) - левый нижний угол в экранных координатах (ось Y вверх)"""
+        # Фон панели
+        r, g, b, a = [c / 255.0 for c in self.background]
+        glColor4f(r, g, b, a)
+        glBegin(GL_QUADS)
+        glVertex2f(x, y)
+        glVertex2f(x + self.width, y)
+        glVertex2f(x + self.width, y + self.height)
+        glVertex2f(x, y + self.height)
+        glEnd()
+
+        # Текст: координаты секций идут от верхнего края панели вниз
+        glPushMatrix()
+        glTranslatef(x, y + self.height, 0.0)
+        glScalef(1.0, -1.0, 1.0)
+
+        # Всё, что вылезло за панель, обрезаем
+        glEnable(GL_SCISSOR_TEST)
+        glScissor(int(x), int(y), self.width, self.height)
+        self.batch.draw()
+        glDisable(GL_SCISSOR_TEST)
+
+        glPopMatrix()
+
+    def delete(self):
+        """Освобождает буферы"""
+        self.batch.delete()
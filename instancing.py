@@ -0,0 +1,347 @@
+import ctypes
+
+import numpy as np
+from OpenGL.GL import *
+
+from scene import OBJECT_TYPES
+from shaders import ShaderProgram
+
+
+# Данные экземпляра: позиция + блеск, масштаб + флаг зеркала, цвет (12 float)
+INSTANCE_FLOATS = 12
+
+# Номера атрибутов экземпляра. 0, 2, 3, 4, 5 и 8-15 на некоторых драйверах
+# совпадают со встроенными gl_Vertex, gl_Normal, gl_Color и т.д.
+INSTANCE_ATTRIBUTES = {
+    'instance_position': 1,
+    'instance_scale': 6,
+    'instance_color': 7
+}
+
+MAX_LIGHTS = 8
+
+# Сколько невидимых экземпляров подряд рисуется внутри диапазона, чтобы не
+# разбивать его (порядок BVH держит видимые объекты рядом)
+RANGE_GAP = 8
+
+# Освещение по вершинам - та же формула, что у фиксированного конвейера
+# (локальный наблюдатель, без затухания), но материал берётся из экземпляра
+INSTANCED_VERTEX_SHADER = """
+#version 120
+
+attribute vec4 instance_position;  // xyz - позиция, w - блеск
+attribute vec4 instance_scale;     // xyz - масштаб, w - 1.0 для зеркала
+attribute vec4 instance_color;
+
+uniform float light_enabled[%(max_lights)d];
+
+varying vec4 v_color;
+
+void main()
+{
+    vec4 world = vec4(gl_Vertex.xyz * instance_scale.xyz + instance_position.xyz, 1.0);
+    vec4 eye = gl_ModelViewMatrix * world;
+    vec3 normal = normalize(gl_NormalMatrix * (gl_Normal / instance_scale.xyz));
+    vec3 view = normalize(-eye.xyz);
+
+    float alpha = instance_color.a;
+    vec3 diffuse;
+    vec3 ambient;
+    vec3 specular;
+    if (instance_scale.w > 0.5) {
+        // Зеркальный материал
+        diffuse = vec3(0.1);
+        ambient = vec3(0.1);
+        specular = vec3(0.9);
+    } else {
+        diffuse = instance_color.rgb;
+        ambient = instance_color.rgb * 0.3;
+        specular = vec3(0.3);
+    }
+    float shininess = min(instance_position.w, 128.0);
+
+    vec3 color = ambient * gl_LightModel.ambient.rgb;
+    for (int i = 0; i < %(max_lights)d; i++) {
+        if (light_enabled[i] < 0.5)
+            continue;
+        vec4 light_position = gl_LightSource[i].position;
+        vec3 to_light = normalize(light_position.xyz - eye.xyz * light_position.w);
+        float n_dot_l = max(dot(normal, to_light), 0.0);
+
+        color += ambient * gl_LightSource[i].ambient.rgb;
+        color += diffuse * gl_LightSource[i].diffuse.rgb * n_dot_l;
+        if (n_dot_l > 0.0) {
+            vec3 half_vector = normalize(to_light + view);
+            float n_dot_h = max(dot(normal, half_vector), 0.0);
+            color += specular * gl_LightSource[i].specular.rgb * pow(n_dot_h, shininess);
+        }
+    }
+
+    v_color = vec4(clamp(color, 0.0, 1.0), alpha);
+    gl_ClipVertex = eye;  // Для glClipPlane (проход отражения)
+    gl_Position = gl_ProjectionMatrix * eye;
+}
+""" % {'max_lights': MAX_LIGHTS}
+
+INSTANCED_FRAGMENT_SHADER = """
+#version 120
+
+varying vec4 v_color;
+
+void main()
+{
+    gl_FragColor = v_color;
+}
+"""
+
+
+def pack_instances(store, mask):
+    """Упаковывает выбранные объекты SceneStore в массив (N, INSTANCE_FLOATS)
+
+    mask - булева маска или номера объектов (тогда в их порядке).
+    """
+    if mask.dtype == bool:
+        mask = np.flatnonzero(mask)
+    data = np.empty((len(mask), INSTANCE_FLOATS), dtype=np.float32)
+    data[:, 0:3] = store.positions[mask]
+    data[:, 3] = store.shininess[mask]
+    data[:, 4:7] = store.scales[mask]
+    data[:, 7] = store.mirror[mask]
+    data[:, 8:12] = store.colors[mask]
+    return data
+
+
+def instance_ranges(positions, max_gap=0):
+    """Сплошные диапазоны [(начало, число)] из возрастающих номеров экземпляров
+
+    Промежутки не длиннее max_gap входят в диапазон: лишний экземпляр за
+    пирамидой видимости дешевле ещё одного вызова рисования.
+    """
+    if len(positions) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(positions) > max_gap + 1) + 1
+    starts = positions[np.concatenate([[0], breaks])]
+    ends = positions[np.concatenate([breaks - 1, [len(positions) - 1]])] + 1
+    return list(zip(starts.tolist(), (ends - starts).tolist()))
+
+
+class InstanceGroup:
+    """Все объекты одного меша и одного прохода: VAO меша + буфер экземпляров
+
+    objects - номера объектов SceneStore в порядке экземпляров буфера.
+    """
+    def __init__(self, mesh):
+        self.mesh = mesh
+        self.count = 0
+        self.capacity = 0
+        self.objects = np.empty(0, dtype=np.int64)
+
+        self.instance_vbo = glGenBuffers(1)
+        self.vao = glGenVertexArrays(1)
+        glBindVertexArray(self.vao)
+        mesh.bind_arrays()
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.instance_vbo)
+        for name in ['instance_position', 'instance_scale', 'instance_color']:
+            location = INSTANCE_ATTRIBUTES[name]
+            glEnableVertexAttribArray(location)
+            glVertexAttribDivisor(location, 1)  # Один элемент на экземпляр
+        self.point_attributes(0)
+
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+
+    def point_attributes(self, first):
+        """Атрибуты экземпляра начинаются с экземпляра first (VAO уже привязан).
+
+        Так рисуется диапазон буфера без glDrawElementsInstancedBaseInstance
+        (OpenGL 4.2).
+        """
+        glBindBuffer(GL_ARRAY_BUFFER, self.instance_vbo)
+        stride = INSTANCE_FLOATS * 4
+        for offset, name in enumerate(['instance_position', 'instance_scale', 'instance_color']):
+            glVertexAttribPointer(INSTANCE_ATTRIBUTES[name], 4, GL_FLOAT, GL_FALSE, stride,
+                                  ctypes.c_void_p(first * stride + offset * 4 * 4))
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def upload(self, store, objects):
+        """Загружает объекты store с номерами objects (буфер растёт только при нехватке места)"""
+        self.objects = np.asarray(objects, dtype=np.int64)
+        data = pack_instances(store, self.objects)
+        self.count = len(data)
+        glBindBuffer(GL_ARRAY_BUFFER, self.instance_vbo)
+        if self.count > self.capacity:
+            self.capacity = max(self.count, 2 * self.capacity)
+            glBufferData(GL_ARRAY_BUFFER, self.capacity * INSTANCE_FLOATS * 4, None,
+                         GL_DYNAMIC_DRAW)
+        if self.count:
+            glBufferSubData(GL_ARRAY_BUFFER, 0, data.nbytes, data)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def draw(self, visible=None):
+        """Все экземпляры группы одним вызовом или только видимые.
+
+        visible - булева маска по всем объектам SceneStore (None - все
+        экземпляры). Видимые экземпляры рисуются сплошными диапазонами
+        буфера, сам буфер не меняется.
+        """
+        if self.count == 0:
+            return
+        if visible is None:
+            self.draw_ranges([(0, self.count)])
+        else:
+            self.draw_ranges(instance_ranges(np.flatnonzero(visible[self.objects]), RANGE_GAP))
+
+    def draw_ranges(self, ranges):
+        """Диапазоны буфера [(начало, число)] по одному вызову, в заданном порядке"""
+        if not ranges:
+            return
+        glBindVertexArray(self.vao)
+        for first, count in ranges:
+            if first:
+                self.point_attributes(first)
+            glDrawElementsInstanced(self.mesh.mode, self.mesh.index_count, GL_UNSIGNED_INT,
+                                    None, count)
+        if ranges[-1][0]:
+            self.point_attributes(0)
+        glBindVertexArray(0)
+
+    def delete(self):
+        glDeleteBuffers(1, [self.instance_vbo])
+        glDeleteVertexArrays(1, [self.vao])
+
+
+class InstancedRenderer:
+    """Рисует все объекты одного типа одним вызовом glDrawElementsInstanced.
+
+    Позиции, масштабы, цвета и блеск лежат в буферах экземпляров и
+    перезагружаются только когда меняется версия SceneStore
+    (переключение зеркальности, прозрачности, сброс настроек и т.п.) или
+    порядок объектов в буферах. Отсечение по пирамиде видимости буферы не
+    трогает: видимые экземпляры рисуются диапазонами (см. InstanceGroup.draw).
+    Прозрачные экземпляры с сортировкой по глубине лежат в отдельных
+    буферах в порядке от дальнего к ближнему (внутри своего типа) - их
+    содержимое меняется вместе с порядком. Рисуются они сериями подряд
+    идущих объектов одного типа в общем порядке от дальнего к ближнему,
+    так что кубы и сферы смешиваются правильно и между собой.
+    """
+    def __init__(self, meshes):
+        # meshes - {тип объекта: меш}
+        self.meshes = meshes
+        self.program = ShaderProgram(INSTANCED_VERTEX_SHADER, INSTANCED_FRAGMENT_SHADER,
+                                     INSTANCE_ATTRIBUTES)
+        # Отдельные группы для непрозрачного и прозрачного проходов
+        self.groups = {
+            (obj_type, transparent): InstanceGroup(mesh)
+            for obj_type, mesh in meshes.items()
+            for transparent in (False, True)
+        }
+        # Видимые прозрачные объекты, отсортированные по глубине
+        self.sorted_groups = {obj_type: InstanceGroup(mesh) for obj_type, mesh in meshes.items()}
+        self.version = None
+        self.layout = None
+        self.sorted_version = None
+        self.transparent_order = None
+        # Тип и место в буфере сортировки для каждого объекта transparent_order
+        self.sorted_types = np.empty(0, dtype=np.int64)
+        self.sorted_slots = np.empty(0, dtype=np.int64)
+        self.uploads = 0
+
+    @staticmethod
+    def same_indices(a, b):
+        """Совпадают ли два необязательных массива номеров"""
+        if a is None or b is None:
+            return a is None and b is None
+        return np.array_equal(a, b)
+
+    def update(self, store, layout=None, transparent_order=None):
+        """Перестраивает буферы экземпляров, если объекты SceneStore изменились.
+
+        layout - порядок объектов в буферах (None - порядок хранения);
+        чтобы отсечение рисовало мало диапазонов, видимые объекты должны
+        лежать в нём рядом (порядок листьев BVH). transparent_order -
+        номера видимых прозрачных объектов от дальнего к ближнему (None -
+        буферы сортировки не нужны и не трогаются).
+        """
+        if store.version != self.version or not self.same_indices(layout, self.layout):
+            self.version = store.version
+            self.layout = None if layout is None else np.array(layout)
+
+            order = np.arange(len(store)) if layout is None else self.layout
+            types = store.types[order]
+            transparent = store.transparent[order]
+            for (obj_type, group_transparent), group in self.groups.items():
+                type_index = OBJECT_TYPES.index(obj_type)
+                group.upload(store, order[(types == type_index) &
+                                          (transparent == group_transparent)])
+                self.uploads += 1
+
+        if transparent_order is None:
+            return
+        if (store.version == self.sorted_version and
+                self.same_indices(transparent_order, self.transparent_order)):
+            return
+        self.sorted_version = store.version
+        self.transparent_order = np.array(transparent_order)
+        self.sorted_types = store.types[self.transparent_order]
+        self.sorted_slots = np.empty(len(self.transparent_order), dtype=np.int64)
+        for obj_type, group in self.sorted_groups.items():
+            of_type = self.sorted_types == OBJECT_TYPES.index(obj_type)
+            self.sorted_slots[of_type] = np.arange(np.count_nonzero(of_type))
+            group.upload(store, self.transparent_order[of_type])
+            self.uploads += 1
+
+    def sorted_runs(self, start, stop):
+        """Серии [(тип, начало в буфере, число)] для transparent_order[start:stop]
+
+        Серия - подряд идущие объекты одного типа; серии идут в порядке
+        от дальнего к ближнему.
+        """
+        types = self.sorted_types[start:stop]
+        if len(types) == 0:
+            return []
+        breaks = np.flatnonzero(types[1:] != types[:-1]) + 1
+        firsts = np.concatenate([[0], breaks])
+        ends = np.concatenate([breaks, [len(types)]])
+        return [(OBJECT_TYPES[types[first]], int(self.sorted_slots[start + first]), end - first)
+                for first, end in zip(firsts.tolist(), ends.tolist())]
+
+    def draw(self, transparent, light_enabled, program=None, visible=None, sorted_range=None):
+        """Рисует один проход; light_enabled - флаги включённых источников.
+
+        program - уже включённая внешняя программа с теми же атрибутами
+        экземпляра (её uniform-переменные задаёт вызывающий код);
+        visible - булева маска рисуемых объектов SceneStore (None - все);
+        sorted_range - (начало, конец) отрезка последнего transparent_order
+        из update: прозрачные рисуются из буферов сортировки по глубине
+        сериями в его порядке, маска к ним не применяется.
+        """
+        if program is None:
+            flags = [1.0 if enabled else 0.0 for enabled in light_enabled[:MAX_LIGHTS]]
+            flags += [0.0] * (MAX_LIGHTS - len(flags))
+            self.program.use()
+            glUniform1fv(self.program.location('light_enabled'), MAX_LIGHTS, flags)
+
+        if transparent and sorted_range is not None:
+            for obj_type, first, count in self.sorted_runs(*sorted_range):
+                self.sorted_groups[obj_type].draw_ranges([(first, count)])
+        else:
+            for (obj_type, group_transparent), group in self.groups.items():
+                if group_transparent == transparent:
+                    group.draw(visible)
+
+        if program is None:
+            self.program.stop()
+
+    def counts(self):
+        """Число экземпляров по типам объектов"""
+        totals = {}
+        for (obj_type, transparent), group in self.groups.items():
+            totals[obj_type] = totals.get(obj_type, 0) + group.count
+        return totals
+
+    def delete(self):
+        for group in list(self.groups.values()) + list(self.sorted_groups.values()):
+            group.delete()
+        self.program.delete()
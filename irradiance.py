@@ -0,0 +1,317 @@
+"""Сетка зондов освещённости (сферические гармоники) для объектов
+
+Зонды стоят в центрах ячеек сетки во всю комнату. Каждый зонд один раз
+(при изменении объектов) выпускает лучи по фиксированным направлениям и
+запоминает, во что они попали; яркость этих точек от источников (та же
+модель, что у трассировщика и излучательности) проецируется на
+сферические гармоники L2 - 9 коэффициентов на канал. Вклад каждого
+источника хранится отдельно: сдвиг источника помечает устаревшими только
+зонды, чьи точки он может осветить, и они пересчитываются понемногу за
+кадр; включение и выключение источника ничего не пересчитывает.
+
+Объект берёт освещённость одной трилинейной выборкой сетки в своём
+центре, а не считает переотражения сам.
+"""
+import hashlib
+import math
+
+import numpy as np
+
+from pathtracer import EPSILON, intersect_objects, intersect_walls, object_normals
+from radiosity import Occluders
+
+
+# Свёртка с косинусом по полосам L0, L1, L2 (Ramamoorthi, Hanrahan, 2001)
+SH_COSINE_BANDS = np.array([math.pi] + [2.0 * math.pi / 3.0] * 3 + [math.pi / 4.0] * 5)
+
+# Зонд внутри объекта видит изнанку его граней; такой зонд не участвует в выборке
+MAX_BACKFACE_FRACTION = 0.25
+
+
+def sh_basis(directions):
+    """Вещественные сферические гармоники L2 единичных направлений: (N, 9)"""
+    x, y, z = directions[:, 0], directions[:, 1], directions[:, 2]
+    return np.stack([
+        np.full(len(directions), 0.282095),
+        0.488603 * y, 0.488603 * z, 0.488603 * x,
+        1.092548 * x * y, 1.092548 * y * z, 0.315392 * (3.0 * z * z - 1.0),
+        1.092548 * x * z, 0.546274 * (x * x - y * y)
+    ], axis=1)
+
+
+def sphere_directions(count):
+    """Почти равномерные направления по сфере (спираль Фибоначчи)"""
+    i = np.arange(count) + 0.5
+    y = 1.0 - 2.0 * i / count
+    r = np.sqrt(1.0 - y * y)
+    phi = math.pi * (3.0 - math.sqrt(5.0)) * i
+    return np.stack([r * np.cos(phi), y, r * np.sin(phi)], axis=1)
+
+
+def sh_irradiance(coefficients, normals):
+    """Освещённость E(n) по коэффициентам яркости (..., 9, 3) для нормалей (..., 3)"""
+    basis = sh_basis(normals.reshape(-1, 3)).reshape(normals.shape[:-1] + (9,))
+    irradiance = np.einsum('...j,...jc->...c', basis * SH_COSINE_BANDS, coefficients)
+    return np.maximum(irradiance, 0.0)
+
+
+def ambient_and_directional(coefficients):
+    """Приближение E(n) ~ a + b * max(n . d, 0) для фиксированного конвейера
+
+    d - направление линейной полосы (по яркости), a - освещённость с
+    обратной стороны, b - прибавка к ней в направлении d; в обоих полюсах
+    приближение точное. Возвращает (a, d, b) массивами (N, 3).
+    """
+    linear = coefficients[:, [3, 1, 2], :] @ np.array([0.2126, 0.7152, 0.0722])
+    length = np.linalg.norm(linear, axis=1, keepdims=True)
+    directions = np.where(length > 1e-8, linear / np.maximum(length, 1e-8), [0.0, 1.0, 0.0])
+    toward = sh_irradiance(coefficients, directions)
+    away = sh_irradiance(coefficients, -directions)
+    return away, directions, np.maximum(toward - away, 0.0)
+
+
+class ProbeScene(Occluders):
+    """Стены и объекты для лучей зондов: препятствия, нормали и albedo"""
+    def __init__(self, walls, wall_colors, objects):
+        super().__init__(objects)
+        corners = np.array([vertices for _, vertices, _ in walls], dtype=np.float64)
+        self.wall_origins = corners[:, 0]
+        self.wall_u = corners[:, 1] - corners[:, 0]
+        self.wall_v = corners[:, 3] - corners[:, 0]
+        self.wall_normals = np.array([normal for _, _, normal in walls], dtype=np.float64)
+        self.wall_albedo = np.array([wall_colors[name][:3] for name, _, _ in walls],
+                                    dtype=np.float64)
+        self.albedo = objects.colors[:, :3].astype(np.float64)
+
+
+class IrradianceGrid:
+    """Зонды освещённости на сетке resolution^3 и их пошаговое обновление.
+
+    update() вызывается каждый кадр: после изменения объектов лучи зондов
+    трассируются заново, после изменения источников устаревшими
+    помечаются пары (источник, зонд), которых изменение касается, и за кадр
+    пересчитывается не больше updates_per_frame таких пар. Пока пара
+    устарела, в сумме остаётся её прежний вклад. Зеркала и прозрачные
+    объекты для зондов - диффузные и непрозрачные, как в излучательности;
+    стены свет источников не загораживают, как в трассировщике.
+    """
+    def __init__(self, walls, wall_colors, room_size=5.0, resolution=5, directions=128,
+                 updates_per_frame=32):
+        self.walls = walls
+        self.wall_colors = wall_colors
+        self.resolution = resolution
+        self.updates_per_frame = updates_per_frame
+
+        # Центры ячеек: зонды не лежат на стенах
+        self.spacing = room_size / resolution
+        self.origin = -room_size / 2.0 + self.spacing / 2.0
+        axis = self.origin + self.spacing * np.arange(resolution)
+        grid = np.stack(np.meshgrid(axis, axis, axis, indexing='ij'), axis=-1)
+        self.positions = grid.reshape(-1, 3)  # Номер зонда: (ix * R + iy) * R + iz
+
+        self.directions = sphere_directions(directions)
+        # Интеграл по сфере - среднее по направлениям, умноженное на 4 pi
+        self.projection = sh_basis(self.directions) * (4.0 * math.pi / directions)
+
+        self.objects_version = None
+        self.geometry_key = None
+        self.hit_points = None   # (зонды, направления, 3)
+        self.hit_normals = None
+        self.hit_albedo = None   # Ноль у изнанки - она ничего не отражает в зонд
+        self.valid = np.zeros(len(self.positions), dtype=bool)
+        self.occluders = None
+
+        self.lights_version = None
+        self.light_state = None  # Позиции, цвета и радиусы, для которых посчитаны вклады
+        self.contributions = np.zeros((0, len(self.positions), 9, 3), dtype=np.float32)
+        self.stale = np.zeros((0, len(self.positions)), dtype=bool)
+        self.enabled = np.zeros(0, dtype=bool)
+
+        self.coefficients = np.zeros((len(self.positions), 9, 3), dtype=np.float32)
+        self.version = 0  # Растёт при каждом изменении coefficients
+        self.lighting_key = None
+        self.lighting = None
+        self.probe_updates = 0
+
+    def __len__(self):
+        return len(self.positions)
+
+    @property
+    def pending(self):
+        """Сколько пар (источник, зонд) включённых источников ждёт пересчёта"""
+        return int(self.stale[self.enabled].sum())
+
+    def update(self, objects, lights):
+        """Следит за объектами и источниками и пересчитывает часть устаревших зондов"""
+        changed = False
+        if objects.version != self.objects_version:
+            self.objects_version = objects.version
+            key = self.objects_hash(objects)
+            if key != self.geometry_key:
+                self.geometry_key = key
+                self.trace_probes(objects)
+                self.light_state = None  # Все вклады посчитаны для старых точек
+                changed = True
+
+        if lights.version != self.lights_version or self.light_state is None:
+            self.lights_version = lights.version
+            self.mark_lights(lights)
+            changed |= not np.array_equal(self.enabled, lights.enabled)
+            self.enabled = lights.enabled.copy()
+
+        changed |= self.refresh()
+        if changed:
+            total = np.einsum('l,lpjc->pjc', self.enabled.astype(np.float32),
+                              self.contributions)
+            self.coefficients = total
+            self.version += 1
+
+    def objects_hash(self, objects):
+        """Хэш того, что видят зонды: форма, положение и цвет объектов"""
+        digest = hashlib.sha1()
+        for array in (objects.types, objects.positions, objects.scales, objects.colors):
+            digest.update(array.tobytes())
+        return digest.hexdigest()
+
+    def trace_probes(self, objects):
+        """Ближайшие поверхности по всем направлениям всех зондов"""
+        scene = ProbeScene(self.walls, self.wall_colors, objects)
+        probes, count = len(self.positions), len(self.directions)
+        origins = np.repeat(self.positions, count, axis=0)
+        directions = np.tile(self.directions, (probes, 1))
+
+        wall_t, walls = intersect_walls(scene, origins, directions)
+        object_t, hit_objects = intersect_objects(scene, origins, directions, wall_t)
+        on_object = hit_objects >= 0
+        t = np.where(on_object, object_t, wall_t)
+        points = origins + directions * t[:, None]
+
+        normals = np.empty_like(points)
+        albedo = np.empty_like(points)
+        normals[on_object] = object_normals(scene, hit_objects[on_object], points[on_object])
+        albedo[on_object] = scene.albedo[hit_objects[on_object]]
+        normals[~on_object] = scene.wall_normals[walls[~on_object]]
+        albedo[~on_object] = scene.wall_albedo[walls[~on_object]]
+
+        backface = np.einsum('ij,ij->i', normals, directions) > 0.0
+        albedo[backface] = 0.0
+        self.valid = backface.reshape(probes, count).mean(axis=1) <= MAX_BACKFACE_FRACTION
+        self.hit_points = points.reshape(probes, count, 3)
+        self.hit_normals = normals.reshape(probes, count, 3)
+        self.hit_albedo = albedo.reshape(probes, count, 3)
+        self.occluders = scene
+
+    def reach(self, position, radius):
+        """Зонды, чьи точки попадания источник в position с радиусом radius освещает"""
+        if not np.isfinite(radius):
+            return np.ones(len(self.positions), dtype=bool)
+        distances = np.linalg.norm(self.hit_points - position, axis=2)
+        return distances.min(axis=1) < radius
+
+    def mark_lights(self, lights):
+        """Помечает устаревшими пары (источник, зонд), которых коснулось изменение"""
+        positions = lights.positions[:, :3].astype(np.float64)
+        diffuse = lights.diffuse[:, :3].copy()
+        radius = lights.radius.copy()
+        count = len(positions)
+
+        if self.light_state is None or len(self.light_state[0]) > count:
+            self.contributions = np.zeros((count,) + self.coefficients.shape, dtype=np.float32)
+            self.stale = np.zeros((count, len(self.positions)), dtype=bool)
+            old_count = 0
+        else:
+            old_count = len(self.light_state[0])
+            extra = count - old_count
+            self.contributions = np.concatenate([
+                self.contributions,
+                np.zeros((extra,) + self.coefficients.shape, dtype=np.float32)])
+            self.stale = np.concatenate([self.stale,
+                                         np.zeros((extra, len(self.positions)), dtype=bool)])
+
+        for index in range(count):
+            if index < old_count:
+                old_position, old_diffuse, old_radius = (state[index]
+                                                         for state in self.light_state)
+                if (np.array_equal(old_position, positions[index]) and
+                        np.array_equal(old_diffuse, diffuse[index]) and
+                        old_radius == radius[index]):
+                    continue
+                # Старое положение тоже: его вклад в зонды должен исчезнуть
+                self.stale[index] |= self.reach(old_position, old_radius)
+            self.stale[index] |= self.reach(positions[index], radius[index])
+        self.light_state = (positions, diffuse, radius)
+
+    def refresh(self):
+        """Пересчитывает не больше updates_per_frame устаревших пар; True, если что-то изменилось"""
+        budget = self.updates_per_frame
+        changed = False
+        positions, diffuse, radius = self.light_state
+        for index in np.flatnonzero(self.enabled & self.stale.any(axis=1)):
+            if budget <= 0:
+                break
+            probes = np.flatnonzero(self.stale[index])[:budget]
+            self.contributions[index, probes] = self.project_light(
+                probes, positions[index], diffuse[index], radius[index])
+            self.stale[index, probes] = False
+            self.probe_updates += len(probes)
+            budget -= len(probes)
+            changed = True
+        return changed
+
+    def project_light(self, probes, position, diffuse, radius):
+        """Коэффициенты яркости, которую источник через поверхности приносит в зонды probes"""
+        points = self.hit_points[probes].reshape(-1, 3)
+        normals = self.hit_normals[probes].reshape(-1, 3)
+        albedo = self.hit_albedo[probes].reshape(-1, 3)
+
+        to_light = position[None, :] - points
+        distances = np.linalg.norm(to_light, axis=1)
+        to_light /= np.maximum(distances, 1e-12)[:, None]
+        cosines = np.einsum('ij,ij->i', normals, to_light)
+        if np.isfinite(radius):
+            x = np.clip(distances / radius, 0.0, 1.0)
+            attenuation = (1.0 - x * x) ** 2
+        else:
+            attenuation = np.ones(len(points))
+
+        # Ламберт с интенсивностью pi * diffuse: albedo * diffuse * cos
+        weight = np.maximum(cosines, 0.0) * attenuation
+        lit = np.flatnonzero((weight > 0.0) & albedo.any(axis=1))
+        _, blocked = intersect_objects(self.occluders, points[lit] + normals[lit] * EPSILON,
+                                       to_light[lit], distances[lit])
+        visible = np.zeros(len(points), dtype=bool)
+        visible[lit[blocked < 0]] = True
+        radiance = albedo * diffuse[None, :] * (weight * visible)[:, None]
+
+        radiance = radiance.reshape(len(probes), len(self.directions), 3)
+        return np.einsum('pkc,kj->pjc', radiance, self.projection)
+
+    def sample(self, points):
+        """Коэффициенты в точках points (N, 3): трилинейная выборка по годным зондам"""
+        r = self.resolution
+        local = np.clip((points - self.origin) / self.spacing, 0.0, r - 1)
+        base = np.minimum(np.floor(local).astype(np.int64), max(r - 2, 0))
+        fraction = local - base
+
+        coefficients = np.zeros((len(points), 9, 3))
+        weights = np.zeros(len(points))
+        for corner in np.ndindex(2, 2, 2):
+            offset = np.array(corner)
+            index = np.minimum(base + offset, r - 1)
+            probe = (index[:, 0] * r + index[:, 1]) * r + index[:, 2]
+            weight = np.prod(np.where(offset, fraction, 1.0 - fraction), axis=1)
+            weight = weight * self.valid[probe]
+            coefficients += weight[:, None, None] * self.coefficients[probe]
+            weights += weight
+        return coefficients / np.maximum(weights, 1e-8)[:, None, None]
+
+    def object_lighting(self, objects):
+        """(a, d, b) из ambient_and_directional для центров всех объектов
+
+        Пересчитывается только после изменения зондов или объектов.
+        """
+        key = (self.version, objects.version)
+        if key != self.lighting_key:
+            self.lighting_key = key
+            self.lighting = ambient_and_directional(self.sample(objects.positions))
+        return self.lighting
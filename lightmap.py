@@ -0,0 +1,236 @@
+"""Запечённое непрямое освещение стен (лайтмапы) с кэшем на диске
+
+Непрямой свет стен считается решением излучательности (radiosity.py):
+полная яркость патча минус прямая - прямой свет и так рисуется каждый
+кадр. Результат - по текстуре на стену; файл кэша называется хэшем всего,
+от чего он зависит (геометрия и цвета стен, объекты, параметры
+источников), поэтому совпавшее состояние грузится сразу, а запекание
+идёт только при промахе - по желанию в отдельном процессе, пока кадр
+рисуется без лайтмапов.
+
+Патчи есть только на стенах, объекты лишь заслоняют свет: матрица
+форм-факторов не растёт с числом объектов (растёт только цена лучей
+видимости).
+"""
+import hashlib
+import multiprocessing
+import os
+
+import numpy as np
+from OpenGL.GL import *
+
+from radiosity import CACHE_DIR, RadiositySolver
+
+
+# Меняется вместе с алгоритмом запекания - старые файлы кэша перестают подходить
+LIGHTMAP_FORMAT = 2
+
+
+def scene_hash(walls, wall_colors, objects, lights, resolution):
+    """Хэш состояния, от которого зависят лайтмапы"""
+    digest = hashlib.sha1()
+    digest.update(np.array([LIGHTMAP_FORMAT, resolution]).tobytes())
+    for name, vertices, normal in walls:
+        digest.update(name.encode())
+        digest.update(np.asarray(vertices, dtype=np.float64).tobytes())
+        digest.update(np.asarray(wall_colors[name], dtype=np.float64).tobytes())
+    for array in (objects.types, objects.positions, objects.scales, objects.colors):
+        digest.update(array.tobytes())
+    for array in (lights.positions, lights.diffuse, lights.radius, lights.enabled):
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def lightmap_path(key, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, f'lightmap_{key}.npz')
+
+
+def bake_lightmaps(walls, wall_colors, objects, lights, resolution=16, cache_dir=CACHE_DIR):
+    """Непрямой свет стен: {имя стены: массив (resolution + 1, resolution + 1, 3)}
+
+    Значения - в вершинах сетки патчей (строка - вдоль ребра v0-v3,
+    столбец - вдоль v0-v1), как тексели лайтмапа.
+    """
+    solver = RadiositySolver(wall_resolution=resolution, cache_dir=cache_dir,
+                             object_patches=False)
+    solver.sync(walls, objects)
+    albedo = solver.albedo(walls, wall_colors, objects)
+    direct = albedo * solver.direct_light(lights)
+    indirect = solver.solve(walls, wall_colors, objects, lights) - direct
+
+    maps = {}
+    for kind, index, rows, cols, start in solver.surfaces:
+        if kind != 'wall':
+            continue
+        patches = indirect[start:start + rows * cols].reshape(rows, cols, 3)
+        padded = np.pad(patches, ((1, 1), (1, 1), (0, 0)), mode='edge')
+        texels = (padded[:-1, :-1] + padded[1:, :-1] + padded[:-1, 1:] + padded[1:, 1:]) / 4.0
+        maps[walls[index][0]] = texels.transpose(1, 0, 2).astype(np.float32)
+    return maps
+
+
+def bake_to_file(key, walls, wall_colors, objects, lights, resolution, cache_dir):
+    """Запекание для процесса пула: пишет файл кэша и возвращает (ключ, лайтмапы)"""
+    maps = bake_lightmaps(walls, wall_colors, objects, lights, resolution, cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    path = lightmap_path(key, cache_dir)
+    # Сначала во временный файл: прерванное запекание не оставит битый кэш
+    temporary = path + '.tmp.npz'
+    np.savez_compressed(temporary, **maps)
+    os.replace(temporary, path)
+    return key, maps
+
+
+class Lightmaps:
+    """Текстуры лайтмапов стен, их загрузка из кэша и фоновое запекание.
+
+    update() вызывается каждый кадр: при смене состояния сцены лайтмапы
+    грузятся из файла кэша, а при промахе запекаются - сразу (background=False)
+    или процессом пула. Пока запекание не закончилось, ready() ложно и
+    стены рисуются без лайтмапов. Накладываются они поверх освещения
+    (GL_ADD) с координатами из texgen OBJECT_LINEAR - меши стен не меняются.
+    Если запекание упало (например, каталог кэша недоступен для записи),
+    ошибка печатается один раз и остаётся в error, новые запекания больше
+    не запускаются, а кэш по-прежнему читается.
+    """
+    def __init__(self, resolution=16, intensity=1.0, background=True, cache_dir=CACHE_DIR):
+        self.resolution = resolution
+        self.intensity = intensity
+        self.background = background
+        self.cache_dir = cache_dir
+
+        self.version = None
+        self.key = None           # Состояние сцены, для которого лайтмапы нужны
+        self.loaded_key = None    # Состояние, для которого загружены текстуры
+        self.baking_key = None
+        self.pending = None
+        self.pool = None
+        self.textures = {}        # имя стены -> текстура
+        self.planes = {}          # имя стены -> плоскости texgen (s, t)
+        self.bakes = 0
+        self.cache_hits = 0
+        self.error = None
+
+    def update(self, version, walls, wall_colors, objects, lights):
+        """Следит за состоянием сцены; version - версии объектов и источников"""
+        if self.pending is not None and self.pending.ready():
+            pending = self.pending
+            self.pending = None
+            self.baking_key = None
+            try:
+                key, maps = pending.get()
+            except Exception as error:
+                self.bake_failed(error)
+            else:
+                if key == self.key:
+                    self.upload(key, maps, walls)
+
+        if version != self.version:
+            self.version = version
+            self.key = scene_hash(walls, wall_colors, objects, lights, self.resolution)
+            path = lightmap_path(self.key, self.cache_dir)
+            if self.key != self.loaded_key and os.path.exists(path):
+                with np.load(path) as data:
+                    maps = {name: data[name] for name in data.files}
+                self.cache_hits += 1
+                self.upload(self.key, maps, walls)
+
+        if self.key == self.loaded_key or self.pending is not None or self.error is not None:
+            return
+        args = (self.key, walls, wall_colors, objects, lights, self.resolution, self.cache_dir)
+        self.bakes += 1
+        if not self.background:
+            try:
+                maps = bake_to_file(*args)[1]
+            except Exception as error:
+                self.bake_failed(error)
+            else:
+                self.upload(self.key, maps, walls)
+            return
+        if self.pool is None:
+            # spawn: процесс не наследует контекст OpenGL и обработчики SDL окна
+            self.pool = multiprocessing.get_context('spawn').Pool(1)
+        self.baking_key = self.key
+        self.pending = self.pool.apply_async(bake_to_file, args)
+
+    def bake_failed(self, error):
+        """Запоминает ошибку запекания: дальше стены рисуются без новых лайтмапов"""
+        self.error = error
+        print(f"Лайтмапы не запечены, стены рисуются без них: {error!r}")
+
+    @property
+    def baking(self):
+        return self.pending is not None
+
+    def ready(self):
+        """Загружены ли лайтмапы для текущего состояния сцены"""
+        return self.key is not None and self.key == self.loaded_key
+
+    def upload(self, key, maps, walls):
+        """Загружает лайтмапы в текстуры и строит плоскости texgen стен"""
+        for name, vertices, normal in walls:
+            texels = maps.get(name)
+            if texels is None:
+                continue
+            texture = self.textures.get(name)
+            if texture is None:
+                texture = self.textures[name] = glGenTextures(1)
+            height, width, _ = texels.shape
+            data = np.ascontiguousarray(np.clip(texels * self.intensity, 0.0, 1.0),
+                                        dtype=np.float32)
+            glBindTexture(GL_TEXTURE_2D, texture)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+            glTexImage2D(GL_TEXTURE_2D, 0, GL_RGB16F, width, height, 0, GL_RGB, GL_FLOAT, data)
+
+            # s = доля ребра v0-v1, t = доля ребра v0-v3, сжатые к центрам крайних текселей
+            v = np.asarray(vertices, dtype=np.float64)
+            planes = []
+            for edge, size in ((v[1] - v[0], width), (v[3] - v[0], height)):
+                scale = (size - 1) / size
+                axis = edge / edge.dot(edge) * scale
+                planes.append(np.append(axis, 0.5 / size - axis.dot(v[0])))
+            self.planes[name] = planes
+        glBindTexture(GL_TEXTURE_2D, 0)
+        self.loaded_key = key
+
+    def bind(self, gl, wall_name):
+        """Включает лайтмап стены; False, если его нет"""
+        texture = self.textures.get(wall_name)
+        if texture is None or not self.ready():
+            return False
+        glBindTexture(GL_TEXTURE_2D, texture)
+        glTexEnvi(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_ADD)
+        gl.enable(GL_TEXTURE_2D)
+        for coord, cap, plane in zip((GL_S, GL_T), (GL_TEXTURE_GEN_S, GL_TEXTURE_GEN_T),
+                                     self.planes[wall_name]):
+            glTexGeni(coord, GL_TEXTURE_GEN_MODE, GL_OBJECT_LINEAR)
+            glTexGenfv(coord, GL_OBJECT_PLANE, plane)
+            gl.enable(cap)
+        return True
+
+    def unbind(self, gl):
+        """Выключает лайтмап"""
+        gl.disable(GL_TEXTURE_GEN_S)
+        gl.disable(GL_TEXTURE_GEN_T)
+        gl.disable(GL_TEXTURE_2D)
+        glTexEnvi(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_MODULATE)
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+    def stop(self):
+        """Прерывает фоновое запекание"""
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+            self.pending = None
+            self.baking_key = None
+
+    def delete(self):
+        self.stop()
+        glDeleteTextures(list(self.textures.values()))
+        self.textures.clear()
+        self.planes.clear()
+        self.loaded_key = None
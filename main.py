@@ -1,14 +1,49 @@
+# headless - раньше OpenGL: по --headless выбирает платформу PyOpenGL
+from headless import HEADLESS_BACKENDS, HeadlessContext, parse_size
 import pygame
 from pygame.locals import *
 from OpenGL.GL import *
 from OpenGL.GLU import *
 import numpy as np
 import math
+import argparse
+import time
+
+from geometry import (create_cube_mesh, create_quad_mesh, SphereMeshCache, projected_radius,
+                      draw_cube_immediate, draw_sphere_immediate, draw_quad_immediate)
+from clustered import ClusteredLighting
+from culling import Frustum, FrustumCuller
+from deferred import GBuffer
+from gl_state import GLStateCache
+from glyph_atlas import GlyphAtlas
+from info_panel import InfoPanel
+from instancing import InstancedRenderer
+from irradiance import IrradianceGrid
+from lightmap import Lightmaps
+from pathtracer import TracerScene
+from probes import ProbeManager, PROBE_PROJECTION
+from profiler import AllocationTracker, PhaseTimer, summarize
+from radiosity import RadiositySolver
+from progressive import ProgressiveTracer
+from reflection import PlanarReflection
+from room import CornellRoom, camera_vectors
+from scheduler import FixedStepScheduler, FramePacer
+from shadows import ShadowMaps
+from timeline import TimelineRecorder
+from transparency import DepthSorter
+from transforms import (perspective_matrix, camera_view_matrix, plane_from_point_normal,
+                        reflection_matrix, to_gl)
 
 # Константы
 SCREEN_WIDTH = 1200
 SCREEN_HEIGHT = 800
 FPS = 60
+TICK_RATE = 120  # Тиков симуляции (ввод и движение) в секунду
+FOV_Y = 60  # Вертикальный угол обзора (градусы)
+Z_NEAR = 0.1
+Z_FAR = 100.0
+MAX_FIXED_LIGHTS = 8  # GL_LIGHT0..GL_LIGHT7
+PROFILER_FRAMES = 600  # Кадров в кольцевом буфере профайлера
 
 class Camera:
     """Класс камеры для свободного перемещения внутри комнаты"""
@@ -16,6 +51,11 @@ class Camera:
         # Позиция камеры ВНУТРИ комнаты
         self.position = np.array([0.0, 1.0, 2.0])  # Стартуем недалеко от входа
         
+        # Позиция на последнем и предпоследнем тике симуляции: position кадра
+        # интерполируется между ними (см. interpolate)
+        self.tick_position = self.position.copy()
+        self.previous_position = self.position.copy()
+        
         # Направление взгляда (вектор вперед)
         self.front = np.array([0.0, 0.0, -1.0])  # Смотрим вглубь комнаты
         
@@ -29,8 +69,8 @@ class Camera:
         # Чувствительность мыши
         self.mouse_sensitivity = 0.1
         
-        # Скорость перемещения
-        self.movement_speed = 0.1
+        # Скорость перемещения (единиц в секунду)
+        self.movement_speed = 6.0
         
         # Обновляем векторы камеры на основе углов
         self.update_camera_vectors()
@@ -47,22 +87,7 @@ class Camera:
     
     def update_camera_vectors(self):
         """Обновляет векторы камеры на основе углов Эйлера"""
-        # Вычисляем новый вектор front
-        front = np.array([
-            math.cos(math.radians(self.yaw)) * math.cos(math.radians(self.pitch)),
-            math.sin(math.radians(self.pitch)),
-            math.sin(math.radians(self.yaw)) * math.cos(math.radians(self.pitch))
-        ])
-        self.front = front / np.linalg.norm(front)  # Нормализуем
-        
-        # Вычисляем вектор right
-        world_up = np.array([0.0, 1.0, 0.0])
-        self.right = np.cross(self.front, world_up)
-        self.right = self.right / np.linalg.norm(self.right)
-        
-        # Пересчитываем вектор up
-        self.up = np.cross(self.right, self.front)
-        self.up = self.up / np.linalg.norm(self.up)
+        self.front, self.right, self.up = camera_vectors(self.yaw, self.pitch)
     
     def process_mouse_movement(self, xoffset, yoffset):
         """Обрабатывает движение мыши"""
@@ -78,28 +103,42 @@ class Camera:
         # Обновляем векторы камеры
         self.update_camera_vectors()
     
-    def process_keyboard(self):
-        """Обрабатывает нажатия клавиш для движения"""
-        velocity = self.movement_speed
+    def process_keyboard(self, dt):
+        """Тик симуляции: движение по нажатым клавишам за dt секунд"""
+        self.previous_position[:] = self.tick_position
+        position = self.tick_position
+        velocity = self.movement_speed * dt
         
         if self.keys_pressed[pygame.K_w]:  # Вперед
-            self.position += self.front * velocity
+            position += self.front * velocity
         if self.keys_pressed[pygame.K_s]:  # Назад
-            self.position -= self.front * velocity
+            position -= self.front * velocity
         if self.keys_pressed[pygame.K_a]:  # Влево
-            self.position -= self.right * velocity
+            position -= self.right * velocity
         if self.keys_pressed[pygame.K_d]:  # Вправо
-            self.position += self.right * velocity
+            position += self.right * velocity
         if self.keys_pressed[pygame.K_q]:  # Вверх
-            self.position += self.up * velocity
+            position += self.up * velocity
         if self.keys_pressed[pygame.K_e]:  # Вниз
-            self.position -= self.up * velocity
+            position -= self.up * velocity
             
         # Ограничиваем позицию камеры внутри комнаты (примерно)
         room_half = 2.3  # Половина размера комнаты минус небольшой запас
-        self.position[0] = max(-room_half, min(room_half, self.position[0]))
-        self.position[1] = max(-1.8, min(4.5, self.position[1]))  # Не выходим за пол и потолок
-        self.position[2] = max(-room_half, min(room_half, self.position[2]))
+        position[0] = max(-room_half, min(room_half, position[0]))
+        position[1] = max(-1.8, min(4.5, position[1]))  # Не выходим за пол и потолок
+        position[2] = max(-room_half, min(room_half, position[2]))
+    
+    def interpolate(self, alpha):
+        """Позиция кадра: доля alpha пути от предпоследнего тика к последнему"""
+        np.subtract(self.tick_position, self.previous_position, out=self.position)
+        self.position *= alpha
+        self.position += self.previous_position
+    
+    def place(self, position):
+        """Ставит камеру в position без интерполяции (сценарии, телепорт)"""
+        self.position[:] = position
+        self.tick_position[:] = position
+        self.previous_position[:] = position
     
     def get_view_matrix(self):
         """Возвращает матрицу вида для камеры"""
@@ -116,175 +155,197 @@ class Camera:
             self.keys_pressed[key] = state
 
 class CornellBoxApp:
-    def __init__(self):
+    # Сколько объектов перечислять на информационной панели
+    PANEL_MAX_OBJECTS = 10
+    
+    # Направления движения выбранного света
+    LIGHT_DIRECTIONS = {
+        'up': (0.0, 1.0, 0.0),
+        'down': (0.0, -1.0, 0.0),
+        'left': (-1.0, 0.0, 0.0),
+        'right': (1.0, 0.0, 0.0),
+        'forward': (0.0, 0.0, -1.0),
+        'backward': (0.0, 0.0, 1.0)
+    }
+    
+    def __init__(self, width=SCREEN_WIDTH, height=SCREEN_HEIGHT, headless=None):
+        # Размер кадра (окна или framebuffer без окна)
+        self.width = width
+        self.height = height
+        
         # Инициализация pygame
         pygame.init()
-        pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), 
-                                DOUBLEBUF | OPENGL)
-        pygame.display.set_caption("Корнуэльская комната - Компьютерная графика (WSAD + мышь)")
+        self.headless = None
+        if headless:
+            # Без окна: контекст EGL/OSMesa, кадр во framebuffer (см. headless.py);
+            # платформу PyOpenGL выбирает headless.select_platform до импорта OpenGL
+            self.headless = HeadlessContext(headless, width, height)
+        else:
+            pygame.display.set_mode((width, height), DOUBLEBUF | OPENGL)
+            pygame.display.set_caption("Корнуэльская комната - Компьютерная графика (WSAD + мышь)")
+            
+            # Скрываем курсор мыши
+            pygame.mouse.set_visible(False)
+            pygame.event.set_grab(True)  # Захватываем мышь
+        
+        # Информационные панели поверх сцены (без них кадр не зависит от FPS)
+        self.show_panels = True
+        
+        # Время фаз кадра (клавиша P или замеры, см. replay.py) и запись сценария камеры
+        self.profiler = PhaseTimer(sync=glFinish, capacity=PROFILER_FRAMES)
+        self.profiler_summary = None
+        self.allocation_summary = None
+        self.trace_frames = 300
+        self.recorder = None
         
-        # Скрываем курсор мыши
-        pygame.mouse.set_visible(False)
-        pygame.event.set_grab(True)  # Захватываем мышь
+        # Кэш состояния OpenGL: повторные glMaterial/glLight/glEnable не доходят до драйвера
+        self.gl = GLStateCache()
         
         # Настройка OpenGL
-        glEnable(GL_DEPTH_TEST)
+        self.gl.enable(GL_DEPTH_TEST)
         glClearColor(0.0, 0.0, 0.0, 1.0)  # Чёрный фон
         
         # Настройка проекции
         glMatrixMode(GL_PROJECTION)
-        gluPerspective(60, SCREEN_WIDTH / SCREEN_HEIGHT, 0.1, 100.0)
+        gluPerspective(FOV_Y, self.width / self.height, Z_NEAR, Z_FAR)
+        glMatrixMode(GL_MODELVIEW)
+        self.projection = perspective_matrix(FOV_Y, self.width / self.height, Z_NEAR, Z_FAR)
         
         # Инициализация камеры
         self.camera = Camera()
         
         # Флаги управления
         self.running = True
-        self.clock = pygame.time.Clock()
-        
-        # Цвета для разных стен (как в классической Корнуэльской комнате)
-        self.wall_colors = {
-            'left': [0.8, 0.2, 0.2, 1.0],    # Красная стена
-            'right': [0.2, 0.8, 0.2, 1.0],   # Зелёная стена  
-            'back': [0.8, 0.8, 0.8, 1.0],    # Белая задняя стена
-            'floor': [0.8, 0.8, 0.8, 1.0],   # Серый пол
-            'ceiling': [0.8, 0.8, 0.8, 1.0], # Серый потолок
-            'front': [0.5, 0.5, 0.5, 1.0]    # Серая передняя стена
-        }
+        # Ввод и движение - тиками фиксированной длины, кадры - в темпе FPS (0 - без ограничения)
+        self.scheduler = FixedStepScheduler(TICK_RATE)
+        self.pacer = FramePacer(FPS)
+        
+        # Данные сцены - стены, цвета, объекты, источники - строятся без OpenGL (room.py)
+        self.room = CornellRoom()
+        self.wall_colors = self.room.wall_colors
         
         # Параметры зеркальной стены (изначально - задняя стена)
-        self.mirror_wall = 'back'  # 'left', 'right', 'back', 'floor', 'ceiling'
-        self.mirror_enabled = False
+        self.mirror_wall = self.room.mirror_wall  # 'left', 'right', 'back', 'floor', 'ceiling'
+        self.mirror_enabled = self.room.mirror_enabled
+        
+        # Настоящее отражение в зеркальной стене (текстура с долей экранного разрешения)
+        self.planar_reflections = True
+        self.reflection_scale = 0.5
+        self.reflection = None
+        
+        # Источники света (хранятся массивами NumPy в LightStore) и стены комнаты
+        self.lights = self.room.lights
+        self.room_size = self.room.room_size
+        self.walls = self.room.walls
+        
+        # Геометрия в видеопамяти (False - старый immediate-режим glBegin/glEnd)
+        self.retained_geometry = True
+        self.cube_mesh = create_cube_mesh()
+        self.sphere_cache = SphereMeshCache()
+        self.wall_meshes = {
+            name: create_quad_mesh(vertices, normal)
+            for name, vertices, normal in self.walls
+        }
         
-        # ИСТОЧНИКИ СВЕТА (теперь их 3!)
-        self.lights = [
-            {
-                'id': 0,
-                'position': [0.0, 4.5, 0.0, 1.0],  # Основной свет (сверху)
-                'diffuse': [1.0, 1.0, 1.0, 1.0],
-                'ambient': [0.3, 0.3, 0.3, 1.0],
-                'specular': [1.0, 1.0, 1.0, 1.0],
-                'color': (1.0, 1.0, 0.0),  # Жёлтый
-                'enabled': True,
-                'movable': False  # Основной свет не двигается
-            },
-            {
-                'id': 1,
-                'position': [0.5, 3.0, -2.0, 1.0],  # Второй свет
-                'diffuse': [0.6, 0.8, 0.6, 1.0],  # Зелёноватый
-                'ambient': [0.1, 0.1, 0.1, 1.0],
-                'specular': [0.5, 0.6, 0.5, 1.0],
-                'color': (0.6, 1.0, 0.6),  # Светло-зелёный
-                'enabled': True,
-                'movable': True
-            },
-            {
-                'id': 2,
-                'position': [-1.5, 2.0, -1.5, 1.0],  # Третий свет (новый!)
-                'diffuse': [0.8, 0.6, 0.8, 1.0],  # Фиолетовый
-                'ambient': [0.1, 0.1, 0.1, 1.0],
-                'specular': [0.6, 0.5, 0.6, 1.0],
-                'color': (0.8, 0.6, 1.0),  # Фиолетовый
-                'enabled': True,
-                'movable': True
-            }
-        ]
+        # Освещение по фрагментам с кластерным списком источников (сотни источников)
+        self.clustered_lighting = False
+        self.clustered = None
+        self.clustered_active = False  # Программа освещения включена в текущем проходе
+        
+        # Отложенное освещение: проход геометрии в G-буфер, затем свет по пикселям
+        self.deferred_shading = False
+        self.gbuffer = None
+        self.gbuffer_active = False  # Идёт проход геометрии в G-буфер
+        
+        # Тени точечных источников: кубические карты расстояний, перерисовываются
+        # только после движения источника или изменения объектов рядом с ним
+        self.shadows = False
+        self.shadow_maps = None
+        
+        # Трассировка путей в фоне: кадр - среднее всех путей с последнего изменения
+        # камеры или сцены (разрешение - доля экранного)
+        self.path_tracing = False
+        self.path_tracer = None
+        self.path_trace_scale = 0.25
+        self.path_trace_exposure = 0.5  # Переотражения в закрытой комнате ярче прямого света
+        self.path_trace_denoise = True  # Фильтр à-trous по нормалям, albedo и расстоянию
+        self.path_trace_base = None  # (ключ геометрии, TracerScene без учёта камеры)
+        
+        # Излучательность: диффузные переотражения по патчам стен и объектов
+        # (форм-факторы кэшируются на диске, источники пересчитываются быстро)
+        self.radiosity = False
+        self.radiosity_solver = None
+        self.radiosity_exposure = 0.5
+        
+        # Запечённое непрямое освещение стен: из кэша на диске, при промахе - запекание
+        # в фоновом процессе (до его конца стены без лайтмапов). Источники без
+        # затухания переотражают много света, поэтому добавляется только его часть
+        self.lightmapping = True
+        self.lightmap_background = True
+        self.lightmap_intensity = 0.25
+        self.lightmaps = None
+        
+        # Сетка зондов освещённости (сферические гармоники): переотражённый свет для
+        # объектов одной выборкой в их центре; после сдвига источника зонды
+        # пересчитываются по нескольку за кадр
+        self.irradiance_probes = True
+        self.irradiance_intensity = 0.25
+        self.irradiance_grid = None
         
         # Текущий выбранный источник света (для управления)
         self.selected_light = 1  # Начинаем со второго света
         self.light_move_speed = 0.2
         
-        # Объекты в комнате
-        self.objects = []
+        # Объекты в комнате (структура массивов; version растёт при каждом изменении)
+        self.objects = self.room.objects
         
-        # Создаем тестовые объекты (все объекты БЕЗ спецэффектов по умолчанию)
-        self.create_test_objects()
+        # Инстансинг: все объекты одного типа одним вызовом (для больших сцен)
+        self.instanced_rendering = False
+        self.instanced = None
+        
+        # Кубические карты окружения для зеркальных объектов (не больше грани за кадр)
+        self.environment_probes = True
+        self.probes = None
+        
+        self.scene_view = np.identity(4)  # Матрица вида текущего прохода draw_scene
+        
+        # Прозрачные объекты рисуются от дальнего к ближнему (свой кэш порядка на проход)
+        self.depth_sorting = True
+        self.depth_sorters = {}
+        
+        # Отсечение невидимых объектов по пирамиде камеры (BVH над боксами объектов)
+        self.frustum_culling = True
+        self.culler = FrustumCuller()
         
         # Шрифт для текста
         pygame.font.init()
         self.font = pygame.font.SysFont('Arial', 13)
         self.small_font = pygame.font.SysFont('Arial', 11)
         
+        # Атлас глифов обоих шрифтов (растеризуется один раз)
+        self.glyph_atlas = GlyphAtlas([self.font, self.small_font])
+        
+        # Информационная панель из квадов атласа (УВЕЛИЧЕННАЯ для новой информации)
+        self.info_panel = InfoPanel(self.glyph_atlas, 550, 650)
+        self.stats_panel = InfoPanel(self.glyph_atlas, 330, 366)
+        self.profiler_panel = InfoPanel(self.glyph_atlas, 330, 80)
+        
         # Счетчик FPS
         self.frame_count = 0
         self.fps = 0
         self.last_time = pygame.time.get_ticks()
     
-    def create_test_objects(self):
-        """Создаем тестовые объекты в комнате (ВСЕ объекты без спецэффектов по умолчанию!)"""
-        # 1. Жёлтый куб - ПРАВЫЙ ПЕРЕДНИЙ УГОЛ
-        self.objects.append({
-            'id': 0,
-            'type': 'cube',
-            'position': [1.2, -1.5, -1.0],
-            'scale': [0.5, 0.5, 0.5],
-            'color': [0.9, 0.9, 0.0, 1.0],
-            'mirror': False,
-            'transparent': False,
-            'shininess': 50.0
-        })
-        
-        # 2. Синяя сфера - ЛЕВЫЙ СРЕДНИЙ ПЛАН
-        self.objects.append({
-            'id': 1,
-            'type': 'sphere',
-            'position': [-1.2, -1.0, -1.5],
-            'scale': [0.4, 0.4, 0.4],
-            'color': [0.2, 0.4, 0.9, 1.0],
-            'mirror': False,
-            'transparent': False,
-            'shininess': 100.0
-        })
-        
-        # 3. Красный КУБ (НЕПРОЗРАЧНЫЙ по умолчанию!)
-        self.objects.append({
-            'id': 2,
-            'type': 'cube',
-            'position': [0.0, -1.2, -2.0],
-            'scale': [0.5, 0.5, 0.5],
-            'color': [0.9, 0.3, 0.3, 1.0],  # Альфа = 1.0 (непрозрачный)
-            'mirror': False,
-            'transparent': False,  # НЕ прозрачный по умолчанию
-            'shininess': 30.0
-        })
-        
-        # 4. Зелёная сфера (НЕЗЕРКАЛЬНАЯ по умолчанию!)
-        self.objects.append({
-            'id': 3,
-            'type': 'sphere',
-            'position': [0.8, -0.3, -2.2],
-            'scale': [0.4, 0.4, 0.4],
-            'color': [0.2, 1.0, 0.2, 1.0],
-            'mirror': False,  # НЕ зеркальная по умолчанию
-            'transparent': False,
-            'shininess': 50.0
-        })
-        
-        # 5. Фиолетовая сфера
-        self.objects.append({
-            'id': 4,
-            'type': 'sphere',
-            'position': [-1.0, -1.5, -0.8],
-            'scale': [0.3, 0.3, 0.3],
-            'color': [0.9, 0.2, 0.9, 1.0],
-            'mirror': False,
-            'transparent': False,
-            'shininess': 75.0
-        })
+    def create_stress_objects(self, count, seed=0):
+        """Добавляет в комнату count случайных маленьких кубов и сфер (стресс-сцена)"""
+        self.room.create_stress_objects(count, seed)
     
     def toggle_mirror(self, obj_index):
-        """Включает/выключает зеркальность для объекта"""
-        if 0 <= obj_index < len(self.objects):
-            self.objects[obj_index]['mirror'] = not self.objects[obj_index]['mirror']
+        """Включает/выключает зеркальность для объекта (или диапазона объектов)"""
+        self.objects.toggle_mirror(obj_index)
     
     def toggle_transparency(self, obj_index):
-        """Включает/выключает прозрачность для объекта"""
-        if 0 <= obj_index < len(self.objects):
-            self.objects[obj_index]['transparent'] = not self.objects[obj_index]['transparent']
-            if self.objects[obj_index]['transparent']:
-                self.objects[obj_index]['color'][3] = 0.6
-            else:
-                self.objects[obj_index]['color'][3] = 1.0
+        """Включает/выключает прозрачность для объекта (или диапазона объектов)"""
+        self.objects.toggle_transparency(obj_index)
     
     def toggle_mirror_wall(self):
         """Переключает зеркальную стену"""
@@ -296,6 +357,79 @@ class CornellBoxApp:
         """Включает/выключает зеркальную стену"""
         self.mirror_enabled = not self.mirror_enabled
     
+    def create_stress_lights(self, count, seed=0):
+        """Добавляет count неподвижных точечных источников с ограниченным радиусом"""
+        self.room.create_stress_lights(count, seed)
+    
+    def toggle_clustered_lighting(self):
+        """Переключает кластерное освещение и фиксированный конвейер"""
+        self.clustered_lighting = not self.clustered_lighting
+    
+    def toggle_shadows(self):
+        """Включает/выключает тени (освещение при этом идёт по пикселям)"""
+        self.shadows = not self.shadows
+    
+    def toggle_path_tracing(self):
+        """Включает/выключает трассировку путей (при выключении процессы останавливаются)"""
+        self.path_tracing = not self.path_tracing
+        if not self.path_tracing and self.path_tracer is not None:
+            self.path_tracer.stop()
+            self.path_tracer = None
+    
+    def toggle_path_trace_denoise(self):
+        """Включает/выключает шумоподавление трассировки (со следующего прохода)"""
+        self.path_trace_denoise = not self.path_trace_denoise
+    
+    def toggle_radiosity(self):
+        """Переключает вид излучательности и обычное освещение"""
+        self.radiosity = not self.radiosity
+    
+    def toggle_lightmaps(self):
+        """Включает/выключает лайтмапы стен"""
+        self.lightmapping = not self.lightmapping
+    
+    def toggle_irradiance_probes(self):
+        """Включает/выключает переотражённый свет объектов из сетки зондов"""
+        self.irradiance_probes = not self.irradiance_probes
+    
+    def toggle_profiler(self):
+        """Включает/выключает замер фаз кадра и график времени кадров"""
+        self.profiler.enabled = not self.profiler.enabled
+        self.profiler.clear()
+        self.profiler_summary = None
+        print(f"Профайлер кадра: {'ВКЛ' if self.profiler.enabled else 'ВЫКЛ'}")
+        # Подсчёт выделений идёт по фазам профайлера и без него не нужен
+        if not self.profiler.enabled and self.profiler.allocations is not None:
+            self.toggle_allocation_tracking()
+    
+    def toggle_allocation_tracking(self):
+        """Включает/выключает подсчёт выделений памяти по фазам (с профайлером кадра)
+        
+        При выключении печатает средние на кадр по фазам.
+        """
+        profiler = self.profiler
+        if profiler.allocations is None:
+            if not profiler.enabled:
+                self.toggle_profiler()
+            profiler.allocations = AllocationTracker()
+            profiler.allocations.start()
+            print("Подсчёт выделений памяти: ВКЛ")
+        else:
+            tracker = profiler.allocations
+            tracker.stop()
+            profiler.allocations = None
+            self.allocation_summary = None
+            print("\n".join(tracker.report_lines()))
+    
+    def dump_trace(self):
+        """Записывает последние trace_frames кадров трассой Chrome/Perfetto в текущую папку"""
+        if self.profiler.count == 0:
+            print("Трасса не записана: профайлер кадра выключен (P)")
+            return
+        path = time.strftime('trace_%Y%m%d_%H%M%S.json')
+        frames = self.profiler.save_chrome_trace(path, self.trace_frames)
+        print(f"Трасса {frames} кадров: {path}")
+    
     def toggle_light_enabled(self, light_index):
         """Включает/выключает источник света"""
         if 0 <= light_index < len(self.lights):
@@ -303,131 +437,127 @@ class CornellBoxApp:
     
     def select_next_light(self):
         """Переключает на следующий источник света для управления"""
-        movable_lights = [i for i, light in enumerate(self.lights) if light['movable']]
+        movable_lights = np.flatnonzero(self.lights.movable).tolist()
         if movable_lights:
             current_index = movable_lights.index(self.selected_light)
             self.selected_light = movable_lights[(current_index + 1) % len(movable_lights)]
     
     def move_selected_light(self, direction):
         """Перемещает выбранный источник света"""
-        light = self.lights[self.selected_light]
-        if not light['movable']:
+        if not self.lights.movable[self.selected_light]:
             return
         
-        if direction == 'up':
-            light['position'][1] += self.light_move_speed
-        elif direction == 'down':
-            light['position'][1] -= self.light_move_speed
-        elif direction == 'left':
-            light['position'][0] -= self.light_move_speed
-        elif direction == 'right':
-            light['position'][0] += self.light_move_speed
-        elif direction == 'forward':
-            light['position'][2] -= self.light_move_speed
-        elif direction == 'backward':
-            light['position'][2] += self.light_move_speed
+        delta = self.LIGHT_DIRECTIONS.get(direction)
+        if delta is None:
+            return
+        self.lights.move(self.selected_light, np.multiply(delta, self.light_move_speed))
         
         # Ограничиваем позицию внутри комнаты
         room_half = 2.0
-        light['position'][0] = max(-room_half, min(room_half, light['position'][0]))
-        light['position'][1] = max(0.5, min(4.5, light['position'][1]))
-        light['position'][2] = max(-room_half, min(room_half, light['position'][2]))
+        self.lights.clamp_positions([-room_half, 0.5, -room_half], [room_half, 4.5, room_half],
+                                    index=self.selected_light)
     
-    def create_wall(self, vertices, color, normal=None, wall_name=''):
+    def create_wall(self, vertices, color, normal=None, wall_name='', reflective=True):
         """Создаёт одну стену комнаты с возможностью зеркальности"""
         is_mirror_wall = (wall_name == self.mirror_wall and self.mirror_enabled)
         
-        if normal:
-            glNormal3fv(normal)
+        if is_mirror_wall and reflective and self.reflection_ready():
+            # Отражённая сцена, слегка затемнённая цветом стекла
+            self.pause_clustered()
+            self.gl.disable(GL_LIGHTING)
+            glColor4f(0.85, 0.85, 0.9, 1.0)
+            self.reflection.bind(self.gl, self.projection)
+            if self.retained_geometry and wall_name in self.wall_meshes:
+                self.wall_meshes[wall_name].draw()
+            else:
+                draw_quad_immediate(vertices, normal)
+            self.reflection.unbind(self.gl)
+            self.gl.enable(GL_LIGHTING)
+            self.resume_clustered()
+            return
         
         if is_mirror_wall:
             # Для зеркальной стены - максимальный блеск
-            glMaterialfv(GL_FRONT, GL_DIFFUSE, [0.1, 0.1, 0.15, 0.9])
-            glMaterialfv(GL_FRONT, GL_AMBIENT, [0.05, 0.05, 0.1, 1.0])
-            glMaterialfv(GL_FRONT, GL_SPECULAR, [0.9, 0.9, 0.95, 1.0])
-            glMaterialf(GL_FRONT, GL_SHININESS, 128.0)
+            self.gl.material(GL_FRONT, GL_DIFFUSE, [0.1, 0.1, 0.15, 0.9])
+            self.gl.material(GL_FRONT, GL_AMBIENT, [0.05, 0.05, 0.1, 1.0])
+            self.gl.material(GL_FRONT, GL_SPECULAR, [0.9, 0.9, 0.95, 1.0])
+            self.gl.material(GL_FRONT, GL_SHININESS, 128.0)
             glColor4f(0.15, 0.15, 0.25, 0.8)
         else:
             # Обычная стена
-            glMaterialfv(GL_FRONT, GL_DIFFUSE, color)
-            glMaterialfv(GL_FRONT, GL_AMBIENT, [c * 0.2 for c in color[:3]] + [1.0])
-            glMaterialfv(GL_FRONT, GL_SPECULAR, [0.1, 0.1, 0.1, 1.0])
-            glMaterialf(GL_FRONT, GL_SHININESS, 10.0)
+            self.gl.material(GL_FRONT, GL_DIFFUSE, color)
+            self.gl.material(GL_FRONT, GL_AMBIENT, [c * 0.2 for c in color[:3]] + [1.0])
+            self.gl.material(GL_FRONT, GL_SPECULAR, [0.1, 0.1, 0.1, 1.0])
+            self.gl.material(GL_FRONT, GL_SHININESS, 10.0)
             glColor3fv(color[:3])
         
-        glBegin(GL_QUADS)
-        for vertex in vertices:
-            glVertex3fv(vertex)
-        glEnd()
+        # Лайтмап добавляется к освещению фиксированного конвейера (шейдеры его не читают)
+        lightmapped = (not is_mirror_wall and self.lightmapping and self.lightmaps is not None
+                       and not self.clustered_active and self.lightmaps.bind(self.gl, wall_name))
+        
+        if self.retained_geometry and wall_name in self.wall_meshes:
+            self.wall_meshes[wall_name].draw()
+        else:
+            draw_quad_immediate(vertices, normal)
+        
+        if lightmapped:
+            self.lightmaps.unbind(self.gl)
     
-    def draw_cube(self, obj):
-        """Рисует куб с учетом его свойств"""
-        pos = obj['position']
-        scale = obj['scale']
+    def set_object_material(self, obj):
+        """Материал объекта (зеркальный или обычный) и режим прозрачности"""
         color = obj['color']
         
-        glPushMatrix()
-        glTranslatef(pos[0], pos[1], pos[2])
-        glScalef(scale[0], scale[1], scale[2])
-        
-        # Настраиваем свойства материала
         if obj['mirror']:
-            glMaterialfv(GL_FRONT, GL_DIFFUSE, [0.1, 0.1, 0.1, color[3]])
-            glMaterialfv(GL_FRONT, GL_AMBIENT, [0.1, 0.1, 0.1, color[3]])
-            glMaterialfv(GL_FRONT, GL_SPECULAR, [0.9, 0.9, 0.9, color[3]])
-            glMaterialf(GL_FRONT, GL_SHININESS, min(obj['shininess'], 128.0))
+            self.gl.material(GL_FRONT, GL_DIFFUSE, [0.1, 0.1, 0.1, color[3]])
+            self.gl.material(GL_FRONT, GL_AMBIENT, [0.1, 0.1, 0.1, color[3]])
+            self.gl.material(GL_FRONT, GL_SPECULAR, [0.9, 0.9, 0.9, color[3]])
+            self.gl.material(GL_FRONT, GL_SHININESS, min(obj['shininess'], 128.0))
             glColor4f(0.7, 0.7, 0.7, color[3])
         else:
-            glMaterialfv(GL_FRONT, GL_DIFFUSE, color)
-            glMaterialfv(GL_FRONT, GL_AMBIENT, [c * 0.3 for c in color[:3]] + [color[3]])
-            glMaterialfv(GL_FRONT, GL_SPECULAR, [0.3, 0.3, 0.3, color[3]])
-            glMaterialf(GL_FRONT, GL_SHININESS, min(obj['shininess'], 128.0))
+            self.gl.material(GL_FRONT, GL_DIFFUSE, color)
+            self.gl.material(GL_FRONT, GL_AMBIENT, [c * 0.3 for c in color[:3]] + [color[3]])
+            self.gl.material(GL_FRONT, GL_SPECULAR, [0.3, 0.3, 0.3, color[3]])
+            self.gl.material(GL_FRONT, GL_SHININESS, min(obj['shininess'], 128.0))
             glColor4fv(color)
         
         # Если объект прозрачный
         if obj['transparent']:
-            glEnable(GL_BLEND)
-            glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
-            glDepthMask(GL_FALSE)
+            self.gl.enable(GL_BLEND)
+            self.gl.blend_func(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+            self.gl.depth_mask(False)
         else:
-            glDisable(GL_BLEND)
-            glDepthMask(GL_TRUE)
+            self.gl.disable(GL_BLEND)
+            self.gl.depth_mask(True)
+    
+    def draw_cube(self, obj, reflective=True):
+        """Рисует куб с учетом его свойств"""
+        pos = obj['position']
+        scale = obj['scale']
+        color = obj['color']
+        
+        glPushMatrix()
+        glTranslatef(pos[0], pos[1], pos[2])
+        glScalef(scale[0], scale[1], scale[2])
+        
+        # Настраиваем свойства материала и прозрачность
+        self.set_object_material(obj)
+        probe = self.bind_environment(obj) if reflective else None
         
         # Рисуем куб
-        glBegin(GL_QUADS)
-        # Передняя грань
-        glNormal3f(0, 0, 1)
-        glVertex3f(-1, -1, 1); glVertex3f(1, -1, 1)
-        glVertex3f(1, 1, 1); glVertex3f(-1, 1, 1)
-        # Задняя грань
-        glNormal3f(0, 0, -1)
-        glVertex3f(-1, -1, -1); glVertex3f(-1, 1, -1)
-        glVertex3f(1, 1, -1); glVertex3f(1, -1, -1)
-        # Верхняя грань
-        glNormal3f(0, 1, 0)
-        glVertex3f(-1, 1, -1); glVertex3f(-1, 1, 1)
-        glVertex3f(1, 1, 1); glVertex3f(1, 1, -1)
-        # Нижняя грань
-        glNormal3f(0, -1, 0)
-        glVertex3f(-1, -1, -1); glVertex3f(1, -1, -1)
-        glVertex3f(1, -1, 1); glVertex3f(-1, -1, 1)
-        # Правая грань
-        glNormal3f(1, 0, 0)
-        glVertex3f(1, -1, -1); glVertex3f(1, 1, -1)
-        glVertex3f(1, 1, 1); glVertex3f(1, -1, 1)
-        # Левая грань
-        glNormal3f(-1, 0, 0)
-        glVertex3f(-1, -1, -1); glVertex3f(-1, -1, 1)
-        glVertex3f(-1, 1, 1); glVertex3f(-1, 1, -1)
-        glEnd()
+        if self.retained_geometry:
+            self.cube_mesh.draw()
+        else:
+            draw_cube_immediate()
         
         # Восстанавливаем настройки
-        glDisable(GL_BLEND)
-        glDepthMask(GL_TRUE)
+        if probe is not None:
+            self.unbind_environment(probe)
+        self.gl.disable(GL_BLEND)
+        self.gl.depth_mask(True)
         glPopMatrix()
     
-    def draw_sphere(self, obj, slices=16, stacks=16):
-        """Рисует сферу с учетом её свойств"""
+    def draw_sphere(self, obj, slices=None, stacks=None, reflective=True):
+        """Рисует сферу с учетом её свойств (без slices/stacks - детализация по LOD)"""
         pos = obj['position']
         scale = obj['scale']
         color = obj['color']
@@ -436,254 +566,677 @@ class CornellBoxApp:
         glTranslatef(pos[0], pos[1], pos[2])
         glScalef(scale[0], scale[1], scale[2])
         
-        # Настраиваем свойства материала
-        if obj['mirror']:
-            glMaterialfv(GL_FRONT, GL_DIFFUSE, [0.1, 0.1, 0.1, color[3]])
-            glMaterialfv(GL_FRONT, GL_AMBIENT, [0.1, 0.1, 0.1, color[3]])
-            glMaterialfv(GL_FRONT, GL_SPECULAR, [0.9, 0.9, 0.9, color[3]])
-            glMaterialf(GL_FRONT, GL_SHININESS, min(obj['shininess'], 128.0))
-            glColor4f(0.7, 0.7, 0.7, color[3])
-        else:
-            glMaterialfv(GL_FRONT, GL_DIFFUSE, color)
-            glMaterialfv(GL_FRONT, GL_AMBIENT, [c * 0.3 for c in color[:3]] + [color[3]])
-            glMaterialfv(GL_FRONT, GL_SPECULAR, [0.3, 0.3, 0.3, color[3]])
-            glMaterialf(GL_FRONT, GL_SHININESS, min(obj['shininess'], 128.0))
-            glColor4fv(color)
-        
-        # Если объект прозрачный
-        if obj['transparent']:
-            glEnable(GL_BLEND)
-            glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
-            glDepthMask(GL_FALSE)
-        else:
-            glDisable(GL_BLEND)
-            glDepthMask(GL_TRUE)
+        # Настраиваем свойства материала и прозрачность
+        self.set_object_material(obj)
+        probe = self.bind_environment(obj) if reflective else None
         
         # Рисуем сферу
-        for i in range(stacks):
-            lat0 = math.pi * (-0.5 + float(i) / stacks)
-            z0 = math.sin(lat0)
-            zr0 = math.cos(lat0)
-            
-            lat1 = math.pi * (-0.5 + float(i + 1) / stacks)
-            z1 = math.sin(lat1)
-            zr1 = math.cos(lat1)
-            
-            glBegin(GL_QUAD_STRIP)
-            for j in range(slices + 1):
-                lng = 2 * math.pi * float(j) / slices
-                x = math.cos(lng)
-                y = math.sin(lng)
-                
-                glNormal3f(x * zr0, y * zr0, z0)
-                glVertex3f(x * zr0, y * zr0, z0)
-                
-                glNormal3f(x * zr1, y * zr1, z1)
-                glVertex3f(x * zr1, y * zr1, z1)
-            glEnd()
+        if slices is None or stacks is None:
+            slices, stacks = self.sphere_lod(obj)
+        if self.retained_geometry:
+            self.sphere_cache.get(slices, stacks).draw()
+        else:
+            draw_sphere_immediate(slices, stacks)
         
         # Восстанавливаем настройки
-        glDisable(GL_BLEND)
-        glDepthMask(GL_TRUE)
+        if probe is not None:
+            self.unbind_environment(probe)
+        self.gl.disable(GL_BLEND)
+        self.gl.depth_mask(True)
         glPopMatrix()
     
-    def draw_cornell_box(self):
-        """Рисуем корнуэльскую комнату изнутри"""
-        room_size = 5.0
-        
-        # ВКЛЮЧАЕМ ОСВЕЩЕНИЕ
-        glEnable(GL_LIGHTING)
-        
-        # Настраиваем модель освещения
-        glLightModeli(GL_LIGHT_MODEL_LOCAL_VIEWER, GL_TRUE)
+    def sphere_lod(self, obj):
+        """Детализация сферы (slices, stacks) по её размеру на экране"""
+        radius = max(obj['scale'])
+        radius_pixels = projected_radius(obj['position'], radius, self.camera.position,
+                                         FOV_Y, self.height)
+        return self.sphere_cache.select_level(radius_pixels)
+    
+    def toggle_frustum_culling(self):
+        """Включает/выключает отсечение по пирамиде видимости"""
+        self.frustum_culling = not self.frustum_culling
+    
+    def visible_objects(self, frustum=None):
+        """Номера объектов, попадающих в пирамиду видимости (по умолчанию - камеры)"""
+        if not self.frustum_culling:
+            self.culler.drawn = len(self.objects)
+            self.culler.culled = 0
+            return np.arange(len(self.objects))
+        
+        if frustum is None:
+            frustum = Frustum.from_camera(self.camera, FOV_Y, self.width / self.height,
+                                          Z_NEAR, Z_FAR)
+        return self.culler.visible(self.objects, frustum)
+    
+    def draw_object(self, obj, reflective=True):
+        """Рисует объект по его типу"""
+        irradiance_light = self.bind_irradiance(obj)
+        if obj['type'] == 'cube':
+            self.draw_cube(obj, reflective=reflective)
+        elif obj['type'] == 'sphere':
+            self.draw_sphere(obj, reflective=reflective)
+        if irradiance_light is not None:
+            self.gl.disable(irradiance_light)
+    
+    def bind_irradiance(self, obj):
+        """Переотражённый свет сетки зондов для объекта: источник GL в первом
+        свободном слоте (фон + направленный свет, см. ambient_and_directional)
+        
+        Возвращает включённый источник или None, если зондов нет, идёт
+        освещение шейдером или все слоты фиксированного конвейера заняты.
+        """
+        slot = len(self.lights)
+        if (not self.irradiance_probes or self.irradiance_grid is None or
+                self.clustered_active or slot >= MAX_FIXED_LIGHTS):
+            return None
+        ambient, directions, directional = self.irradiance_grid.object_lighting(self.objects)
+        i = obj['id']
+        # Материал отражает albedo / pi освещённости; фон умножается на GL_AMBIENT
+        # материала (у обычных объектов это 0.3 от цвета, у зеркал - столько же, сколько GL_DIFFUSE)
+        scale = self.irradiance_intensity / math.pi
+        ambient_scale = scale if obj['mirror'] else scale / 0.3
+        light = GL_LIGHT0 + slot
+        self.gl.light(light, GL_POSITION, list(directions[i]) + [0.0])
+        self.gl.light(light, GL_AMBIENT, list(ambient[i] * ambient_scale) + [1.0])
+        self.gl.light(light, GL_DIFFUSE, list(directional[i] * scale) + [1.0])
+        self.gl.light(light, GL_SPECULAR, [0.0, 0.0, 0.0, 1.0])
+        self.gl.enable(light)
+        return light
+    
+    def bind_environment(self, obj):
+        """Включает отражение окружения для зеркального объекта с готовым зондом"""
+        if not (obj['mirror'] and self.environment_probes and self.probes is not None):
+            return None
+        probe = self.probes.ready_probe(obj['id'])
+        if probe is None:
+            return None
+        
+        # Окружение заменяет освещение: тёмный материал зеркала дал бы почти чёрный цвет
+        self.pause_clustered()
+        self.gl.disable(GL_LIGHTING)
+        glColor4f(0.9, 0.9, 0.9, obj['color'][3])
+        rotation_inverse = np.identity(4)
+        rotation_inverse[:3, :3] = self.scene_view[:3, :3].T
+        self.probes.bind(self.gl, probe, to_gl(rotation_inverse))
+        return probe
+    
+    def unbind_environment(self, probe):
+        """Выключает отражение окружения после bind_environment"""
+        self.probes.unbind(self.gl)
+        self.gl.enable(GL_LIGHTING)
+        self.resume_clustered()
+    
+    def probe_objects(self, visible):
+        """Видимые объекты, которые рисуются с отражением окружения"""
+        if not (self.environment_probes and self.probes is not None):
+            return visible[:0]
+        ready = [i for i in self.probes.probes if self.probes.ready_probe(i) is not None]
+        return visible[np.isin(visible, ready)]
+    
+    def update_probes(self):
+        """Заводит зонды для зеркальных объектов и обновляет не больше одной грани"""
+        if not self.environment_probes:
+            return
+        if self.probes is None:
+            if not self.objects.mirror.any():
+                return
+            self.probes = ProbeManager()
+        self.probes.sync(self.objects, self.lights,
+                         (self.mirror_wall, self.mirror_enabled, self.shadows,
+                          self.lightmap_key(), self.irradiance_key()))
+        self.probes.update(self.render_probe_face)
+    
+    def update_shadows(self):
+        """Перерисовывает устаревшие карты теней (обычно ни одной)"""
+        if not self.shadows:
+            return
+        if self.shadow_maps is None:
+            self.shadow_maps = ShadowMaps()
+        self.shadow_maps.sync(self.objects, self.lights)
+        self.shadow_maps.update(self.render_shadow_casters)
+    
+    def render_shadow_casters(self):
+        """Все объекты программой расстояния (для граней карты теней)
+        
+        Стены тень не отбрасывают: основной и зелёный источники висят выше
+        потолка и светят сквозь него, как и без теней.
+        """
+        self.gl.disable(GL_BLEND)
+        self.gl.depth_mask(True)
+        if self.instanced_rendering:
+            self.draw_objects_instanced(stage='shadow')
+            return
+        for obj_type, mesh in (('cube', self.cube_mesh),
+                               ('sphere', self.sphere_cache.get(16, 16))):
+            for i in np.flatnonzero(self.objects.type_mask(obj_type)):
+                glPushMatrix()
+                glTranslatef(*self.objects.positions[i])
+                glScalef(*self.objects.scales[i])
+                mesh.draw()
+                glPopMatrix()
+    
+    def render_probe_face(self, probe, face, projection, view):
+        """Рисует сцену из центра зонда (framebuffer грани уже привязан)"""
+        glMatrixMode(GL_PROJECTION)
+        glPushMatrix()
+        glLoadMatrixf(to_gl(projection))
+        glMatrixMode(GL_MODELVIEW)
+        glPushMatrix()
+        glLoadMatrixf(to_gl(view))
         
-        # Включаем все источники света
-        for i, light in enumerate(self.lights):
-            if light['enabled']:
-                glEnable(GL_LIGHT0 + i)
-                
-                # Настраиваем источник света
-                glLightfv(GL_LIGHT0 + i, GL_POSITION, light['position'])
-                glLightfv(GL_LIGHT0 + i, GL_DIFFUSE, light['diffuse'])
-                glLightfv(GL_LIGHT0 + i, GL_AMBIENT, light['ambient'])
-                glLightfv(GL_LIGHT0 + i, GL_SPECULAR, light['specular'])
-            else:
-                glDisable(GL_LIGHT0 + i)
+        self.draw_scene(('probe', probe.index, face, probe.key[2]),
+                        Frustum.from_matrix(projection @ view),
+                        exclude=probe.index, reflective=False, view=view,
+                        projection=PROBE_PROJECTION, pass_key=('probe', probe.index, face))
         
-        # Включаем нормализацию
-        glEnable(GL_NORMALIZE)
+        glPopMatrix()
+        glMatrixMode(GL_PROJECTION)
+        glPopMatrix()
+        glMatrixMode(GL_MODELVIEW)
+    
+    def sorted_transparent(self, indices, pass_key):
+        """Прозрачные объекты indices от дальнего к ближнему для текущей матрицы вида"""
+        if not self.depth_sorting:
+            return indices
+        sorter = self.depth_sorters.get(pass_key)
+        if sorter is None:
+            sorter = self.depth_sorters[pass_key] = DepthSorter()
+        rotation = self.scene_view[:3, :3]
+        eye = -rotation.T @ self.scene_view[:3, 3]
+        front = -rotation[2]
+        return sorter.sort(self.objects, indices, eye, front)
+    
+    def draw_objects_instanced(self, visible=None, individual=None, transparent_order=None,
+                               stage='all'):
+        """Рисует объекты инстансингом: по одному вызову на тип и проход
+        
+        individual - номера объектов, которые рисуются отдельно (с отражением окружения);
+        transparent_order - видимые прозрачные объекты от дальнего к ближнему;
+        stage - 'geometry' рисует только непрозрачные экземпляры (G-буфер),
+        'forward' - всё остальное, 'all' - всё, 'shadow' - все объекты без
+        отсечения программой расстояния (карта теней).
+        """
+        if self.instanced is None:
+            self.instanced = InstancedRenderer({
+                'cube': self.cube_mesh,
+                'sphere': self.sphere_cache.get(16, 16)
+            })
+        
+        # Экземпляры лежат в буферах в порядке листьев BVH: видимые объекты
+        # идут подряд и рисуются немногими диапазонами
+        layout = None
+        if self.frustum_culling:
+            self.culler.sync(self.objects)
+            layout = self.culler.bvh.order
+        
+        if stage == 'shadow':
+            self.instanced.update(self.objects, layout)
+            for transparent in (False, True):
+                self.instanced.draw(transparent, [], program=self.shadow_maps.use(instanced=True))
+            self.shadow_maps.use()
+            return
         
-        # Вершины комнаты
-        half_size = room_size / 2.0
+        if individual is None:
+            individual = np.empty(0, dtype=np.int64)
+        if transparent_order is not None:
+            # Отдельные прозрачные объекты рисуются между сериями экземпляров:
+            # cuts - их места в оставшемся порядке
+            separate = np.isin(transparent_order, individual)
+            individual_order = transparent_order[separate]
+            cuts = np.flatnonzero(separate) - np.arange(len(individual_order))
+            transparent_order = transparent_order[~separate]
+        else:
+            individual_order = individual[self.objects.transparent[individual]]
+        
+        # Буферы экземпляров перезагружаются только после изменения объектов
+        # (и порядка прозрачных при сортировке), отсечение задаёт лишь маску
+        self.instanced.update(self.objects, layout, transparent_order)
+        light_enabled = self.lights.enabled.tolist()
+        selected = None
+        if visible is not None:
+            selected = np.zeros(len(self.objects), dtype=bool)
+            selected[visible] = True
+            selected[individual] = False
+        
+        if stage != 'forward':
+            self.draw_instance_pass(False, light_enabled, selected)
+        if stage == 'geometry':
+            return
         
-        # Задняя стена
-        back_wall = [
-            [-half_size, -half_size, -half_size],
-            [half_size, -half_size, -half_size],
-            [half_size, half_size, -half_size],
-            [-half_size, half_size, -half_size]
-        ]
+        for i in individual[~self.objects.transparent[individual]]:
+            self.draw_object(self.objects[i])
         
-        # Пол
-        floor = [
-            [-half_size, -half_size, half_size],
-            [half_size, -half_size, half_size],
-            [half_size, -half_size, -half_size],
-            [-half_size, -half_size, -half_size]
-        ]
+        # Прозрачные объекты - после непрозрачных, без записи глубины
+        if transparent_order is None:
+            self.draw_transparent_instances(light_enabled, selected)
+            for i in individual_order:
+                self.draw_object(self.objects[i])
+            return
         
-        # Потолок
-        ceiling = [
-            [-half_size, half_size, -half_size],
-            [half_size, half_size, -half_size],
-            [half_size, half_size, half_size],
-            [-half_size, half_size, half_size]
-        ]
+        start = 0
+        for cut, i in zip(cuts.tolist(), individual_order):
+            self.draw_transparent_instances(light_enabled, sorted_range=(start, cut))
+            self.draw_object(self.objects[i])
+            start = cut
+        self.draw_transparent_instances(light_enabled, sorted_range=(start, len(transparent_order)))
+    
+    def draw_transparent_instances(self, light_enabled, visible=None, sorted_range=None):
+        """Прозрачные экземпляры со смешиванием и без записи глубины"""
+        self.gl.enable(GL_BLEND)
+        self.gl.blend_func(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        self.gl.depth_mask(False)
+        self.draw_instance_pass(True, light_enabled, visible, sorted_range)
+        self.gl.disable(GL_BLEND)
+        self.gl.depth_mask(True)
+    
+    def draw_instance_pass(self, transparent, light_enabled, visible=None, sorted_range=None):
+        """Один проход инстансинга своей программой, программой кластерного освещения
+        или прохода геометрии G-буфера (visible, sorted_range - см. InstancedRenderer.draw)"""
+        if self.gbuffer_active:
+            self.instanced.draw(transparent, light_enabled,
+                                program=self.gbuffer.use(instanced=True),
+                                visible=visible, sorted_range=sorted_range)
+            self.gbuffer.use()
+        elif self.clustered_active:
+            self.instanced.draw(transparent, light_enabled,
+                                program=self.clustered.use(instanced=True),
+                                visible=visible, sorted_range=sorted_range)
+            self.clustered.use()
+        else:
+            self.instanced.draw(transparent, light_enabled,
+                                visible=visible, sorted_range=sorted_range)
+    
+    def pause_clustered(self):
+        """Временно возвращает фиксированный конвейер (текстуры отражений)"""
+        if self.clustered_active:
+            self.clustered.stop()
+    
+    def resume_clustered(self):
+        """Снова включает кластерное освещение после pause_clustered"""
+        if self.clustered_active:
+            self.clustered.use()
+    
+    def view_token(self):
+        """Значение, однозначно задающее текущую матрицу вида камеры"""
+        return (tuple(self.camera.position), self.camera.yaw, self.camera.pitch)
+    
+    def reflection_ready(self):
+        """Есть ли готовая текстура отражения для зеркальной стены"""
+        return (self.planar_reflections and self.reflection is not None and
+                self.reflection.key is not None and self.reflection.key[0] == self.mirror_wall)
+    
+    def reflection_key(self):
+        """Всё, от чего зависит картинка в зеркале"""
+        probe_faces = self.probes.face_renders if self.probes is not None else 0
+        shadow_maps = self.shadow_maps.map_renders if self.shadow_maps is not None else 0
+        return (self.mirror_wall, self.view_token(), self.objects.version, self.lights.version,
+                self.retained_geometry, self.instanced_rendering, self.frustum_culling,
+                probe_faces, self.shadows, shadow_maps, self.lightmap_key(),
+                self.irradiance_key())
+    
+    def lightmap_key(self):
+        """Какие лайтмапы сейчас на стенах (для кэшей отражений)"""
+        if not self.lightmapping or self.lightmaps is None or not self.lightmaps.ready():
+            return None
+        return self.lightmaps.loaded_key
+    
+    def irradiance_key(self):
+        """Какой переотражённый свет сейчас у объектов (для кэшей отражений)"""
+        if not self.irradiance_probes or self.irradiance_grid is None:
+            return None
+        return self.irradiance_grid.version
+    
+    def update_reflection(self):
+        """Перерисовывает отражение в зеркальной стене, если сцена или камера изменились
         
-        # Левая стена (красная)
-        left_wall = [
-            [-half_size, -half_size, half_size],
-            [-half_size, -half_size, -half_size],
-            [-half_size, half_size, -half_size],
-            [-half_size, half_size, half_size]
-        ]
+        Вызывается при загруженной матрице вида камеры.
+        """
+        if not (self.mirror_enabled and self.planar_reflections):
+            return
+        if self.reflection is None:
+            self.reflection = PlanarReflection(self.width, self.height, self.reflection_scale)
+        self.reflection.set_scale(self.reflection_scale, self.width, self.height)
         
-        # Правая стена (зелёная)
-        right_wall = [
-            [half_size, -half_size, -half_size],
-            [half_size, -half_size, half_size],
-            [half_size, half_size, half_size],
-            [half_size, half_size, -half_size]
-        ]
+        key = self.reflection_key()
+        if not self.reflection.needs_update(key):
+            return
         
-        # ПЕРЕДНЯЯ СТЕНА (ПОЛНАЯ)
-        front_wall = [
-            [-half_size, -half_size, half_size],
-            [half_size, -half_size, half_size],
-            [half_size, half_size, half_size],
-            [-half_size, half_size, half_size]
-        ]
+        name, vertices, normal = next(wall for wall in self.walls if wall[0] == self.mirror_wall)
+        plane = plane_from_point_normal(vertices[0], normal)
+        reflect = reflection_matrix(plane)
+        view = camera_view_matrix(self.camera) @ reflect
+        frustum = Frustum.from_matrix(self.projection @ view)
         
-        # Рисуем стены
+        self.reflection.begin(key)
+        glMatrixMode(GL_MODELVIEW)
         glPushMatrix()
+        glMultMatrixf(to_gl(reflect))
         
-        self.create_wall(back_wall, self.wall_colors['back'], 
-                        normal=[0, 0, 1], wall_name='back')
-        self.create_wall(floor, self.wall_colors['floor'], 
-                        normal=[0, 1, 0], wall_name='floor')
-        self.create_wall(ceiling, self.wall_colors['ceiling'], 
-                        normal=[0, -1, 0], wall_name='ceiling')
-        self.create_wall(left_wall, self.wall_colors['left'], 
-                        normal=[1, 0, 0], wall_name='left')
-        self.create_wall(right_wall, self.wall_colors['right'], 
-                        normal=[-1, 0, 0], wall_name='right')
-        self.create_wall(front_wall, self.wall_colors['front'], 
-                        normal=[0, 0, -1], wall_name='front')
+        # Плоскость задаётся в координатах сцены до отражения: отсекаем всё за зеркалом
+        glClipPlane(GL_CLIP_PLANE0, plane)
+        self.gl.enable(GL_CLIP_PLANE0)
+        self.draw_scene(('reflection', self.mirror_wall, self.view_token()), frustum,
+                        skip_wall=self.mirror_wall, view=view, pass_key=('reflection',))
+        self.gl.disable(GL_CLIP_PLANE0)
         
         glPopMatrix()
+        self.reflection.end()
+    
+    def path_trace_scene(self):
+        """TracerScene для текущего вида; BVH строится заново только после изменения сцены"""
+        key = (self.objects.version, self.lights.version, self.mirror_wall, self.mirror_enabled)
+        if self.path_trace_base is None or self.path_trace_base[0] != key:
+            self.path_trace_base = (key, TracerScene.from_app(self, FOV_Y))
+        return self.path_trace_base[1].with_camera(self.camera)
+    
+    def draw_path_traced(self):
+        """Выводит накопленную трассировку; False, пока для текущего вида нет ни одного прохода"""
+        if self.path_tracer is None:
+            self.path_tracer = ProgressiveTracer(int(self.width * self.path_trace_scale),
+                                                 int(self.height * self.path_trace_scale))
+        key = (self.view_token(), self.objects.version, self.lights.version, self.mirror_wall,
+               self.mirror_enabled)
+        self.path_tracer.exposure = self.path_trace_exposure
+        self.path_tracer.denoise = self.path_trace_denoise
+        self.path_tracer.sync(key, self.path_trace_scene)
+        return self.path_tracer.draw(self.gl, self.width, self.height)
+    
+    def draw_radiosity(self):
+        """Комната цветами решения излучательности (патчи без освещения OpenGL)"""
+        if self.radiosity_solver is None:
+            self.radiosity_solver = RadiositySolver()
+        solver = self.radiosity_solver
+        solver.exposure = self.radiosity_exposure
+        solver.update((self.objects.version, self.lights.version), self.walls,
+                      self.wall_colors, self.objects, self.lights)
+        
+        self.gl.set_view(self.view_token())
+        self.gl.disable(GL_LIGHTING)
+        solver.draw()
+        self.draw_light_points()
+        self.gl.enable(GL_LIGHTING)
+    
+    def update_lightmaps(self):
+        """Берёт лайтмапы текущего состояния из кэша или запускает запекание"""
+        if not self.lightmapping:
+            return
+        if self.lightmaps is None:
+            self.lightmaps = Lightmaps(intensity=self.lightmap_intensity,
+                                       background=self.lightmap_background)
+        self.lightmaps.update((self.objects.version, self.lights.version), self.walls,
+                              self.wall_colors, self.objects, self.lights)
+    
+    def update_irradiance(self):
+        """Следит за сценой и пересчитывает часть устаревших зондов освещённости"""
+        if not self.irradiance_probes:
+            return
+        if self.irradiance_grid is None:
+            self.irradiance_grid = IrradianceGrid(self.walls, self.wall_colors, self.room_size)
+        self.irradiance_grid.update(self.objects, self.lights)
+    
+    def draw_cornell_box(self):
+        """Рисуем корнуэльскую комнату изнутри"""
+        profiler = self.profiler
+        if self.radiosity:
+            with profiler.phase('radiosity'):
+                self.draw_radiosity()
+            return
+        with profiler.phase('lightmaps'):
+            self.update_lightmaps()
+        with profiler.phase('irradiance'):
+            self.update_irradiance()
+        with profiler.phase('shadows'):
+            self.update_shadows()
+        with profiler.phase('probes'):
+            self.update_probes()
+        with profiler.phase('reflection'):
+            self.update_reflection()
+        with profiler.phase('scene'):
+            self.draw_scene(self.view_token(), deferred=self.deferred_shading)
+    
+    def draw_scene(self, view_token, frustum=None, skip_wall=None, exclude=None,
+                   reflective=True, view=None, projection=None, pass_key='camera',
+                   deferred=False):
+        """Стены, объекты и источники при загруженной матрице вида view_token
+        
+        view/projection - те же матрицы вида и проекции массивами (None - камера);
+        exclude - номер объекта, который не рисуется (центр зонда окружения);
+        reflective=False рисует зеркала старыми материалами, без текстур отражений;
+        pass_key - имя прохода для кэша сортировки прозрачных объектов;
+        deferred=True освещает непрозрачную геометрию через G-буфер (см. draw_gbuffer).
+        """
+        phase = self.profiler.phase
+        self.scene_view = camera_view_matrix(self.camera) if view is None else view
+        # Позиции источников задаются в координатах текущей матрицы вида
+        self.gl.set_view(view_token)
         
-        # Рисуем объекты
-        for obj in self.objects:
-            if not obj['transparent']:
-                if obj['type'] == 'cube':
-                    self.draw_cube(obj)
-                elif obj['type'] == 'sphere':
-                    self.draw_sphere(obj)
-        
-        for obj in self.objects:
-            if obj['transparent']:
-                if obj['type'] == 'cube':
-                    self.draw_cube(obj)
-                elif obj['type'] == 'sphere':
-                    self.draw_sphere(obj)
-        
-        # Источники света (точки)
-        glDisable(GL_LIGHTING)
+        # ВКЛЮЧАЕМ ОСВЕЩЕНИЕ
+        self.gl.enable(GL_LIGHTING)
         
-        # Рисуем все источники света
-        for i, light in enumerate(self.lights):
-            if light['enabled']:
-                glPushMatrix()
-                glTranslatef(light['position'][0], light['position'][1], light['position'][2])
-                
-                # Если это выбранный свет - делаем его больше и ярче
-                if i == self.selected_light and light['movable']:
-                    glColor3f(1.0, 1.0, 1.0)  # Белый для выделенного
-                    glPointSize(14.0)
+        # Настраиваем модель освещения
+        self.gl.light_model(GL_LIGHT_MODEL_LOCAL_VIEWER, GL_TRUE)
+        
+        with phase('light_setup'):
+            # Включаем источники света (фиксированному конвейеру - только первые 8)
+            for i, light in enumerate(self.lights[:MAX_FIXED_LIGHTS]):
+                if light['enabled']:
+                    self.gl.enable(GL_LIGHT0 + i)
+                    
+                    # Настраиваем источник света
+                    self.gl.light(GL_LIGHT0 + i, GL_POSITION, light['position'])
+                    self.gl.light(GL_LIGHT0 + i, GL_DIFFUSE, light['diffuse'])
+                    self.gl.light(GL_LIGHT0 + i, GL_AMBIENT, light['ambient'])
+                    self.gl.light(GL_LIGHT0 + i, GL_SPECULAR, light['specular'])
                 else:
-                    glColor3f(light['color'][0], light['color'][1], light['color'][2])
-                    glPointSize(10.0)
-                
-                glBegin(GL_POINTS)
-                glVertex3f(0, 0, 0)
-                glEnd()
-                glPopMatrix()
-        
-        glEnable(GL_LIGHTING)
-    
-    def draw_info_panel(self):
-        """Рисует информационную панель"""
-        current_time = pygame.time.get_ticks()
-        self.frame_count += 1
+                    self.gl.disable(GL_LIGHT0 + i)
+            
+            # Включаем нормализацию
+            self.gl.enable(GL_NORMALIZE)
+            
+            # Кластерное освещение: списки источников строятся для текущего вида
+            # (отложенному освещению и теням они нужны всегда)
+            self.clustered_active = self.clustered_lighting or deferred or self.shadows
+            if self.clustered_active:
+                if self.clustered is None:
+                    self.clustered = ClusteredLighting(near=Z_NEAR)
+                self.clustered.update(self.lights, self.scene_view,
+                                      self.projection if projection is None else projection,
+                                      view_token, self.shadow_maps if self.shadows else None)
+        
+        # Рисуем только объекты в пирамиде видимости
+        visible = self.visible_objects(frustum)
+        if exclude is not None:
+            visible = visible[visible != exclude]
+        transparent = self.objects.transparent[visible]
+        transparent_order = self.sorted_transparent(visible[transparent], pass_key)
+        individual = self.probe_objects(visible) if reflective else visible[:0]
+        opaque = visible[~transparent]
+        
+        # Аргументы инстансинга: (видимые экземпляры, отдельные объекты, порядок прозрачных)
+        instanced = None
+        if self.instanced_rendering:
+            if not self.depth_sorting:
+                transparent_order = None
+            if len(individual) or exclude is not None or self.frustum_culling:
+                instanced = (np.setdiff1d(visible, individual), individual, transparent_order)
+            else:
+                instanced = (None, None, transparent_order)
         
-        if current_time - self.last_time > 1000:
-            self.fps = self.frame_count
-            self.frame_count = 0
-            self.last_time = current_time
+        walls = [wall for wall in self.walls if wall[0] != skip_wall]
+        if deferred:
+            # В G-буфер уходит непрозрачная геометрия без текстур отражений,
+            # прямым проходом дальше рисуется только остальное
+            with phase('gbuffer'):
+                walls = self.draw_gbuffer(walls, opaque, individual, instanced, reflective)
+            opaque = opaque[np.isin(opaque, individual)]
         
-        # УВЕЛИЧЕННАЯ ПАНЕЛЬ для новой информации
-        panel_width = 550  # Ещё больше
-        panel_height = 650  # Ещё больше
+        if self.clustered_active:
+            self.clustered.use()
         
-        # Создаем поверхность для текста
-        info_surface = pygame.Surface((panel_width, panel_height), pygame.SRCALPHA)
-        info_surface.fill((0, 0, 0, 200))
+        # Рисуем стены
+        with phase('walls'):
+            glPushMatrix()
+            
+            for name, vertices, normal in walls:
+                self.create_wall(vertices, self.wall_colors[name], 
+                                normal=normal, wall_name=name, reflective=reflective)
+            
+            glPopMatrix()
         
-        y_offset = 10
+        if instanced is not None:
+            # Непрозрачные и прозрачные экземпляры рисуются вперемешку - одна фаза
+            with phase('objects'):
+                self.draw_objects_instanced(*instanced, stage='forward' if deferred else 'all')
+        else:
+            with phase('opaque'):
+                for i in opaque:
+                    self.draw_object(self.objects[i], reflective=reflective)
+            
+            # Прозрачные - от дальнего к ближнему
+            with phase('transparent'):
+                for i in transparent_order:
+                    self.draw_object(self.objects[i], reflective=reflective)
         
-        # 1. ЗАГОЛОВОК
-        title_text = self.font.render("=== КОРНУЭЛЬСКАЯ КОМНАТА ===", True, (255, 255, 150))
-        info_surface.blit(title_text, (10, y_offset))
-        y_offset += 25
+        if self.clustered_active:
+            self.clustered.stop()
+            self.clustered_active = False
         
-        # FPS и позиция камеры
-        fps_text = self.font.render(f"FPS: {self.fps}", True, (180, 255, 180))
-        info_surface.blit(fps_text, (10, y_offset))
-        y_offset += 20
+        # Источники света (точки)
+        with phase('light_points'):
+            self.gl.disable(GL_LIGHTING)
+            self.draw_light_points()
+            self.gl.enable(GL_LIGHTING)
+    
+    def draw_gbuffer(self, walls, opaque, individual, instanced, reflective):
+        """Проход геометрии в G-буфер и проход освещения (кластеры уже обновлены)
+        
+        opaque - видимые непрозрачные объекты, individual - объекты с отражением
+        окружения, instanced - аргументы draw_objects_instanced или None.
+        Возвращает стены, которые остаются прямому проходу (зеркало с отражением).
+        """
+        if self.gbuffer is None:
+            self.gbuffer = GBuffer(self.width, self.height)
+        
+        textured = [wall for wall in walls
+                    if wall[0] == self.mirror_wall and self.mirror_enabled and reflective and
+                    self.reflection_ready()]
+        
+        self.gbuffer_active = True
+        self.gbuffer.begin()
+        glPushMatrix()
+        for name, vertices, normal in walls:
+            if not textured or name != textured[0][0]:
+                self.create_wall(vertices, self.wall_colors[name],
+                                 normal=normal, wall_name=name, reflective=reflective)
+        glPopMatrix()
         
-        cam_text = self.small_font.render(f"Камера: X={self.camera.position[0]:.1f} Y={self.camera.position[1]:.1f} Z={self.camera.position[2]:.1f}", 
-                                         True, (180, 180, 255))
-        info_surface.blit(cam_text, (10, y_offset))
-        y_offset += 25
+        if instanced is not None:
+            self.draw_objects_instanced(*instanced, stage='geometry')
+        else:
+            for i in opaque[~np.isin(opaque, individual)]:
+                self.draw_object(self.objects[i], reflective=reflective)
+        self.gbuffer.end()
+        self.gbuffer_active = False
         
-        # 2. УПРАВЛЕНИЕ КАМЕРОЙ
-        cam_title = self.font.render("=== УПРАВЛЕНИЕ КАМЕРОЙ ===", True, (255, 255, 200))
-        info_surface.blit(cam_title, (10, y_offset))
-        y_offset += 25
+        self.gbuffer.shade(self.clustered)
+        return textured
+    
+    def draw_light_points(self):
+        """Рисует включённые источники точками (все, кроме выбранного, - одним вызовом)"""
+        lights = self.lights
+        selected = self.selected_light if lights.movable[self.selected_light] else -1
+        shown = lights.enabled.copy()
+        if selected >= 0:
+            shown[selected] = False
+        
+        if shown.any():
+            glBindBuffer(GL_ARRAY_BUFFER, 0)
+            glPointSize(10.0)
+            glEnableClientState(GL_VERTEX_ARRAY)
+            glEnableClientState(GL_COLOR_ARRAY)
+            positions = np.ascontiguousarray(lights.positions[shown, :3])
+            colors = np.ascontiguousarray(lights.colors[shown])
+            glVertexPointer(3, GL_FLOAT, 0, positions)
+            glColorPointer(3, GL_FLOAT, 0, colors)
+            glDrawArrays(GL_POINTS, 0, len(positions))
+            glDisableClientState(GL_COLOR_ARRAY)
+            glDisableClientState(GL_VERTEX_ARRAY)
+        
+        # Выбранный свет - больше и ярче
+        if selected >= 0 and lights.enabled[selected]:
+            glColor3f(1.0, 1.0, 1.0)  # Белый для выделенного
+            glPointSize(14.0)
+            glBegin(GL_POINTS)
+            glVertex3fv(lights.positions[selected, :3])
+            glEnd()
+    
+    def info_panel_sections(self):
+        """Секции информационной панели: (имя, состояние, функция построения строк)
+        
+        Состояние - это всё, от чего зависит текст секции; пока оно не меняется,
+        секция не перерисовывается.
+        """
+        camera_state = tuple(round(float(c), 1) for c in self.camera.position)
+        objects_state = (len(self.objects),) + tuple(
+            (obj['type'], obj['mirror'], obj['transparent'])
+            for obj in self.objects[:self.PANEL_MAX_OBJECTS]
+        )
+        lights_state = (self.selected_light, len(self.lights)) + tuple(
+            (light['enabled'], light['movable'],
+             tuple(round(c, 1) for c in light['position'][:3]))
+            for light in self.lights[:3]
+        )
         
+        return [
+            ('title', None, self.panel_title_lines),
+            ('fps', self.fps, self.panel_fps_lines),
+            ('camera', camera_state, self.panel_camera_lines),
+            ('camera_help', None, self.panel_camera_help_lines),
+            ('objects', objects_state, self.panel_objects_lines),
+            ('object_help', None, self.panel_object_help_lines),
+            ('mirror_wall', (self.mirror_wall, self.mirror_enabled), self.panel_mirror_wall_lines),
+            ('lights', lights_state, self.panel_lights_lines),
+            ('light_help', None, self.panel_light_help_lines)
+        ]
+    
+    def panel_title_lines(self):
+        """1. ЗАГОЛОВОК"""
+        return 25, [(self.font, "=== КОРНУЭЛЬСКАЯ КОМНАТА ===", (255, 255, 150), 10, 0)]
+    
+    def panel_fps_lines(self):
+        """FPS"""
+        return 20, [(self.font, f"FPS: {self.fps}", (180, 255, 180), 10, 0)]
+    
+    def panel_camera_lines(self):
+        """Позиция камеры"""
+        text = f"Камера: X={self.camera.position[0]:.1f} Y={self.camera.position[1]:.1f} Z={self.camera.position[2]:.1f}"
+        return 25, [(self.small_font, text, (180, 180, 255), 10, 0)]
+    
+    def panel_camera_help_lines(self):
+        """2. УПРАВЛЕНИЕ КАМЕРОЙ"""
         cam_controls = [
             "WSAD - движение вперед/назад/влево/вправо",
             "Q/E - движение вверх/вниз",
             "Мышь - вращение камеры",
             "ESC - выход из программы"
         ]
-        
+        lines = [(self.font, "=== УПРАВЛЕНИЕ КАМЕРОЙ ===", (255, 255, 200), 10, 0)]
+        y_offset = 25
         for line in cam_controls:
-            text = self.small_font.render(line, True, (220, 220, 220))
-            info_surface.blit(text, (15, y_offset))
+            lines.append((self.small_font, line, (220, 220, 220), 15, y_offset))
             y_offset += 18
-        
-        y_offset += 10
-        
-        # 3. ОБЪЕКТЫ В КОМНАТЕ (компактнее)
-        objects_title = self.font.render("=== ОБЪЕКТЫ В КОМНАТЕ ===", True, (255, 255, 200))
-        info_surface.blit(objects_title, (10, y_offset))
-        y_offset += 25
-        
-        # Компактный список объектов в 2 колонки
-        for i, obj in enumerate(self.objects):
+        return y_offset + 10, lines
+    
+    def panel_objects_lines(self):
+        """3. ОБЪЕКТЫ В КОМНАТЕ (компактнее)"""
+        lines = [(self.font, "=== ОБЪЕКТЫ В КОМНАТЕ ===", (255, 255, 200), 10, 0)]
+        y_offset = 25
+        
+        # Компактный список объектов в 2 колонки (большие сцены - только начало)
+        color_names = ["Ж", "Син", "Кр", "Зел", "Фил"]
+        shown = self.objects[:self.PANEL_MAX_OBJECTS]
+        for i, obj in enumerate(shown):
             obj_type = "К" if obj['type'] == 'cube' else "С"
-            color_names = ["Ж", "Син", "Кр", "Зел", "Фил"]
             color_name = color_names[i] if i < len(color_names) else f"{i+1}"
             
             mirror_char = "✓" if obj['mirror'] else "·"
@@ -705,36 +1258,35 @@ class CornellBoxApp:
             row = i // 2
             x_pos = 15 + (col * 240)
             y_pos = y_offset + (row * 18)
-            
-            text = self.small_font.render(status_line, True, text_color)
-            info_surface.blit(text, (x_pos, y_pos))
-        
-        # Пересчитываем y_offset после объектов
-        rows_needed = (len(self.objects) + 1) // 2
-        y_offset += rows_needed * 18 + 10
+            lines.append((self.small_font, status_line, text_color, x_pos, y_pos))
         
-        # 4. УПРАВЛЕНИЕ ОБЪЕКТАМИ
-        obj_controls_title = self.font.render("=== УПРАВЛЕНИЕ ОБЪЕКТАМИ ===", True, (255, 255, 200))
-        info_surface.blit(obj_controls_title, (10, y_offset))
-        y_offset += 25
+        rows_needed = (len(shown) + 1) // 2
+        y_offset += rows_needed * 18
         
+        hidden = len(self.objects) - len(shown)
+        if hidden > 0:
+            lines.append((self.small_font, f"... и ещё {hidden} объектов", (200, 200, 200), 15, y_offset))
+            y_offset += 18
+        return y_offset + 10, lines
+    
+    def panel_object_help_lines(self):
+        """4. УПРАВЛЕНИЕ ОБЪЕКТАМИ"""
         obj_controls = [
             "Клавиши 1-5: ЗЕРКАЛЬНОСТЬ объектов (1=жёлтый, 2=синий...)",
             "Клавиши 6-0: ПРОЗРАЧНОСТЬ объектов (6=жёлтый, 7=синий...)",
             "R: сбросить все настройки"
         ]
-        
+        lines = [(self.font, "=== УПРАВЛЕНИЕ ОБЪЕКТАМИ ===", (255, 255, 200), 10, 0)]
+        y_offset = 25
         for line in obj_controls:
-            text = self.small_font.render(line, True, (220, 220, 220))
-            info_surface.blit(text, (15, y_offset))
+            lines.append((self.small_font, line, (220, 220, 220), 15, y_offset))
             y_offset += 18
-        
-        y_offset += 10
-        
-        # 5. ЗЕРКАЛЬНАЯ СТЕНА
-        mirror_title = self.font.render("=== ЗЕРКАЛЬНАЯ СТЕНА ===", True, (255, 255, 200))
-        info_surface.blit(mirror_title, (10, y_offset))
-        y_offset += 25
+        return y_offset + 10, lines
+    
+    def panel_mirror_wall_lines(self):
+        """5. ЗЕРКАЛЬНАЯ СТЕНА"""
+        lines = [(self.font, "=== ЗЕРКАЛЬНАЯ СТЕНА ===", (255, 255, 200), 10, 0)]
+        y_offset = 25
         
         # Статус зеркальной стены
         wall_status = "ВКЛЮЧЕНА" if self.mirror_enabled else "ВЫКЛЮЧЕНА"
@@ -753,22 +1305,19 @@ class CornellBoxApp:
             else:
                 text_color = (220, 220, 220)
             
-            text = self.small_font.render(line, True, text_color)
-            info_surface.blit(text, (15, y_offset))
+            lines.append((self.small_font, line, text_color, 15, y_offset))
             y_offset += 18
-        
-        y_offset += 10
-        
-        # 6. ИСТОЧНИКИ СВЕТА (НОВОЕ!) - ТЕПЕРЬ 3 СВЕТА!
-        lights_title = self.font.render("=== ИСТОЧНИКИ СВЕТА (3 источника) ===", True, (255, 255, 200))
-        info_surface.blit(lights_title, (10, y_offset))
-        y_offset += 25
+        return y_offset + 10, lines
+    
+    def panel_lights_lines(self):
+        """6. ИСТОЧНИКИ СВЕТА"""
+        lines = [(self.font, "=== ИСТОЧНИКИ СВЕТА (3 источника) ===", (255, 255, 200), 10, 0)]
+        y_offset = 25
         
         # Информация о каждом источнике света
         light_names = ["Основной (верхний)", "Зелёный", "Фиолетовый"]
-        for i, light in enumerate(self.lights):
+        for i, light in enumerate(self.lights[:len(light_names)]):
             status = "ВКЛ" if light['enabled'] else "ВЫКЛ"
-            status_color = (100, 255, 100) if light['enabled'] else (255, 100, 100)
             
             movable = "(подвижный)" if light['movable'] else "(неподвижный)"
             selected = " ← ВЫБРАН" if i == self.selected_light and light['movable'] else ""
@@ -776,27 +1325,25 @@ class CornellBoxApp:
             light_info = f"{i+1}. {light_names[i]} {movable}: {status}{selected}"
             
             text_color = (255, 255, 200) if i == self.selected_light else (220, 220, 220)
-            
-            text = self.small_font.render(light_info, True, text_color)
-            info_surface.blit(text, (15, y_offset))
+            lines.append((self.small_font, light_info, text_color, 15, y_offset))
             y_offset += 18
             
             # Позиция света
             if light['movable']:
                 pos_text = f"   Позиция: X={light['position'][0]:.1f} Y={light['position'][1]:.1f} Z={light['position'][2]:.1f}"
                 pos_color = (180, 255, 180) if i == self.selected_light else (180, 180, 180)
-                pos_render = self.small_font.render(pos_text, True, pos_color)
-                info_surface.blit(pos_render, (25, y_offset))
+                lines.append((self.small_font, pos_text, pos_color, 25, y_offset))
                 y_offset += 18
         
-        y_offset += 10
-        
-        # 7. УПРАВЛЕНИЕ СВЕТАМИ (НОВОЕ!)
-        light_controls_title = self.font.render("=== УПРАВЛЕНИЕ СВЕТАМИ ===", True, (255, 255, 200))
-        info_surface.blit(light_controls_title, (10, y_offset))
-        y_offset += 25
-        
-        # Клавиши управления
+        extra = len(self.lights) - len(light_names)
+        if extra > 0:
+            lines.append((self.small_font, f"+ ещё {extra} точечных источников", (220, 220, 220),
+                          15, y_offset))
+            y_offset += 18
+        return y_offset + 10, lines
+    
+    def panel_light_help_lines(self):
+        """7. УПРАВЛЕНИЕ СВЕТАМИ"""
         light_controls = [
             "F1/F2/F3: включить/выключить свет 1/2/3",
             "TAB: переключить выбранный свет (для управления)",
@@ -804,70 +1351,205 @@ class CornellBoxApp:
             "H/K: двигать выбранный свет ВЛЕВО/ВПРАВО",
             "Y/I: двигать выбранный свет БЛИЖЕ/ДАЛЬШЕ"
         ]
-        
+        lines = [(self.font, "=== УПРАВЛЕНИЕ СВЕТАМИ ===", (255, 255, 200), 10, 0)]
+        y_offset = 25
         for line in light_controls:
-            text = self.small_font.render(line, True, (180, 200, 255))
-            info_surface.blit(text, (15, y_offset))
+            lines.append((self.small_font, line, (180, 200, 255), 15, y_offset))
             y_offset += 18
+        return y_offset, lines
+    
+    def stats_panel_sections(self):
+        """Секции панели статистики (правый верхний угол)"""
+        gl_state = (self.gl.last_frame_issued, self.gl.last_frame_elided)
+        culling = (self.frustum_culling, self.culler.drawn, self.culler.culled)
+        clustered = self.clustered
+        lighting = (self.deferred_shading, self.clustered_lighting, len(self.lights),
+                    self.shadows, self.shadow_maps.map_renders if self.shadow_maps else 0,
+                    clustered.light_count if clustered else 0,
+                    clustered.pair_count if clustered else 0, self.radiosity,
+                    self.radiosity_solver.solution_key if self.radiosity_solver else None,
+                    self.lightmapping, self.lightmaps.ready() if self.lightmaps else False,
+                    self.lightmaps.bakes if self.lightmaps else 0,
+                    self.lightmaps.error is not None if self.lightmaps else False,
+                    self.irradiance_probes,
+                    self.irradiance_grid.pending if self.irradiance_grid else 0)
+        return [
+            ('gl_state', gl_state, self.panel_gl_state_lines),
+            ('culling', culling, self.panel_culling_lines),
+            ('lighting', lighting, self.panel_lighting_lines),
+            ('path_tracing', self.path_tracing_stats(), self.panel_path_tracing_lines)
+        ]
+    
+    def path_tracing_stats(self):
+        """Состояние трассировки путей для панели статистики"""
+        tracer = self.path_tracer
+        if not self.path_tracing or tracer is None:
+            return (self.path_tracing, 0, self.path_trace_denoise)
+        return (True, tracer.samples, self.path_trace_denoise)
+    
+    def panel_gl_state_lines(self):
+        """Счётчики кэша состояния OpenGL за прошлый кадр"""
+        issued = self.gl.last_frame_issued
+        elided = self.gl.last_frame_elided
+        total = issued + elided
+        saved = 100.0 * elided / total if total else 0.0
+        return 61, [
+            (self.font, "=== СОСТОЯНИЕ OPENGL ===", (255, 255, 200), 10, 0),
+            (self.small_font, f"Вызовов за кадр: {issued}, пропущено: {elided} ({saved:.0f}%)",
+             (220, 220, 220), 15, 25),
+            (self.small_font, "P: профайлер кадра, Z: память, F12: трасса Chrome", (180, 200, 255), 15, 43)
+        ]
+    
+    def panel_culling_lines(self):
+        """Отсечение по пирамиде видимости"""
+        status = "ВКЛ" if self.frustum_culling else "ВЫКЛ"
+        status_color = (100, 255, 100) if self.frustum_culling else (255, 100, 100)
+        return 80, [
+            (self.font, "=== ОТСЕЧЕНИЕ ОБЪЕКТОВ ===", (255, 255, 200), 10, 0),
+            (self.small_font, f"Отсечение: {status}", status_color, 15, 25),
+            (self.small_font, f"Нарисовано: {self.culler.drawn}, отсечено: {self.culler.culled}",
+             (220, 220, 220), 15, 43),
+            (self.small_font, "C: включить/выключить отсечение", (180, 200, 255), 15, 61)
+        ]
+    
+    def panel_lighting_lines(self):
+        """Режим освещения и размер кластерных списков"""
+        if self.radiosity and self.radiosity_solver is not None:
+            mode = "излучательность (патчи)"
+            solver = self.radiosity_solver
+            info = (f"Патчей: {len(solver)}, выстрелов: {solver.shots}, "
+                    f"решение: {solver.solve_ms:.1f} мс")
+        elif self.deferred_shading:
+            mode = "отложенное (G-буфер), кластерное"
+            pairs = self.clustered.pair_count if self.clustered else 0
+            info = f"Источников: {len(self.lights)}, пар источник-кластер: {pairs}"
+        elif self.clustered_lighting or self.shadows:
+            mode = "по пикселям, кластерное"
+            pairs = self.clustered.pair_count if self.clustered else 0
+            info = f"Источников: {len(self.lights)}, пар источник-кластер: {pairs}"
+        else:
+            mode = f"фиксированный конвейер (до {MAX_FIXED_LIGHTS})"
+            used = min(len(self.lights), MAX_FIXED_LIGHTS)
+            info = f"Источников: {len(self.lights)}, используется: {used}"
+        if self.shadows:
+            renders = self.shadow_maps.map_renders if self.shadow_maps else 0
+            shadows = f"Тени: ВКЛ, перерисовок карт: {renders}"
+        else:
+            shadows = "Тени: ВЫКЛ"
+        if not self.lightmapping:
+            lightmaps = "Лайтмапы (B): ВЫКЛ"
+        elif self.lightmaps is not None and self.lightmaps.ready():
+            lightmaps = (f"Лайтмапы (B): готовы, запеканий: {self.lightmaps.bakes}, "
+                         f"из кэша: {self.lightmaps.cache_hits}")
+        elif self.lightmaps is not None and self.lightmaps.error is not None:
+            lightmaps = "Лайтмапы (B): ошибка запекания, стены без них"
+        else:
+            lightmaps = "Лайтмапы (B): запекаются..."
+        grid = self.irradiance_grid
+        if not self.irradiance_probes:
+            probes = "Зонды освещённости (X): ВЫКЛ"
+        elif grid is not None and len(self.lights) >= MAX_FIXED_LIGHTS:
+            probes = "Зонды освещённости (X): нет свободного источника GL"
+        elif grid is not None and grid.pending:
+            probes = f"Зонды освещённости (X): {len(grid)}, ждут пересчёта: {grid.pending}"
+        else:
+            probes = f"Зонды освещённости (X): {len(grid) if grid else 0}, готовы"
+        return 134, [
+            (self.font, "=== ОСВЕЩЕНИЕ ===", (255, 255, 200), 10, 0),
+            (self.small_font, f"Режим: {mode}", (180, 255, 180), 15, 25),
+            (self.small_font, info, (220, 220, 220), 15, 43),
+            (self.small_font, shadows, (220, 220, 220), 15, 61),
+            (self.small_font, lightmaps, (220, 220, 220), 15, 79),
+            (self.small_font, probes, (220, 220, 220), 15, 97),
+            (self.small_font, "L: режим освещения, O: тени, V: излучательность", (180, 200, 255),
+             15, 115)
+        ]
+    
+    def panel_path_tracing_lines(self):
+        """Трассировка путей: сколько путей на пиксель уже накоплено"""
+        enabled, samples, denoise = self.path_tracing_stats()
+        if enabled:
+            status = f"Трассировка: ВКЛ, путей на пиксель: {samples}"
+            status_color = (100, 255, 100)
+        else:
+            status = "Трассировка: ВЫКЛ (растеризация)"
+            status_color = (255, 100, 100)
+        denoise_status = "ВКЛ" if denoise else "ВЫКЛ"
+        return 79, [
+            (self.font, "=== ТРАССИРОВКА ПУТЕЙ ===", (255, 255, 200), 10, 0),
+            (self.small_font, status, status_color, 15, 25),
+            (self.small_font, f"Шумоподавление: {denoise_status}", (220, 220, 220), 15, 43),
+            (self.small_font, "T: трассировка, G: шумоподавление", (180, 200, 255), 15, 61)
+        ]
+    
+    def draw_info_panel(self):
+        """Рисует информационную панель"""
+        current_time = pygame.time.get_ticks()
+        self.frame_count += 1
+        
+        if current_time - self.last_time > 1000:
+            self.fps = self.frame_count
+            self.frame_count = 0
+            self.last_time = current_time
+            if self.profiler.enabled:
+                self.profiler_summary = summarize(self.profiler.recent_frame_ms(max(self.fps, 1)))
+            tracker = self.profiler.allocations
+            if tracker is not None:
+                self.allocation_summary = tracker.averages().get('frame')
+                tracker.reset_totals()
+        
+        # Перерисовываем только секции, у которых изменилось состояние
+        self.info_panel.update(self.info_panel_sections())
+        panel_width = self.info_panel.width
+        panel_height = self.info_panel.height
         
         # ОТОБРАЖЕНИЕ ПАНЕЛИ
-        glDisable(GL_LIGHTING)
-        glDisable(GL_DEPTH_TEST)
+        self.gl.disable(GL_LIGHTING)
+        self.gl.disable(GL_DEPTH_TEST)
         
         # Сохраняем текущие матрицы
         glMatrixMode(GL_PROJECTION)
         glPushMatrix()
         glLoadIdentity()
-        gluOrtho2D(0, SCREEN_WIDTH, 0, SCREEN_HEIGHT)
+        gluOrtho2D(0, self.width, 0, self.height)
         
         glMatrixMode(GL_MODELVIEW)
         glPushMatrix()
         glLoadIdentity()
         
         # Включаем смешивание для прозрачности
-        glEnable(GL_BLEND)
-        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        self.gl.enable(GL_BLEND)
+        self.gl.blend_func(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
         
         # Рисуем фон панели
         glColor4f(0.0, 0.0, 0.0, 0.7)
         glBegin(GL_QUADS)
-        glVertex2f(5, SCREEN_HEIGHT - 5 - panel_height)
-        glVertex2f(5 + panel_width, SCREEN_HEIGHT - 5 - panel_height)
-        glVertex2f(5 + panel_width, SCREEN_HEIGHT - 5)
-        glVertex2f(5, SCREEN_HEIGHT - 5)
+        glVertex2f(5, self.height - 5 - panel_height)
+        glVertex2f(5 + panel_width, self.height - 5 - panel_height)
+        glVertex2f(5 + panel_width, self.height - 5)
+        glVertex2f(5, self.height - 5)
         glEnd()
         
-        # Преобразуем поверхность Pygame в текстуру OpenGL
-        texture_data = pygame.image.tostring(info_surface, "RGBA", True)
-        width, height = info_surface.get_size()
-        
-        # Создаем и настраиваем текстуру
-        tex_id = glGenTextures(1)
-        glBindTexture(GL_TEXTURE_2D, tex_id)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
-        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, width, height, 0, 
-                    GL_RGBA, GL_UNSIGNED_BYTE, texture_data)
-        
-        # Включаем текстурирование
-        glEnable(GL_TEXTURE_2D)
-        glBindTexture(GL_TEXTURE_2D, tex_id)
+        # Рисуем панель (фон и текст из атласа)
+        self.info_panel.draw(5, self.height - 5 - panel_height)
         
-        # Рисуем текстуру
-        glColor4f(1.0, 1.0, 1.0, 1.0)
-        glBegin(GL_QUADS)
-        glTexCoord2f(0.0, 0.0); glVertex2f(5, SCREEN_HEIGHT - 5 - height)
-        glTexCoord2f(1.0, 0.0); glVertex2f(5 + width, SCREEN_HEIGHT - 5 - height)
-        glTexCoord2f(1.0, 1.0); glVertex2f(5 + width, SCREEN_HEIGHT - 5)
-        glTexCoord2f(0.0, 1.0); glVertex2f(5, SCREEN_HEIGHT - 5)
-        glEnd()
+        # Панель статистики в правом верхнем углу
+        self.stats_panel.update(self.stats_panel_sections())
+        self.stats_panel.draw(self.width - 5 - self.stats_panel.width,
+                              self.height - 5 - self.stats_panel.height)
         
-        # Отключаем текстурирование
-        glDisable(GL_TEXTURE_2D)
-        glDisable(GL_BLEND)
+        # Профайлер кадра: сводка и график под панелью статистики
+        if self.profiler.enabled:
+            self.profiler_panel.update([('profiler',
+                                         (self.profiler_summary, self.allocation_summary,
+                                          self.profiler.allocations is not None),
+                                         self.panel_profiler_lines)])
+            x = self.width - 5 - self.profiler_panel.width
+            y = self.height - 10 - self.stats_panel.height - self.profiler_panel.height
+            self.profiler_panel.draw(x, y)
+            self.draw_frame_graph(x, y - 85, self.profiler_panel.width, 80)
         
-        # Удаляем текстуру
-        glDeleteTextures([tex_id])
+        self.gl.disable(GL_BLEND)
         
         # Восстанавливаем матрицы
         glPopMatrix()
@@ -876,8 +1558,160 @@ class CornellBoxApp:
         glMatrixMode(GL_MODELVIEW)
         
         # Восстанавливаем настройки
-        glEnable(GL_DEPTH_TEST)
-        glEnable(GL_LIGHTING)
+        self.gl.enable(GL_DEPTH_TEST)
+        self.gl.enable(GL_LIGHTING)
+    
+    def panel_profiler_lines(self):
+        """Сводка времени кадра за последнюю секунду"""
+        summary = self.profiler_summary
+        if summary is None:
+            times = "Кадр: замер..."
+        else:
+            times = (f"Кадр: среднее {summary['mean']:.1f} мс, p95 {summary['p95']:.1f}, "
+                     f"макс {summary['max']:.1f}")
+        memory = self.allocation_summary
+        if self.profiler.allocations is None:
+            allocations = "Память (Z): ВЫКЛ"
+        elif memory is None:
+            allocations = "Память (Z): замер..."
+        else:
+            allocations = (f"Память (Z): пик {memory['peak'] / 1024.0:.1f} КБ/кадр, "
+                           f"рост {memory['net']:.0f} Б, GC {memory['collections']:.2f} "
+                           f"({memory['gc_ms']:.2f} мс)")
+        return 80, [
+            (self.font, "=== ПРОФАЙЛЕР КАДРА ===", (255, 255, 200), 10, 0),
+            (self.small_font, times, (220, 220, 220), 15, 25),
+            (self.small_font, allocations, (220, 220, 220), 15, 43),
+            (self.small_font, f"P: выключить, F12: трасса {self.trace_frames} кадров",
+             (180, 200, 255), 15, 61)
+        ]
+    
+    def draw_frame_graph(self, x, y, width, height, max_ms=50.0):
+        """График времени последних кадров: столбик на кадр, линии 60 и 30 FPS"""
+        times = self.profiler.recent_frame_ms(width // 2)
+        
+        glColor4f(0.0, 0.0, 0.0, 0.7)
+        glBegin(GL_QUADS)
+        glVertex2f(x, y)
+        glVertex2f(x + width, y)
+        glVertex2f(x + width, y + height)
+        glVertex2f(x, y + height)
+        glEnd()
+        
+        if len(times):
+            # Столбики справа налево от нового кадра к старому, длинные кадры - красные
+            count = len(times)
+            left = x + width - 2.0 * np.arange(count, 0, -1)
+            top = y + np.minimum(times, max_ms) * (height / max_ms)
+            vertices = np.empty((count, 2, 2), dtype=np.float32)
+            vertices[:, :, 0] = left[:, None]
+            vertices[:, 0, 1] = y
+            vertices[:, 1, 1] = top
+            colors = np.empty((count, 2, 3), dtype=np.float32)
+            slow = (times > 1000.0 / (self.pacer.fps or FPS) * 1.5)[:, None]
+            colors[:] = np.where(slow, [1.0, 0.3, 0.3], [0.3, 1.0, 0.3])[:, None, :]
+            
+            glBindBuffer(GL_ARRAY_BUFFER, 0)
+            glEnableClientState(GL_VERTEX_ARRAY)
+            glEnableClientState(GL_COLOR_ARRAY)
+            glVertexPointer(2, GL_FLOAT, 0, vertices)
+            glColorPointer(3, GL_FLOAT, 0, colors)
+            glDrawArrays(GL_LINES, 0, 2 * count)
+            glDisableClientState(GL_COLOR_ARRAY)
+            glDisableClientState(GL_VERTEX_ARRAY)
+        
+        # Линии бюджета кадра 60 и 30 FPS
+        glColor4f(1.0, 1.0, 0.5, 0.6)
+        glBegin(GL_LINES)
+        for budget in (1000.0 / 60.0, 1000.0 / 30.0):
+            level = y + budget * (height / max_ms)
+            glVertex2f(x, level)
+            glVertex2f(x + width, level)
+        glEnd()
+    
+    def handle_key(self, key):
+        """Нажатие клавиши управления (кроме камеры и ESC) - из окна или сценария"""
+        # Управление свойствами объектов
+        if key == pygame.K_1:
+            self.toggle_mirror(0)
+        elif key == pygame.K_2:
+            self.toggle_mirror(1)
+        elif key == pygame.K_3:
+            self.toggle_mirror(2)
+        elif key == pygame.K_4:
+            self.toggle_mirror(3)
+        elif key == pygame.K_5:
+            self.toggle_mirror(4)
+        
+        elif key == pygame.K_6:
+            self.toggle_transparency(0)
+        elif key == pygame.K_7:
+            self.toggle_transparency(1)
+        elif key == pygame.K_8:
+            self.toggle_transparency(2)
+        elif key == pygame.K_9:
+            self.toggle_transparency(3)
+        elif key == pygame.K_0:
+            self.toggle_transparency(4)
+        
+        # Управление зеркальной стеной
+        elif key == pygame.K_m:
+            self.toggle_mirror_wall()
+        elif key == pygame.K_n:
+            self.toggle_mirror_enabled()
+        
+        elif key == pygame.K_c:
+            self.toggle_frustum_culling()
+        
+        elif key == pygame.K_l:
+            self.toggle_clustered_lighting()
+        elif key == pygame.K_o:
+            self.toggle_shadows()
+        elif key == pygame.K_v:
+            self.toggle_radiosity()
+        elif key == pygame.K_b:
+            self.toggle_lightmaps()
+        elif key == pygame.K_x:
+            self.toggle_irradiance_probes()
+        elif key == pygame.K_t:
+            self.toggle_path_tracing()
+        elif key == pygame.K_g:
+            self.toggle_path_trace_denoise()
+        elif key == pygame.K_p:
+            self.toggle_profiler()
+        elif key == pygame.K_F12:
+            self.dump_trace()
+        elif key == pygame.K_z:
+            self.toggle_allocation_tracking()
+        
+        # Управление источниками света (НОВОЕ!)
+        elif key == pygame.K_F1:
+            self.toggle_light_enabled(0)
+        elif key == pygame.K_F2:
+            self.toggle_light_enabled(1)
+        elif key == pygame.K_F3:
+            self.toggle_light_enabled(2)
+        
+        elif key == pygame.K_TAB:
+            self.select_next_light()
+        
+        # Управление выбранным источником света
+        elif key == pygame.K_u:
+            self.move_selected_light('up')
+        elif key == pygame.K_j:
+            self.move_selected_light('down')
+        elif key == pygame.K_h:
+            self.move_selected_light('left')
+        elif key == pygame.K_k:
+            self.move_selected_light('right')
+        elif key == pygame.K_y:
+            self.move_selected_light('forward')
+        elif key == pygame.K_i:
+            self.move_selected_light('backward')
+        
+        # Сброс настроек
+        elif key == pygame.K_r:
+            self.reset_settings()
     
     def handle_events(self):
         for event in pygame.event.get():
@@ -888,64 +1722,10 @@ class CornellBoxApp:
                     self.running = False
                 elif event.key in self.camera.keys_pressed:
                     self.camera.set_key(event.key, True)
-                
-                # Управление свойствами объектов
-                elif event.key == pygame.K_1:
-                    self.toggle_mirror(0)
-                elif event.key == pygame.K_2:
-                    self.toggle_mirror(1)
-                elif event.key == pygame.K_3:
-                    self.toggle_mirror(2)
-                elif event.key == pygame.K_4:
-                    self.toggle_mirror(3)
-                elif event.key == pygame.K_5:
-                    self.toggle_mirror(4)
-                
-                elif event.key == pygame.K_6:
-                    self.toggle_transparency(0)
-                elif event.key == pygame.K_7:
-                    self.toggle_transparency(1)
-                elif event.key == pygame.K_8:
-                    self.toggle_transparency(2)
-                elif event.key == pygame.K_9:
-                    self.toggle_transparency(3)
-                elif event.key == pygame.K_0:
-                    self.toggle_transparency(4)
-                
-                # Управление зеркальной стеной
-                elif event.key == pygame.K_m:
-                    self.toggle_mirror_wall()
-                elif event.key == pygame.K_n:
-                    self.toggle_mirror_enabled()
-                
-                # Управление источниками света (НОВОЕ!)
-                elif event.key == pygame.K_F1:
-                    self.toggle_light_enabled(0)
-                elif event.key == pygame.K_F2:
-                    self.toggle_light_enabled(1)
-                elif event.key == pygame.K_F3:
-                    self.toggle_light_enabled(2)
-                
-                elif event.key == pygame.K_TAB:
-                    self.select_next_light()
-                
-                # Управление выбранным источником света
-                elif event.key == pygame.K_u:
-                    self.move_selected_light('up')
-                elif event.key == pygame.K_j:
-                    self.move_selected_light('down')
-                elif event.key == pygame.K_h:
-                    self.move_selected_light('left')
-                elif event.key == pygame.K_k:
-                    self.move_selected_light('right')
-                elif event.key == pygame.K_y:
-                    self.move_selected_light('forward')
-                elif event.key == pygame.K_i:
-                    self.move_selected_light('backward')
-                
-                # Сброс настроек
-                elif event.key == pygame.K_r:
-                    self.reset_settings()
+                else:
+                    if self.recorder is not None:
+                        self.recorder.record_key(event.key)
+                    self.handle_key(event.key)
             
             elif event.type == pygame.KEYUP:
                 if event.key in self.camera.keys_pressed:
@@ -953,7 +1733,7 @@ class CornellBoxApp:
             
             elif event.type == pygame.MOUSEMOTION:
                 x, y = event.pos
-                center_x, center_y = SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2
+                center_x, center_y = self.width // 2, self.height // 2
                 
                 if x != center_x or y != center_y:
                     dx, dy = x - center_x, y - center_y
@@ -962,61 +1742,192 @@ class CornellBoxApp:
     
     def reset_settings(self):
         """Сбрасывает все настройки к начальным"""
-        for obj in self.objects:
-            obj['mirror'] = False
-            obj['transparent'] = False
-            obj['color'][3] = 1.0
+        self.objects.reset_effects()
         
         self.mirror_wall = 'back'
         self.mirror_enabled = False
         
         # Сброс источников света
-        self.lights[0]['position'] = [0.0, 4.5, 0.0, 1.0]
-        self.lights[1]['position'] = [0.5, 3.0, -2.0, 1.0]
-        self.lights[2]['position'] = [-1.5, 2.0, -1.5, 1.0]
-        
-        for light in self.lights:
-            light['enabled'] = True
+        self.lights.positions[:3] = [
+            [0.0, 4.5, 0.0, 1.0],
+            [0.5, 3.0, -2.0, 1.0],
+            [-1.5, 2.0, -1.5, 1.0]
+        ]
+        self.lights.enabled[:] = True
+        self.lights.mark_changed()
         
         self.selected_light = 1
     
     def render(self):
+        self.gl.begin_frame()
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
         
         glMatrixMode(GL_MODELVIEW)
         glLoadIdentity()
         self.camera.get_view_matrix()
         
-        # Обработка клавиш для движения камеры
-        keys = pygame.key.get_pressed()
-        if keys[pygame.K_w]:
-            self.camera.position += self.camera.front * self.camera.movement_speed
-        if keys[pygame.K_s]:
-            self.camera.position -= self.camera.front * self.camera.movement_speed
-        if keys[pygame.K_a]:
-            self.camera.position -= self.camera.right * self.camera.movement_speed
-        if keys[pygame.K_d]:
-            self.camera.position += self.camera.right * self.camera.movement_speed
-        if keys[pygame.K_q]:
-            self.camera.position += self.camera.up * self.camera.movement_speed
-        if keys[pygame.K_e]:
-            self.camera.position -= self.camera.up * self.camera.movement_speed
-        
-        self.draw_cornell_box()
-        self.draw_info_panel()
-        
-        pygame.display.flip()
+        # Пока трассировка не дала первый проход для этого вида - растеризованный кадр
+        traced = False
+        if self.path_tracing:
+            with self.profiler.phase('path_trace'):
+                traced = self.draw_path_traced()
+        if not traced:
+            self.draw_cornell_box()
+        if self.show_panels:
+            with self.profiler.phase('panel'):
+                self.draw_info_panel()
+        
+        with self.profiler.phase('present'):
+            self.present()
+    
+    def simulate(self):
+        """Тики симуляции, накопившиеся к этому кадру, и камера кадра между тиками
+        
+        Тяжёлый кадр не замедляет движение: после него выполняется
+        несколько тиков сразу.
+        """
+        scheduler = self.scheduler
+        for _ in range(scheduler.advance()):
+            self.camera.process_keyboard(scheduler.dt)
+        self.camera.interpolate(scheduler.alpha)
+    
+    def present(self):
+        """Показывает кадр (без окна он просто остаётся во framebuffer)"""
+        if self.headless is None:
+            pygame.display.flip()
     
     def run(self):
-        pygame.mouse.set_pos((SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2))
+        pygame.mouse.set_pos((self.width // 2, self.height // 2))
         
         while self.running:
-            self.handle_events()
+            self.profiler.begin_frame()
+            with self.profiler.phase('events'):
+                self.handle_events()
+            with self.profiler.phase('simulation'):
+                self.simulate()
             self.render()
-            self.clock.tick(FPS)
+            self.profiler.end_frame()
+            if self.recorder is not None:
+                self.recorder.record_frame(self.camera)
+            self.pacer.wait()
         
+        self.shutdown()
+    
+    def run_headless(self, frames, output=None):
+        """Рисует frames кадров без окна и без ограничения FPS, последний - в PNG output
+        
+        Возвращает времена кадров в миллисекундах (с ожиданием GPU).
+        """
+        times = []
+        for _ in range(frames):
+            pygame.event.pump()
+            self.profiler.begin_frame()
+            start = time.perf_counter()
+            self.render()
+            glFinish()
+            times.append((time.perf_counter() - start) * 1000.0)
+            self.profiler.end_frame()
+        if output:
+            self.headless.save_png(output)
+        self.shutdown()
+        return times
+    
+    def shutdown(self):
+        """Останавливает фоновые процессы и закрывает окно или контекст без окна"""
+        if self.path_tracer is not None:
+            self.path_tracer.stop()
+        if self.lightmaps is not None:
+            self.lightmaps.stop()
+        if self.profiler.allocations is not None:
+            self.profiler.allocations.stop()
+        if self.headless is not None:
+            self.headless.delete()
+            self.headless = None
         pygame.quit()
 
 if __name__ == "__main__":
-    app = CornellBoxApp()
-    app.run()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Корнуэльская комната")
+    parser.add_argument('--objects', type=int, default=0,
+                        help="добавить столько случайных кубов и сфер (стресс-сцена)")
+    parser.add_argument('--instanced', action='store_true',
+                        help="рисовать объекты инстансингом")
+    parser.add_argument('--no-culling', action='store_true',
+                        help="рисовать все объекты без отсечения по пирамиде видимости")
+    parser.add_argument('--clustered', action='store_true',
+                        help="освещение по пикселям с кластерным списком источников")
+    parser.add_argument('--lights', type=int, default=0,
+                        help="добавить столько точечных источников (включает --clustered)")
+    parser.add_argument('--renderer', choices=['forward', 'deferred'], default='forward',
+                        help="прямое освещение при отрисовке объектов или отложенное через G-буфер")
+    parser.add_argument('--shadows', action='store_true',
+                        help="тени точечных источников (кэшированные кубические карты)")
+    parser.add_argument('--lightmaps', choices=['background', 'sync', 'off'],
+                        default='background',
+                        help="лайтмапы стен: запекать при промахе кэша в фоне, сразу или не использовать")
+    parser.add_argument('--radiosity', action='store_true',
+                        help="начать в режиме излучательности (V переключает)")
+    parser.add_argument('--path-trace', action='store_true',
+                        help="начать в режиме трассировки путей (T переключает)")
+    parser.add_argument('--mirror-scale', type=float, default=0.5,
+                        help="разрешение отражения в зеркальной стене (доля экранного)")
+    parser.add_argument('--size', type=parse_size, default=(SCREEN_WIDTH, SCREEN_HEIGHT),
+                        help="размер кадра ШИРИНАxВЫСОТА")
+    parser.add_argument('--headless', choices=HEADLESS_BACKENDS,
+                        help="без окна и видеокарты: EGL без поверхности или программный OSMesa")
+    parser.add_argument('--frames', type=int, default=60,
+                        help="без окна: сколько кадров нарисовать")
+    parser.add_argument('--output', default=None,
+                        help="без окна: PNG последнего кадра (для сравнения изображений "
+                             "лучше с --lightmaps sync и --no-panel)")
+    parser.add_argument('--no-panel', action='store_true',
+                        help="не рисовать информационные панели")
+    parser.add_argument('--profile', action='store_true',
+                        help="начать с включённым профайлером кадра (P переключает)")
+    parser.add_argument('--trace-frames', type=int, default=300,
+                        help="сколько последних кадров записывает F12 в трассу Chrome")
+    parser.add_argument('--fps', type=int, default=FPS,
+                        help="ограничение кадров в секунду (0 - без ограничения, для замеров)")
+    parser.add_argument('--tick-rate', type=int, default=TICK_RATE,
+                        help="тиков симуляции (ввод и движение камеры) в секунду")
+    parser.add_argument('--record', default=None,
+                        help="записать камеру и клавиши в файл сценария JSON (для replay.py)")
+    args = parser.parse_args()
+    if args.headless and args.frames < 1:
+        parser.error("--frames должно быть не меньше 1")
+    if args.fps < 0:
+        parser.error("--fps должно быть не меньше 0")
+    if args.tick_rate < 1:
+        parser.error("--tick-rate должно быть не меньше 1")
+    if not 1 <= args.trace_frames <= PROFILER_FRAMES:
+        parser.error(f"--trace-frames должно быть от 1 до {PROFILER_FRAMES}")
+    
+    app = CornellBoxApp(*args.size, headless=args.headless)
+    app.show_panels = not args.no_panel
+    if args.record:
+        app.recorder = TimelineRecorder()
+    app.profiler.enabled = args.profile
+    app.pacer = FramePacer(args.fps)
+    app.scheduler = FixedStepScheduler(args.tick_rate)
+    app.trace_frames = args.trace_frames
+    app.instanced_rendering = args.instanced
+    app.frustum_culling = not args.no_culling
+    app.reflection_scale = args.mirror_scale
+    app.clustered_lighting = args.clustered or args.lights > 0
+    app.deferred_shading = args.renderer == 'deferred'
+    app.shadows = args.shadows
+    app.path_tracing = args.path_trace
+    app.radiosity = args.radiosity
+    app.lightmapping = args.lightmaps != 'off'
+    app.lightmap_background = args.lightmaps == 'background'
+    if args.lights:
+        app.create_stress_lights(args.lights)
+    if args.objects:
+        app.create_stress_objects(args.objects)
+    if args.headless:
+        times = sorted(app.run_headless(args.frames, args.output))
+        print(f"Кадров: {len(times)}, {args.size[0]}x{args.size[1]}: "
+              f"среднее {sum(times) / len(times):.2f} мс, медиана {times[len(times) // 2]:.2f} мс")
+    else:
+        app.run()
+        if args.record:
+            app.recorder.timeline().save(args.record)
\ No newline at end of file
@@ -0,0 +1,612 @@
+"""Офлайн-трассировка путей корнуэльской комнаты (эталонные изображения)
+
+Сцена - та же комната, что у приложения (room.CornellRoom, без окна и
+OpenGL): стены и wall_colors, объекты SceneStore (кубы и сферы) и
+источники LightStore. Лучи трассируются
+большими пачками NumPy через BVH из culling.py, плитки изображения
+раздаются процессам multiprocessing.Pool.
+
+Запуск: python pathtracer.py --width 800 --height 533 --spp 64 -o render.png -o render.exr
+"""
+import argparse
+import copy
+import math
+import multiprocessing
+import struct
+import time
+import zlib
+
+import numpy as np
+
+from culling import BVH, object_bounds
+from room import CornellRoom
+
+
+# Смещение начала вторичных лучей от поверхности (против самопересечений)
+EPSILON = 1e-4
+
+# Пропускание цвета зеркалами (как у текстур отражений в main.py)
+MIRROR_WALL_TINT = (0.85, 0.85, 0.9)
+MIRROR_OBJECT_TINT = (0.9, 0.9, 0.9)
+
+# Не больше стольких лучей в одной пачке (ограничивает память на плитку)
+MAX_BATCH_RAYS = 1 << 15
+
+# Сколько раз теневой луч может пройти сквозь прозрачные объекты
+MAX_SHADOW_STEPS = 8
+
+# Каналы изображения с вспомогательными буферами (render(..., aovs=True)):
+# цвет, нормаль и albedo первой поверхности, расстояние до неё от камеры
+AOV_CHANNELS = {'color': slice(0, 3), 'normal': slice(3, 6), 'albedo': slice(6, 9),
+                'depth': slice(9, 10)}
+AOV_CHANNEL_COUNT = 10
+
+
+class TracerScene:
+    """Снимок сцены для трассировки: только массивы NumPy (передаётся процессам)"""
+    def __init__(self, walls, wall_colors, mirror_wall, objects, lights, camera, fov_y):
+        # Стены - прямоугольники: угол, два ребра, нормаль внутрь комнаты
+        corners = np.array([vertices for _, vertices, _ in walls], dtype=np.float64)
+        self.wall_origins = corners[:, 0]
+        self.wall_u = corners[:, 1] - corners[:, 0]
+        self.wall_v = corners[:, 3] - corners[:, 0]
+        self.wall_normals = np.array([normal for _, _, normal in walls], dtype=np.float64)
+        self.wall_albedo = np.array([wall_colors[name][:3] for name, _, _ in walls],
+                                    dtype=np.float64)
+        self.wall_mirror = np.array([name == mirror_wall for name, _, _ in walls])
+
+        # Объекты: кубы - боксы центр +- |масштаб|, сферы - эллипсоиды с полуосями масштаба
+        self.types = objects.types.copy()
+        self.centers = objects.positions.astype(np.float64)
+        self.extents = np.abs(objects.scales).astype(np.float64)
+        self.albedo = objects.colors[:, :3].astype(np.float64)
+        self.alpha = np.where(objects.transparent, objects.colors[:, 3], 1.0)
+        self.mirror = objects.mirror.copy()
+        mins, maxs = object_bounds(objects)
+        self.bvh = BVH(mins, maxs, leaf_size=4)
+
+        # Включённые источники: интенсивность pi * diffuse даёт ту же прямую
+        # освещённость, что фиксированный конвейер (без затухания с расстоянием)
+        enabled = np.flatnonzero(lights.enabled)
+        self.light_positions = lights.positions[enabled, :3].astype(np.float64)
+        self.light_intensity = math.pi * lights.diffuse[enabled, :3].astype(np.float64)
+        self.light_radius = lights.radius[enabled].astype(np.float64)
+        power = self.light_intensity.sum(axis=1)
+        self.light_cdf = np.cumsum(power) / power.sum() if len(power) else power
+        self.light_pdf = power / power.sum() if len(power) else power
+
+        self.eye = np.array(camera.position, dtype=np.float64)
+        self.front = np.array(camera.front, dtype=np.float64)
+        self.right = np.array(camera.right, dtype=np.float64)
+        self.up = np.array(camera.up, dtype=np.float64)
+        self.fov_y = fov_y
+
+    @classmethod
+    def from_app(cls, app, fov_y=60.0):
+        """Снимок текущего состояния CornellBoxApp"""
+        mirror_wall = app.mirror_wall if app.mirror_enabled else None
+        return cls(app.walls, app.wall_colors, mirror_wall, app.objects, app.lights,
+                   app.camera, fov_y)
+
+    @classmethod
+    def cornell_box(cls, objects=0, lights=0, mirror=False, fov_y=60.0):
+        """Комната приложения со стартовой камерой, без окна и OpenGL"""
+        room = CornellRoom()
+        if objects:
+            room.create_stress_objects(objects)
+        if lights:
+            room.create_stress_lights(lights)
+        mirror_wall = room.mirror_wall if mirror else None
+        return cls(room.walls, room.wall_colors, mirror_wall, room.objects, room.lights,
+                   room.camera, fov_y)
+
+    def with_camera(self, camera):
+        """Та же сцена с другой камерой (массивы геометрии общие, BVH не строится)"""
+        scene = copy.copy(self)
+        scene.eye = np.array(camera.position, dtype=np.float64)
+        scene.front = np.array(camera.front, dtype=np.float64)
+        scene.right = np.array(camera.right, dtype=np.float64)
+        scene.up = np.array(camera.up, dtype=np.float64)
+        return scene
+
+
+def ray_boxes(origins, inverse_directions, mins, maxs):
+    """Пересечение лучей с боксами (метод плит): (t входа, t выхода)"""
+    t0 = (mins - origins) * inverse_directions
+    t1 = (maxs - origins) * inverse_directions
+    t_near = np.minimum(t0, t1).max(axis=1)
+    t_far = np.maximum(t0, t1).min(axis=1)
+    return t_near, t_far
+
+
+def intersect_primitives(scene, objects, origins, directions):
+    """Ближайшее пересечение каждого луча со своим объектом (inf - мимо)"""
+    t = np.full(len(objects), np.inf)
+    centers = scene.centers[objects]
+    extents = scene.extents[objects]
+    cubes = scene.types[objects] == 0
+
+    if cubes.any():
+        o, d = origins[cubes], directions[cubes]
+        inverse = 1.0 / np.where(np.abs(d) < 1e-12, 1e-12, d)
+        t_near, t_far = ray_boxes(o, inverse, centers[cubes] - extents[cubes],
+                                  centers[cubes] + extents[cubes])
+        # Луч изнутри (прозрачный куб) - точка выхода
+        hit_t = np.where(t_near > EPSILON, t_near, t_far)
+        t[cubes] = np.where((t_far >= t_near) & (hit_t > EPSILON), hit_t, np.inf)
+
+    spheres = ~cubes
+    if spheres.any():
+        # В системе координат эллипсоида это единичная сфера
+        o = (origins[spheres] - centers[spheres]) / extents[spheres]
+        d = directions[spheres] / extents[spheres]
+        a = np.einsum('ij,ij->i', d, d)
+        b = np.einsum('ij,ij->i', o, d)
+        c = np.einsum('ij,ij->i', o, o) - 1.0
+        disc = b * b - a * c
+        root = np.sqrt(np.maximum(disc, 0.0))
+        near = (-b - root) / a
+        far = (-b + root) / a
+        hit_t = np.where(near > EPSILON, near, far)
+        t[spheres] = np.where((disc >= 0.0) & (hit_t > EPSILON), hit_t, np.inf)
+    return t
+
+
+def intersect_objects(scene, origins, directions, t_max):
+    """Ближайший объект на каждом луче через BVH: (t, номер объекта или -1)
+
+    Обход идёт по уровням для всех пар (луч, узел) сразу; листья
+    проверяются по мере появления, и найденные пересечения отсекают
+    узлы, которые начинаются дальше.
+    """
+    n = len(origins)
+    best_t = np.array(t_max, dtype=np.float64)
+    best_object = np.full(n, -1, dtype=np.int64)
+    bvh = scene.bvh
+    if len(bvh) == 0 or n == 0:
+        return best_t, best_object
+
+    safe = np.where(np.abs(directions) < 1e-12, 1e-12, directions)
+    inverse = 1.0 / safe
+    rays = np.arange(n)
+    nodes = np.zeros(n, dtype=np.int64)
+    while len(rays):
+        t_near, t_far = ray_boxes(origins[rays], inverse[rays],
+                                  bvh.node_mins[nodes], bvh.node_maxs[nodes])
+        keep = (t_far >= np.maximum(t_near, 0.0)) & (t_near < best_t[rays])
+        rays, nodes = rays[keep], nodes[keep]
+
+        leaf = bvh.lefts[nodes] < 0
+        leaf_rays, leaf_nodes = rays[leaf], nodes[leaf]
+        if len(leaf_rays):
+            counts = bvh.counts[leaf_nodes]
+            pair_rays = np.repeat(leaf_rays, counts)
+            local = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+            objects = bvh.order[np.repeat(bvh.starts[leaf_nodes], counts) + local]
+            t = intersect_primitives(scene, objects, origins[pair_rays], directions[pair_rays])
+
+            better = t < best_t[pair_rays]
+            pair_rays, t, objects = pair_rays[better], t[better], objects[better]
+            # Ближайшее из найденных на каждом луче
+            order = np.lexsort((t, pair_rays))
+            pair_rays, t, objects = pair_rays[order], t[order], objects[order]
+            first = np.ones(len(pair_rays), dtype=bool)
+            first[1:] = pair_rays[1:] != pair_rays[:-1]
+            best_t[pair_rays[first]] = t[first]
+            best_object[pair_rays[first]] = objects[first]
+
+        inner_rays, inner_nodes = rays[~leaf], nodes[~leaf]
+        rays = np.concatenate([inner_rays, inner_rays])
+        nodes = np.concatenate([bvh.lefts[inner_nodes], bvh.rights[inner_nodes]])
+    return best_t, best_object
+
+
+def intersect_walls(scene, origins, directions):
+    """Ближайшая стена на каждом луче: (t, номер стены или -1) - стен всего шесть"""
+    denominators = directions @ scene.wall_normals.T  # (N, W)
+    denominators = np.where(np.abs(denominators) < 1e-12, 1e-12, denominators)
+    distances = np.einsum('wk,wk->w', scene.wall_normals, scene.wall_origins)
+    t = (distances[None, :] - origins @ scene.wall_normals.T) / denominators
+    points = origins[:, None, :] + t[:, :, None] * directions[:, None, :]
+    local = points - scene.wall_origins[None]
+    a = np.einsum('nwk,wk->nw', local, scene.wall_u) / np.einsum('wk,wk->w', scene.wall_u,
+                                                                  scene.wall_u)
+    b = np.einsum('nwk,wk->nw', local, scene.wall_v) / np.einsum('wk,wk->w', scene.wall_v,
+                                                                  scene.wall_v)
+    inside = (t > EPSILON) & (a >= 0.0) & (a <= 1.0) & (b >= 0.0) & (b <= 1.0)
+    t = np.where(inside, t, np.inf)
+    wall = np.argmin(t, axis=1)
+    best_t = t[np.arange(len(t)), wall]
+    return best_t, np.where(np.isfinite(best_t), wall, -1)
+
+
+def object_normals(scene, objects, points):
+    """Нормали объектов objects в точках points"""
+    local = (points - scene.centers[objects]) / scene.extents[objects]
+    normals = local / scene.extents[objects]  # Эллипсоид: градиент (p - c) / s^2
+    cubes = scene.types[objects] == 0
+    if cubes.any():
+        # Куб: ось, по которой точка дальше всего от центра
+        axis = np.argmax(np.abs(local[cubes]), axis=1)
+        cube_normals = np.zeros((int(cubes.sum()), 3))
+        rows = np.arange(len(axis))
+        cube_normals[rows, axis] = np.sign(local[cubes][rows, axis])
+        normals[cubes] = cube_normals
+    return normals / np.linalg.norm(normals, axis=1, keepdims=True)
+
+
+def occluded(scene, origins, directions, distances, rng):
+    """Маска перекрытых теневых лучей (и число пройденных отрезков)
+
+    Стены тень не отбрасывают (основной и зелёный источники висят выше
+    потолка, см. render_shadow_casters в main.py). Прозрачный объект
+    задерживает луч с вероятностью своей альфы.
+    """
+    blocked = np.zeros(len(origins), dtype=bool)
+    active = np.arange(len(origins))
+    origins = origins.copy()
+    distances = distances.copy()
+    segments = 0
+    for _ in range(MAX_SHADOW_STEPS):
+        if not len(active):
+            break
+        segments += len(active)
+        t, objects = intersect_objects(scene, origins[active], directions[active],
+                                       distances[active])
+        hit = objects >= 0
+        stops = hit & (rng.random(len(active)) < scene.alpha[np.maximum(objects, 0)])
+        blocked[active[stops]] = True
+
+        through = hit & ~stops
+        active, t = active[through], t[through]
+        origins[active] += directions[active] * (t + EPSILON)[:, None]
+        distances[active] -= t + EPSILON
+    blocked[active] = True  # Слишком много прозрачных слоёв подряд
+    return blocked, segments
+
+
+def cosine_directions(normals, rng):
+    """Случайные направления по косинусу вокруг нормалей (базис Даффа и др.)"""
+    n = len(normals)
+    u1, u2 = rng.random(n), rng.random(n)
+    r = np.sqrt(u1)
+    phi = 2.0 * math.pi * u2
+    x, y, z = r * np.cos(phi), r * np.sin(phi), np.sqrt(1.0 - u1)
+
+    nx, ny, nz = normals[:, 0], normals[:, 1], normals[:, 2]
+    sign = np.where(nz >= 0.0, 1.0, -1.0)
+    a = -1.0 / (sign + nz)
+    b = nx * ny * a
+    tangent = np.stack([1.0 + sign * nx * nx * a, sign * b, -sign * nx], axis=1)
+    bitangent = np.stack([b, sign + ny * ny * a, -ny], axis=1)
+    return tangent * x[:, None] + bitangent * y[:, None] + normals * z[:, None]
+
+
+def direct_light(scene, points, normals, albedo, rng):
+    """Прямое освещение диффузных точек: один источник на точку, выбранный по мощности"""
+    n = len(points)
+    result = np.zeros((n, 3))
+    if n == 0 or len(scene.light_positions) == 0:
+        return result, 0
+
+    lights = np.minimum(np.searchsorted(scene.light_cdf, rng.random(n), side='right'),
+                        len(scene.light_cdf) - 1)
+    to_light = scene.light_positions[lights] - points
+    distances = np.linalg.norm(to_light, axis=1)
+    to_light /= distances[:, None]
+    cosines = np.einsum('ij,ij->i', normals, to_light)
+
+    # Затухание с конечным радиусом - как в шейдере кластерного освещения
+    x = np.clip(distances / scene.light_radius[lights], 0.0, 1.0)
+    attenuation = np.where(np.isfinite(scene.light_radius[lights]), (1.0 - x * x) ** 2, 1.0)
+
+    lit = (cosines > 0.0) & (attenuation > 0.0)
+    index = np.flatnonzero(lit)
+    blocked, segments = occluded(scene, points[index] + normals[index] * EPSILON,
+                                 to_light[index], distances[index], rng)
+    index = index[~blocked]
+    weight = cosines[index] * attenuation[index] / scene.light_pdf[lights[index]]
+    # Ламберт: albedo / pi * pi * diffuse * cos
+    result[index] = (albedo[index] * scene.light_intensity[lights[index]] / math.pi *
+                     weight[:, None])
+    return result, segments
+
+
+def surface_aovs(scene, origins, directions):
+    """Нормаль (к лучу), albedo и расстояние первой поверхности: (N, 7)"""
+    wall_t, walls = intersect_walls(scene, origins, directions)
+    object_t, objects = intersect_objects(scene, origins, directions, wall_t)
+    on_object = objects >= 0
+    t = np.where(on_object, object_t, wall_t)
+    hit = np.isfinite(t)
+    points = origins + directions * np.where(hit, t, 0.0)[:, None]
+
+    aovs = np.zeros((len(origins), 7))
+    on_wall = ~on_object & hit
+    aovs[on_object, 0:3] = object_normals(scene, objects[on_object], points[on_object])
+    aovs[on_object, 3:6] = scene.albedo[objects[on_object]]
+    aovs[on_wall, 0:3] = scene.wall_normals[walls[on_wall]]
+    aovs[on_wall, 3:6] = scene.wall_albedo[walls[on_wall]]
+    facing = np.einsum('ij,ij->i', aovs[:, 0:3], directions) > 0.0
+    aovs[facing, 0:3] *= -1.0
+    aovs[hit, 6] = t[hit]
+    return aovs
+
+
+def split_channels(image):
+    """Изображение с вспомогательными буферами -> словарь по AOV_CHANNELS"""
+    return {name: image[..., channels] for name, channels in AOV_CHANNELS.items()}
+
+
+def trace_paths(scene, origins, directions, rng, max_depth=5):
+    """Яркость вдоль путей из origins по directions: (N, 3) и число лучей"""
+    n = len(origins)
+    radiance = np.zeros((n, 3))
+    throughput = np.ones((n, 3))
+    paths = np.arange(n)
+    rays = 0
+
+    for depth in range(max_depth):
+        if not len(paths):
+            break
+        rays += len(paths)
+        wall_t, walls = intersect_walls(scene, origins, directions)
+        object_t, objects = intersect_objects(scene, origins, directions, wall_t)
+        hit = (walls >= 0) | (objects >= 0)
+        paths, origins, directions, throughput = (paths[hit], origins[hit], directions[hit],
+                                                  throughput[hit])
+        wall_t, walls, object_t, objects = wall_t[hit], walls[hit], object_t[hit], objects[hit]
+
+        on_object = objects >= 0
+        t = np.where(on_object, object_t, wall_t)
+        points = origins + directions * t[:, None]
+
+        # Материал точки: нормаль к лучу, albedo, зеркальность, альфа
+        normals = np.empty_like(points)
+        albedo = np.empty_like(points)
+        mirror = np.empty(len(points), dtype=bool)
+        alpha = np.ones(len(points))
+        normals[on_object] = object_normals(scene, objects[on_object], points[on_object])
+        albedo[on_object] = scene.albedo[objects[on_object]]
+        mirror[on_object] = scene.mirror[objects[on_object]]
+        alpha[on_object] = scene.alpha[objects[on_object]]
+        on_wall = ~on_object
+        normals[on_wall] = scene.wall_normals[walls[on_wall]]
+        albedo[on_wall] = scene.wall_albedo[walls[on_wall]]
+        mirror[on_wall] = scene.wall_mirror[walls[on_wall]]
+        facing = np.einsum('ij,ij->i', normals, directions) > 0.0
+        normals[facing] *= -1.0
+
+        # Прозрачность: с вероятностью 1 - альфа луч идёт дальше без изменений
+        passing = rng.random(len(points)) >= alpha
+        # Зеркало: идеальное отражение с оттенком стекла
+        reflecting = mirror & ~passing
+        diffuse = ~mirror & ~passing
+
+        direct, segments = direct_light(scene, points[diffuse], normals[diffuse],
+                                        albedo[diffuse], rng)
+        rays += segments
+        np.add.at(radiance, paths[diffuse], throughput[diffuse] * direct)
+
+        new_directions = directions.copy()
+        if reflecting.any():
+            d, nrm = directions[reflecting], normals[reflecting]
+            new_directions[reflecting] = d - 2.0 * np.einsum('ij,ij->i', d, nrm)[:, None] * nrm
+            tint = np.where(on_object[reflecting, None], MIRROR_OBJECT_TINT, MIRROR_WALL_TINT)
+            throughput[reflecting] *= tint
+        if diffuse.any():
+            new_directions[diffuse] = cosine_directions(normals[diffuse], rng)
+            throughput[diffuse] *= albedo[diffuse]
+
+        offset = np.where(passing[:, None], directions, normals) * EPSILON
+        origins = points + offset
+        directions = new_directions
+
+        # Русская рулетка с третьего отскока
+        if depth >= 2:
+            survival = np.minimum(throughput.max(axis=1), 0.95)
+            alive = rng.random(len(paths)) < survival
+            throughput = throughput[alive] / survival[alive, None]
+            paths, origins, directions = paths[alive], origins[alive], directions[alive]
+    return radiance, rays
+
+
+def camera_rays(scene, width, height, xs, ys, rng):
+    """Лучи камеры через пиксели (xs, ys) со случайным сдвигом внутри пикселя"""
+    tan_half = math.tan(math.radians(scene.fov_y) / 2.0)
+    aspect = width / height
+    sx = (2.0 * (xs + rng.random(len(xs))) / width - 1.0) * tan_half * aspect
+    sy = (1.0 - 2.0 * (ys + rng.random(len(ys))) / height) * tan_half
+    directions = (scene.front[None] + sx[:, None] * scene.right[None] +
+                  sy[:, None] * scene.up[None])
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+    origins = np.broadcast_to(scene.eye, directions.shape).copy()
+    return origins, directions
+
+
+def render_tile(scene, tile, width, height, spp, max_depth, seed, aovs=False):
+    """Одна плитка (x0, y0, x1, y1): (плитка, массив (h, w, 3), число лучей)
+
+    aovs=True добавляет каналы AOV_CHANNELS (массив (h, w, AOV_CHANNEL_COUNT)),
+    усреднённые по тем же лучам камеры, что и цвет.
+    """
+    x0, y0, x1, y1 = tile
+    rng = np.random.default_rng([seed, y0, x0])
+    ys, xs = np.mgrid[y0:y1, x0:x1]
+    xs, ys = xs.ravel(), ys.ravel()
+    pixels = len(xs)
+
+    total = np.zeros((pixels, AOV_CHANNEL_COUNT if aovs else 3))
+    rays = 0
+    per_batch = max(1, MAX_BATCH_RAYS // pixels)
+    for start in range(0, spp, per_batch):
+        samples = min(per_batch, spp - start)
+        origins, directions = camera_rays(scene, width, height, np.tile(xs, samples),
+                                          np.tile(ys, samples), rng)
+        if aovs:
+            total[:, 3:] += surface_aovs(scene, origins, directions).reshape(
+                samples, pixels, AOV_CHANNEL_COUNT - 3).sum(axis=0)
+        radiance, batch_rays = trace_paths(scene, origins, directions, rng, max_depth)
+        total[:, :3] += radiance.reshape(samples, pixels, 3).sum(axis=0)
+        rays += batch_rays
+    pixels = (total / spp).reshape(y1 - y0, x1 - x0, total.shape[1])
+    return tile, pixels.astype(np.float32), rays
+
+
+# Сцена процесса пула (передаётся один раз при запуске процесса)
+_worker_scene = None
+
+
+def _init_worker(scene):
+    global _worker_scene
+    _worker_scene = scene
+
+
+def _render_tile_task(args):
+    return render_tile(_worker_scene, *args)
+
+
+def image_tiles(width, height, size):
+    """Плитки (x0, y0, x1, y1) изображения со стороной size"""
+    return [(x, y, min(x + size, width), min(y + size, height))
+            for y in range(0, height, size) for x in range(0, width, size)]
+
+
+def render(scene, width, height, spp=16, max_depth=5, tile_size=32, processes=None, seed=0,
+           aovs=False):
+    """Трассирует изображение: (массив (height, width, 3) float32, статистика)
+
+    processes - число процессов пула (None - все ядра, 1 - без пула).
+    aovs=True - ещё и вспомогательные буферы для шумоподавления
+    (каналы AOV_CHANNELS, разбираются split_channels).
+    """
+    image = np.zeros((height, width, AOV_CHANNEL_COUNT if aovs else 3), dtype=np.float32)
+    tasks = [(tile, width, height, spp, max_depth, seed, aovs)
+             for tile in image_tiles(width, height, tile_size)]
+    rays = 0
+    start = time.perf_counter()
+    if processes == 1:
+        results = (render_tile(scene, *task) for task in tasks)
+        for (x0, y0, x1, y1), pixels, tile_rays in results:
+            image[y0:y1, x0:x1] = pixels
+            rays += tile_rays
+    else:
+        with multiprocessing.Pool(processes, initializer=_init_worker,
+                                  initargs=(scene,)) as pool:
+            for (x0, y0, x1, y1), pixels, tile_rays in pool.imap_unordered(_render_tile_task,
+                                                                          tasks):
+                image[y0:y1, x0:x1] = pixels
+                rays += tile_rays
+    seconds = time.perf_counter() - start
+    return image, {'rays': rays, 'seconds': seconds, 'rays_per_second': rays / seconds}
+
+
+def write_png(path, image):
+    """8-битный PNG; значения обрезаются до [0, 1] (как в окне, без гамма-коррекции)"""
+    data = (np.clip(image, 0.0, 1.0) * 255.0 + 0.5).astype(np.uint8)
+    height, width, _ = data.shape
+    raw = np.concatenate([np.zeros((height, 1), dtype=np.uint8),
+                          data.reshape(height, width * 3)], axis=1).tobytes()
+
+    def chunk(tag, payload):
+        return (struct.pack('>I', len(payload)) + tag + payload +
+                struct.pack('>I', zlib.crc32(tag + payload) & 0xffffffff))
+
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(raw, 6)))
+        f.write(chunk(b'IEND', b''))
+
+
+def write_exr(path, image):
+    """OpenEXR без сжатия: каналы R, G, B float32, линейная яркость без обрезки"""
+    height, width, _ = image.shape
+
+    def attribute(name, attr_type, data):
+        return (name.encode() + b'\0' + attr_type.encode() + b'\0' +
+                struct.pack('<i', len(data)) + data)
+
+    # Каналы в алфавитном порядке; тип 2 - FLOAT
+    channels = b''.join(name + b'\0' + struct.pack('<iB3xii', 2, 0, 1, 1)
+                        for name in (b'B', b'G', b'R')) + b'\0'
+    window = struct.pack('<iiii', 0, 0, width - 1, height - 1)
+    header = struct.pack('<ii', 20000630, 2)
+    header += attribute('channels', 'chlist', channels)
+    header += attribute('compression', 'compression', b'\0')
+    header += attribute('dataWindow', 'box2i', window)
+    header += attribute('displayWindow', 'box2i', window)
+    header += attribute('lineOrder', 'lineOrder', b'\0')
+    header += attribute('pixelAspectRatio', 'float', struct.pack('<f', 1.0))
+    header += attribute('screenWindowCenter', 'v2f', struct.pack('<ff', 0.0, 0.0))
+    header += attribute('screenWindowWidth', 'float', struct.pack('<f', 1.0))
+    header += b'\0'
+
+    # Блок на строку: номер строки, размер данных, строка каждого канала
+    line_bytes = width * 3 * 4
+    blocks = np.empty(height, dtype=[('y', '<i4'), ('size', '<i4'),
+                                     ('pixels', '<f4', (3, width))])
+    blocks['y'] = np.arange(height)
+    blocks['size'] = line_bytes
+    blocks['pixels'] = image[:, :, ::-1].transpose(0, 2, 1)
+    offsets = (len(header) + 8 * height +
+               np.arange(height, dtype=np.uint64) * (8 + line_bytes)).astype('<u8')
+
+    with open(path, 'wb') as f:
+        f.write(header)
+        f.write(offsets.tobytes())
+        f.write(blocks.tobytes())
+
+
+def save_image(path, image, exposure=1.0):
+    """Сохраняет изображение в PNG или EXR (по расширению)
+
+    exposure - множитель яркости для PNG; в EXR яркость пишется как есть.
+    """
+    if path.lower().endswith('.exr'):
+        write_exr(path, image)
+    else:
+        write_png(path, image * exposure)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Трассировка путей корнуэльской комнаты")
+    parser.add_argument('--width', type=int, default=600, help="ширина изображения")
+    parser.add_argument('--height', type=int, default=400, help="высота изображения")
+    parser.add_argument('--spp', type=int, default=16, help="путей на пиксель")
+    parser.add_argument('--depth', type=int, default=5, help="максимум отскоков")
+    parser.add_argument('--tile', type=int, default=32, help="сторона плитки в пикселях")
+    parser.add_argument('--processes', type=int, default=None,
+                        help="число процессов (по умолчанию - все ядра)")
+    parser.add_argument('--seed', type=int, default=0, help="зерно генератора")
+    parser.add_argument('--objects', type=int, default=0,
+                        help="добавить столько случайных кубов и сфер")
+    parser.add_argument('--lights', type=int, default=0,
+                        help="добавить столько точечных источников")
+    parser.add_argument('--mirror', action='store_true', help="включить зеркальную стену")
+    parser.add_argument('--exposure', type=float, default=1.0,
+                        help="множитель яркости для PNG (переотражения делают комнату ярче окна)")
+    parser.add_argument('--denoise', action='store_true',
+                        help="очистить шум фильтром à-trous (denoise.py) по вспомогательным буферам")
+    parser.add_argument('-o', '--output', action='append',
+                        help="файл .png или .exr (можно несколько раз)")
+    args = parser.parse_args()
+
+    scene = TracerScene.cornell_box(args.objects, args.lights, args.mirror)
+
+    image, stats = render(scene, args.width, args.height, args.spp, args.depth, args.tile,
+                          args.processes, args.seed, aovs=args.denoise)
+    print(f"{args.width}x{args.height}, {args.spp} путей на пиксель: {stats['seconds']:.1f} с, "
+          f"лучей {stats['rays']}, {stats['rays_per_second'] / 1e6:.2f} млн лучей/с")
+    if args.denoise:
+        from denoise import denoise_image
+        start = time.perf_counter()
+        image = denoise_image(image)
+        print(f"Шумоподавление: {(time.perf_counter() - start) * 1000.0:.0f} мс")
+    for path in args.output or ['render.png']:
+        save_image(path, image, args.exposure)
+        print(f"Сохранено: {path}")
+
+
+if __name__ == "__main__":
+    main()
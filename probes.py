@@ -0,0 +1,209 @@
+import numpy as np
+from OpenGL.GL import *
+
+from culling import object_bounds
+from transforms import perspective_matrix, look_at_matrix
+
+
+# Грани кубической карты: (цель текстуры, направление взгляда, вектор "вверх")
+CUBE_FACES = [
+    (GL_TEXTURE_CUBE_MAP_POSITIVE_X, (1.0, 0.0, 0.0), (0.0, -1.0, 0.0)),
+    (GL_TEXTURE_CUBE_MAP_NEGATIVE_X, (-1.0, 0.0, 0.0), (0.0, -1.0, 0.0)),
+    (GL_TEXTURE_CUBE_MAP_POSITIVE_Y, (0.0, 1.0, 0.0), (0.0, 0.0, 1.0)),
+    (GL_TEXTURE_CUBE_MAP_NEGATIVE_Y, (0.0, -1.0, 0.0), (0.0, 0.0, -1.0)),
+    (GL_TEXTURE_CUBE_MAP_POSITIVE_Z, (0.0, 0.0, 1.0), (0.0, -1.0, 0.0)),
+    (GL_TEXTURE_CUBE_MAP_NEGATIVE_Z, (0.0, 0.0, -1.0), (0.0, -1.0, 0.0))
+]
+
+# Проекция грани: 90 градусов, квадрат
+PROBE_NEAR = 0.05
+PROBE_FAR = 100.0
+PROBE_PROJECTION = perspective_matrix(90.0, 1.0, PROBE_NEAR, PROBE_FAR)
+
+
+class CubeMapProbe:
+    """Кубическая карта окружения, снятая из центра одного объекта.
+
+    У каждой грани свой ключ - состояние сцены, для которого она снята.
+    Грань устарела, если её ключ не совпадает с текущим ключом зонда.
+    """
+    def __init__(self, index, size):
+        self.index = index  # Номер объекта в SceneStore
+        self.size = size
+        self.key = None
+        self.face_keys = [None] * len(CUBE_FACES)
+        self.renders = 0
+
+        self.texture = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_CUBE_MAP, self.texture)
+        glTexParameteri(GL_TEXTURE_CUBE_MAP, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_CUBE_MAP, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+        for param in (GL_TEXTURE_WRAP_S, GL_TEXTURE_WRAP_T, GL_TEXTURE_WRAP_R):
+            glTexParameteri(GL_TEXTURE_CUBE_MAP, param, GL_CLAMP_TO_EDGE)
+        for target, _, _ in CUBE_FACES:
+            glTexImage2D(target, 0, GL_RGBA8, size, size, 0, GL_RGBA, GL_UNSIGNED_BYTE, None)
+        glBindTexture(GL_TEXTURE_CUBE_MAP, 0)
+
+        self.depth = glGenRenderbuffers(1)
+        glBindRenderbuffer(GL_RENDERBUFFER, self.depth)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH_COMPONENT24, size, size)
+        glBindRenderbuffer(GL_RENDERBUFFER, 0)
+
+        self.fbo = glGenFramebuffers(1)
+
+    @property
+    def ready(self):
+        """Все грани сняты хотя бы раз"""
+        return all(key is not None for key in self.face_keys)
+
+    def stale_face(self):
+        """Номер первой устаревшей грани или None"""
+        for face, key in enumerate(self.face_keys):
+            if key != self.key:
+                return face
+        return None
+
+    def delete(self):
+        glDeleteFramebuffers(1, [self.fbo])
+        glDeleteRenderbuffers(1, [self.depth])
+        glDeleteTextures([self.texture])
+
+
+class ProbeManager:
+    """Зонды окружения для зеркальных объектов с ленивым обновлением.
+
+    Зонд есть у каждого зеркального объекта (не больше max_probes).
+    Его ключ складывается из версии источников света, внешнего состояния
+    (зеркальная стена и т.п.) и данных объектов в радиусе influence_radius
+    от зонда: изменения дальше этого радиуса грани не устаревают.
+    update() перерисовывает не больше faces_per_frame граней за вызов,
+    по кругу между зондами, так что обновление размазывается по кадрам.
+    """
+    def __init__(self, size=128, influence_radius=3.0, max_probes=8, faces_per_frame=1):
+        self.size = size
+        self.influence_radius = influence_radius
+        self.max_probes = max_probes
+        self.faces_per_frame = faces_per_frame
+        self.probes = {}  # номер объекта -> CubeMapProbe
+        self.keys_version = None
+        self.next_probe = 0
+        self.face_renders = 0
+
+    def sync(self, store, lights, extra_key=()):
+        """Заводит/удаляет зонды по зеркальным объектам и пересчитывает их ключи"""
+        version = (store.version, lights.version, extra_key)
+        if version == self.keys_version:
+            return
+        self.keys_version = version
+
+        wanted = np.flatnonzero(store.mirror)[:self.max_probes].tolist()
+        for index in [i for i in self.probes if i not in wanted]:
+            self.probes.pop(index).delete()
+        for index in wanted:
+            if index not in self.probes:
+                self.probes[index] = CubeMapProbe(index, self.size)
+
+        if not self.probes:
+            return
+        mins, maxs = object_bounds(store)
+        for index, probe in self.probes.items():
+            center = store.positions[index]
+            # Расстояние от центра зонда до бокса каждого объекта
+            gap = np.maximum(np.maximum(mins - center, center - maxs), 0.0)
+            near = np.flatnonzero(np.einsum('ij,ij->i', gap, gap) <=
+                                  self.influence_radius ** 2)
+            near = near[near != index]
+            probe.key = (lights.version, extra_key, center.tobytes(), near.tobytes(),
+                         store.positions[near].tobytes(), store.scales[near].tobytes(),
+                         store.colors[near].tobytes(), store.flags[near].tobytes(),
+                         store.types[near].tobytes())
+
+    def update(self, render_face):
+        """Перерисовывает устаревшие грани (не больше faces_per_frame за вызов).
+
+        render_face(probe, face, projection, view) рисует сцену в текущий
+        framebuffer; матрицы уже загружены в OpenGL.
+        """
+        budget = self.faces_per_frame
+        indices = sorted(self.probes)
+        if not indices or budget <= 0:
+            return
+
+        saved_fbo = glGetIntegerv(GL_DRAW_FRAMEBUFFER_BINDING)
+        saved_viewport = glGetIntegerv(GL_VIEWPORT)
+        rendered = False
+        for step in range(len(indices)):
+            if budget <= 0:
+                break
+            probe = self.probes[indices[(self.next_probe + step) % len(indices)]]
+            face = probe.stale_face()
+            while face is not None and budget > 0:
+                self.render_face(probe, face, render_face)
+                rendered = True
+                budget -= 1
+                face = probe.stale_face()
+            if face is None:
+                # Зонд готов - следующий вызов начнёт со следующего
+                self.next_probe = (self.next_probe + step + 1) % len(indices)
+        if rendered:
+            glBindFramebuffer(GL_FRAMEBUFFER, saved_fbo)
+            glViewport(*saved_viewport)
+
+    def render_face(self, probe, face, render_face):
+        """Снимает одну грань зонда"""
+        target, direction, up = CUBE_FACES[face]
+        glBindFramebuffer(GL_FRAMEBUFFER, probe.fbo)
+        glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, target, probe.texture, 0)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, GL_RENDERBUFFER,
+                                  probe.depth)
+        glViewport(0, 0, probe.size, probe.size)
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+
+        center = np.frombuffer(probe.key[2], dtype=np.float32).astype(float)
+        view = look_at_matrix(center, center + np.array(direction), up)
+        render_face(probe, face, PROBE_PROJECTION, view)
+
+        probe.face_keys[face] = probe.key
+        probe.renders += 1
+        self.face_renders += 1
+
+    def ready_probe(self, index):
+        """Готовый зонд объекта index или None"""
+        probe = self.probes.get(index)
+        if probe is not None and probe.ready:
+            return probe
+        return None
+
+    def bind(self, gl, probe, view_rotation_inverse):
+        """Включает отражение окружения зонда (texgen GL_REFLECTION_MAP).
+
+        Отражённый вектор texgen выдаёт в координатах вида, матрица
+        текстуры поворачивает его обратно в мировые.
+        """
+        glBindTexture(GL_TEXTURE_CUBE_MAP, probe.texture)
+        glTexEnvi(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_MODULATE)
+        gl.enable(GL_TEXTURE_CUBE_MAP)
+        for coord, cap in ((GL_S, GL_TEXTURE_GEN_S), (GL_T, GL_TEXTURE_GEN_T),
+                           (GL_R, GL_TEXTURE_GEN_R)):
+            glTexGeni(coord, GL_TEXTURE_GEN_MODE, GL_REFLECTION_MAP)
+            gl.enable(cap)
+
+        glMatrixMode(GL_TEXTURE)
+        glLoadMatrixf(view_rotation_inverse)
+        glMatrixMode(GL_MODELVIEW)
+
+    def unbind(self, gl):
+        """Выключает отражение окружения"""
+        glMatrixMode(GL_TEXTURE)
+        glLoadIdentity()
+        glMatrixMode(GL_MODELVIEW)
+        for cap in (GL_TEXTURE_GEN_S, GL_TEXTURE_GEN_T, GL_TEXTURE_GEN_R):
+            gl.disable(cap)
+        gl.disable(GL_TEXTURE_CUBE_MAP)
+        glBindTexture(GL_TEXTURE_CUBE_MAP, 0)
+
+    def delete(self):
+        for probe in self.probes.values():
+            probe.delete()
+        self.probes.clear()
+        self.keys_version = None
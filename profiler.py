@@ -0,0 +1,268 @@
+"""Замеры времени кадра по фазам, кольцевой буфер кадров, выделения памяти по фазам
+и сводка распределения времён"""
+import contextlib
+import gc
+import json
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+
+# Пустой контекст выключенного таймера (один на всех - он ничего не хранит)
+NULL_PHASE = contextlib.nullcontext()
+
+
+def summarize(times):
+    """Среднее, перцентили и максимум времён (мс) словарём для отчёта"""
+    times = np.asarray(times, dtype=np.float64)
+    if len(times) == 0:
+        return {'mean': 0.0, 'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'max': 0.0}
+    p50, p95, p99 = np.percentile(times, [50, 95, 99])
+    return {'mean': float(times.mean()), 'p50': float(p50), 'p95': float(p95),
+            'p99': float(p99), 'max': float(times.max())}
+
+
+class PhaseTimer:
+    """Время фаз кадра в миллисекундах: with timer.phase('shadows'): ...
+
+    Время фазы копится между begin_frame() и end_frame() (фаза может
+    выполниться за кадр несколько раз). Фазы могут вкладываться друг в
+    друга (walls внутри reflection), тогда время внутренней входит и во
+    внешнюю. Выключенный таймер ничего не мерит. sync вызывается в конце
+    каждой фазы - например, glFinish, чтобы в фазу попала работа GPU,
+    а не только отправка команд.
+
+    Последние capacity кадров (время кадра и интервалы фаз) хранятся в
+    кольцевом буфере: из него строятся график кадров и трасса Chrome.
+    """
+    def __init__(self, sync=None, capacity=600):
+        self.enabled = False
+        self.sync = sync
+        self.allocations = None  # AllocationTracker: выделения памяти по тем же фазам
+        self.frame = {}
+        self.events = []        # Интервалы фаз кадра: (имя, начало с, длительность мс)
+        self.frame_start = None
+
+        # Кольцевой буфер: head - слот следующего кадра, count - заполнено слотов
+        self.capacity = capacity
+        self.frame_ms = np.zeros(capacity, dtype=np.float32)
+        self.frame_starts = np.zeros(capacity, dtype=np.float64)
+        self.frame_events = [None] * capacity
+        self.head = 0
+        self.count = 0
+
+    def begin_frame(self):
+        self.frame = {}
+        self.events = []
+        self.frame_start = time.perf_counter() if self.enabled else None
+        if self.enabled and self.allocations is not None:
+            self.allocations.begin_frame()
+
+    def phase(self, name):
+        """Контекст замера фазы name"""
+        if not self.enabled:
+            return NULL_PHASE
+        return self.measure(name)
+
+    @contextlib.contextmanager
+    def measure(self, name):
+        allocations = self.allocations
+        if allocations is not None:
+            allocations.begin(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.sync is not None:
+                self.sync()
+            elapsed = (time.perf_counter() - start) * 1000.0
+            self.frame[name] = self.frame.get(name, 0.0) + elapsed
+            self.events.append((name, start, elapsed))
+            if allocations is not None:
+                allocations.end()
+
+    def end_frame(self):
+        """Времена фаз закончившегося кадра: {фаза: мс}; кадр уходит в кольцевой буфер"""
+        frame = self.frame
+        if self.allocations is not None and self.allocations.in_frame:
+            self.allocations.end_frame()
+        if self.enabled and self.frame_start is not None:
+            slot = self.head
+            self.frame_starts[slot] = self.frame_start
+            self.frame_ms[slot] = (time.perf_counter() - self.frame_start) * 1000.0
+            self.frame_events[slot] = self.events
+            self.head = (slot + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+        self.frame = {}
+        self.events = []
+        self.frame_start = None
+        return frame
+
+    def clear(self):
+        """Забывает записанные кадры"""
+        self.head = 0
+        self.count = 0
+        self.frame_events = [None] * self.capacity
+
+    def recent_slots(self, frames=None):
+        """Слоты последних frames кадров (все записанные при None) от старого к новому"""
+        count = self.count if frames is None else min(frames, self.count)
+        return (self.head - count + np.arange(count)) % self.capacity
+
+    def recent_frame_ms(self, frames=None):
+        """Времена последних кадров (мс) от старого к новому"""
+        return self.frame_ms[self.recent_slots(frames)]
+
+    def chrome_trace(self, frames=None):
+        """Последние кадры в формате Chrome Trace Event (chrome://tracing, Perfetto)"""
+        slots = self.recent_slots(frames)
+        if len(slots) == 0:
+            return {'traceEvents': [], 'displayTimeUnit': 'ms'}
+        origin = self.frame_starts[slots[0]]
+        events = []
+        for number, slot in enumerate(slots):
+            # Полные события 'X': начало и длительность в микросекундах
+            start = (self.frame_starts[slot] - origin) * 1e6
+            events.append({'name': 'frame', 'ph': 'X', 'pid': 0, 'tid': 0, 'ts': start,
+                           'dur': float(self.frame_ms[slot]) * 1000.0,
+                           'args': {'frame': number}})
+            for name, phase_start, elapsed in self.frame_events[slot]:
+                events.append({'name': name, 'ph': 'X', 'pid': 0, 'tid': 0,
+                               'ts': (phase_start - origin) * 1e6, 'dur': elapsed * 1000.0})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def save_chrome_trace(self, path, frames=None):
+        """Записывает трассу последних кадров в JSON; возвращает число кадров"""
+        trace = self.chrome_trace(frames)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(trace, f)
+        return min(self.count, frames) if frames is not None else self.count
+
+
+class AllocationTracker:
+    """Выделения памяти Python и сборки мусора по фазам кадра
+
+    Подключается к PhaseTimer (timer.allocations) и считает для каждой
+    фазы и для кадра целиком (фаза 'frame'):
+    net - на сколько байт выросла живая память, blocks - на сколько блоков;
+    peak - пик памяти сверх начала фазы: временные списки и массивы,
+    освобождённые в той же фазе, в net не видны, а в peak видны;
+    collections и gc_ms - сборки мусора и их паузы во время фазы.
+    Вложенные фазы входят во внешние, как и по времени. Число отдельных
+    выделений tracemalloc не считает, поэтому «мусор» кадра виден по peak
+    и по сборкам. Свои записи трекера дают десятки байт на фазу, а
+    интервалы фаз в кольцевом буфере PhaseTimer - рост net, пока буфер
+    не заполнится.
+
+    tracemalloc замедляет каждое выделение в разы, так что трекер
+    включается только на время поиска (start/stop).
+    """
+    FIELDS = ('net', 'blocks', 'peak', 'collections', 'gc_ms')
+
+    def __init__(self, frames=1):
+        self.frames = frames        # Глубина стека в трассах tracemalloc
+        self.enabled = False
+        self.in_frame = False
+        self.stack = []             # Открытые фазы: [имя, память, блоки, пик, сборки, пауза]
+        self.frame = {}             # Фаза -> числа закончившегося кадра
+        self.totals = {}            # Фаза -> суммы с reset_totals()
+        self.frame_count = 0
+        self.gc_start = None
+
+    def start(self):
+        if self.enabled:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        gc.callbacks.append(self.on_gc)
+        self.enabled = True
+
+    def stop(self):
+        if not self.enabled:
+            return
+        gc.callbacks.remove(self.on_gc)
+        tracemalloc.stop()
+        self.enabled = False
+        self.in_frame = False
+        self.stack = []
+
+    def on_gc(self, phase, info):
+        """Обратный вызов gc: пауза сборки засчитывается всем открытым фазам"""
+        if phase == 'start':
+            self.gc_start = time.perf_counter()
+        elif self.gc_start is not None:
+            pause = (time.perf_counter() - self.gc_start) * 1000.0
+            self.gc_start = None
+            for entry in self.stack:
+                entry[4] += 1
+                entry[5] += pause
+
+    def begin(self, name):
+        if not self.in_frame:
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        # Пик сбрасывается для новой фазы - открытые запоминают свой до сброса
+        for entry in self.stack:
+            entry[3] = max(entry[3], peak)
+        tracemalloc.reset_peak()
+        self.stack.append([name, current, sys.getallocatedblocks(), current, 0, 0.0])
+
+    def end(self):
+        if not self.in_frame:
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        blocks = sys.getallocatedblocks()
+        name, start, start_blocks, phase_peak, collections, pause = self.stack.pop()
+        stats = self.frame.get(name)
+        if stats is None:
+            stats = self.frame[name] = dict.fromkeys(self.FIELDS, 0)
+        stats['net'] += current - start
+        stats['blocks'] += blocks - start_blocks
+        stats['peak'] = max(stats['peak'], max(phase_peak, peak) - start)
+        stats['collections'] += collections
+        stats['gc_ms'] += pause
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        self.frame = {}
+        self.stack = []
+        self.in_frame = True
+        self.begin('frame')
+
+    def end_frame(self):
+        """Числа закончившегося кадра: {фаза: {поле: значение}}"""
+        # Фазы, не закрытые из-за исключения, закрываются вместе с кадром
+        while self.stack:
+            self.end()
+        self.in_frame = False
+        for name, stats in self.frame.items():
+            total = self.totals.setdefault(name, dict.fromkeys(self.FIELDS, 0))
+            for field in self.FIELDS:
+                total[field] += stats[field]
+        self.frame_count += 1
+        return self.frame
+
+    def reset_totals(self):
+        self.totals = {}
+        self.frame_count = 0
+
+    def averages(self):
+        """Средние на кадр с reset_totals(): {фаза: {поле: значение}}"""
+        count = max(self.frame_count, 1)
+        return {name: {field: total[field] / count for field in self.FIELDS}
+                for name, total in self.totals.items()}
+
+    def report_lines(self):
+        """Таблица средних на кадр, фазы по убыванию пика выделений"""
+        averages = self.averages()
+        lines = [f"Выделения памяти за {self.frame_count} кадров (средние на кадр):",
+                 f"{'фаза':>14} {'пик, КБ':>9} {'рост, Б':>9} {'блоки':>7} "
+                 f"{'сборки':>7} {'GC, мс':>7}"]
+        for name, stats in sorted(averages.items(), key=lambda item: -item[1]['peak']):
+            lines.append(f"{name:>14} {stats['peak'] / 1024.0:9.1f} {stats['net']:9.0f} "
+                         f"{stats['blocks']:7.1f} {stats['collections']:7.2f} "
+                         f"{stats['gc_ms']:7.2f}")
+        return lines
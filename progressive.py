@@ -0,0 +1,190 @@
+"""Интерактивная трассировка путей: кадр уточняется в фоне, пока вид не меняется
+
+Процессы пула трассируют полосы изображения (pathtracer.render_tile),
+фоновый поток копит их среднее, а главный поток только рисует накопленное
+текстурой. Движение камеры или изменение сцены сбрасывает накопление.
+"""
+import multiprocessing
+import threading
+
+import numpy as np
+from OpenGL.GL import *
+
+from denoise import denoise_image
+from pathtracer import AOV_CHANNEL_COUNT, render_tile
+
+
+def _trace_band(args):
+    """Задача пула: полоса изображения (сцена приходит вместе с задачей)"""
+    scene, band, width, height, spp, max_depth, seed = args
+    return render_tile(scene, band, width, height, spp, max_depth, seed, aovs=True)
+
+
+class ProgressiveTracer:
+    """Интерактивная трассировка путей с накоплением в фоне.
+
+    Фоновый поток раздаёт процессам пула полосы изображения по spp_per_pass
+    путей на пиксель и складывает результат в буфер накопления (float64);
+    на экран выводится среднее. Поток окна только сверяет ключ состояния
+    (камера и сцена) и забирает готовое среднее, поэтому интерфейс не ждёт
+    трассировку. Накопление сбрасывается только при смене ключа: проход,
+    начатый для старого ключа, отбрасывается.
+
+    Вместе с цветом копятся вспомогательные буферы (нормаль, albedo,
+    расстояние); при denoise=True среднее после каждого прохода очищается
+    фильтром à-trous - тоже в фоновом потоке.
+    """
+    def __init__(self, width, height, spp_per_pass=1, max_depth=4, processes=None):
+        self.width = width
+        self.height = height
+        self.spp_per_pass = spp_per_pass
+        self.max_depth = max_depth
+        self.processes = processes or max(1, multiprocessing.cpu_count() - 1)
+        self.exposure = 1.0
+        self.denoise = False
+
+        self.key = None
+        self.scene = None
+        self.generation = 0
+        self.accumulator = np.zeros((height, width, AOV_CHANNEL_COUNT))
+        self.display = None  # Готовое к выводу среднее (h, w, 3)
+        self.samples = 0
+        self.passes = 0
+        self.rays = 0
+        self.updated = False
+        self.texture = None
+
+        # Процессы запускаются заново (spawn), а не копией окна: fork унаследовал бы
+        # контекст OpenGL и обработчики сигналов SDL, и terminate() их не остановил бы
+        self.pool = multiprocessing.get_context('spawn').Pool(self.processes)
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def sync(self, key, make_scene):
+        """Сбрасывает накопление, если key изменился; make_scene() даёт новую TracerScene"""
+        if key == self.key:
+            return
+        scene = make_scene()
+        with self.lock:
+            self.key = key
+            self.scene = scene
+            self.generation += 1
+            self.accumulator[:] = 0.0
+            self.display = None
+            self.samples = 0
+            self.updated = True
+        self.wake.set()
+
+    def bands(self):
+        """Полосы строк: по две на процесс, чтобы устаревший проход бросался быстрее"""
+        count = min(self.height, 2 * self.processes)
+        edges = np.linspace(0, self.height, count + 1).astype(int)
+        return [(0, int(y0), self.width, int(y1)) for y0, y1 in zip(edges[:-1], edges[1:])
+                if y1 > y0]
+
+    def run(self):
+        """Цикл фонового потока: проход за проходом, пока сцена не сменится"""
+        while self.running:
+            with self.lock:
+                scene, generation, seed = self.scene, self.generation, self.passes
+                self.passes += 1
+            if scene is None:
+                self.wake.wait(0.1)
+                self.wake.clear()
+                continue
+
+            tasks = [(scene, band, self.width, self.height, self.spp_per_pass, self.max_depth,
+                      seed) for band in self.bands()]
+            image = np.zeros((self.height, self.width, AOV_CHANNEL_COUNT))
+            rays = 0
+            stale = False
+            for (x0, y0, x1, y1), pixels, band_rays in self.pool.imap_unordered(_trace_band,
+                                                                              tasks):
+                if generation != self.generation or not self.running:
+                    stale = True
+                    break
+                image[y0:y1, x0:x1] = pixels
+                rays += band_rays
+            if stale:
+                continue
+
+            with self.lock:
+                if generation != self.generation:
+                    continue
+                self.accumulator += image * self.spp_per_pass
+                self.samples += self.spp_per_pass
+                self.rays += rays
+                average = self.accumulator / self.samples
+
+            display = denoise_image(average) if self.denoise else average[..., :3]
+            with self.lock:
+                if generation == self.generation:
+                    self.display = display
+                    self.updated = True
+
+    def draw(self, gl, screen_width, screen_height):
+        """Выводит среднее на весь экран; False, если путей для текущего вида ещё нет"""
+        with self.lock:
+            image = self.display if self.updated else None
+            ready = self.display is not None
+            self.updated = False
+        if not ready:
+            return False
+
+        if self.texture is None:
+            self.texture = glGenTextures(1)
+            glBindTexture(GL_TEXTURE_2D, self.texture)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+            glTexImage2D(GL_TEXTURE_2D, 0, GL_RGB8, self.width, self.height, 0,
+                         GL_RGB, GL_UNSIGNED_BYTE, None)
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        if image is not None:
+            # Строка 0 буфера - верх экрана, у текстуры - низ
+            pixels = (np.clip(image[::-1] * self.exposure, 0.0, 1.0) * 255.0 + 0.5)
+            glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+            glTexSubImage2D(GL_TEXTURE_2D, 0, 0, 0, self.width, self.height, GL_RGB,
+                            GL_UNSIGNED_BYTE, np.ascontiguousarray(pixels.astype(np.uint8)))
+            glPixelStorei(GL_UNPACK_ALIGNMENT, 4)
+
+        gl.disable(GL_LIGHTING)
+        gl.disable(GL_DEPTH_TEST)
+        gl.enable(GL_TEXTURE_2D)
+        glTexEnvi(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_REPLACE)
+        glMatrixMode(GL_PROJECTION)
+        glPushMatrix()
+        glLoadIdentity()
+        glMatrixMode(GL_MODELVIEW)
+        glPushMatrix()
+        glLoadIdentity()
+        glBegin(GL_QUADS)
+        for u, v in ((0.0, 0.0), (1.0, 0.0), (1.0, 1.0), (0.0, 1.0)):
+            glTexCoord2f(u, v)
+            glVertex2f(2.0 * u - 1.0, 2.0 * v - 1.0)
+        glEnd()
+        glPopMatrix()
+        glMatrixMode(GL_PROJECTION)
+        glPopMatrix()
+        glMatrixMode(GL_MODELVIEW)
+        glTexEnvi(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_MODULATE)
+        gl.disable(GL_TEXTURE_2D)
+        glBindTexture(GL_TEXTURE_2D, 0)
+        gl.enable(GL_DEPTH_TEST)
+        gl.enable(GL_LIGHTING)
+        return True
+
+    def stop(self):
+        """Останавливает поток и процессы пула"""
+        # Поток бросает проход на следующей готовой полосе; пул останавливается
+        # после него, иначе imap_unordered в потоке ждал бы полосы вечно
+        self.running = False
+        self.wake.set()
+        self.thread.join()
+        self.pool.terminate()
+        self.pool.join()
+        if self.texture is not None:
+            glDeleteTextures([self.texture])
+            self.texture = None
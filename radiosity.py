@@ -0,0 +1,369 @@
+"""Излучательность (радиосити) корнуэльской комнаты с кэшем форм-факторов
+
+Стены из create_room_walls и грани объектов делятся на патчи. Форм-факторы
+между патчами считаются векторизованно: аналитическое приближение диском
+и видимость по нескольким случайным лучам между точками патчей (через BVH
+трассировщика). Матрица зависит только от геометрии и сохраняется на диск
+(np.savez) под хэшем геометрии. Точечные источники дают прямую
+освещённость патчей, переотражения раздаются прогрессивным "выстрелом"
+непереданной энергии - поэтому сдвиг или выключение источника пересчитывается
+за миллисекунды без пересчёта геометрии.
+"""
+import hashlib
+import os
+import time
+
+import numpy as np
+from OpenGL.GL import *
+
+from culling import BVH, object_bounds
+from geometry import CUBE_FACES, unit_sphere_arrays
+from pathtracer import EPSILON, intersect_objects
+
+
+# Каталог кэша форм-факторов (и других запечённых данных)
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
+
+# Меняется вместе с формулами - старые файлы кэша перестают подходить
+FORM_FACTOR_FORMAT = 1
+
+# Сколько строк матрицы форм-факторов считается за раз (ограничивает память)
+FORM_FACTOR_CHUNK = 64
+
+
+class Occluders:
+    """Объекты сцены как препятствия для лучей (то, что нужно intersect_objects)"""
+    def __init__(self, objects):
+        self.types = objects.types.copy()
+        self.centers = objects.positions.astype(np.float64)
+        self.extents = np.abs(objects.scales).astype(np.float64)
+        self.bvh = BVH(*object_bounds(objects), leaf_size=4)
+
+
+def grid_patches(grid, outward):
+    """Патчи сетки вершин (R + 1, C + 1, 3): центры, нормали, площади, полуоси
+
+    outward (R, C, 3) - в какую сторону должна смотреть нормаль патча.
+    """
+    p00, p10 = grid[:-1, :-1], grid[1:, :-1]
+    p11, p01 = grid[1:, 1:], grid[:-1, 1:]
+    centers = (p00 + p10 + p11 + p01) / 4.0
+    cross = np.cross(p11 - p00, p01 - p10)
+    areas = 0.5 * np.linalg.norm(cross, axis=-1)
+    normals = cross / np.maximum(2.0 * areas, 1e-12)[..., None]
+    flip = np.einsum('...k,...k->...', normals, outward) < 0.0
+    normals[flip] *= -1.0
+    axis_u = ((p10 + p11) - (p00 + p01)) / 4.0
+    axis_v = ((p01 + p11) - (p00 + p10)) / 4.0
+    return (centers.reshape(-1, 3), normals.reshape(-1, 3), areas.ravel(),
+            axis_u.reshape(-1, 3), axis_v.reshape(-1, 3))
+
+
+def wall_grid(vertices, resolution):
+    """Билинейная сетка вершин стены (resolution + 1)^2"""
+    v = np.asarray(vertices, dtype=np.float64)
+    s = np.linspace(0.0, 1.0, resolution + 1)[:, None, None]
+    t = np.linspace(0.0, 1.0, resolution + 1)[None, :, None]
+    return ((1 - s) * (1 - t) * v[0] + s * (1 - t) * v[1] + s * t * v[2] +
+            (1 - s) * t * v[3])
+
+
+class RadiositySolver:
+    """Патчи комнаты, матрица форм-факторов и прогрессивное решение.
+
+    sync() строит патчи и форм-факторы (или берёт их из кэша) только при
+    изменении геометрии; solve() пересчитывает прямой свет и переотражения
+    при любых изменениях источников или цветов. Видимость источника из
+    патчей кэшируется по его позиции. Зеркала и прозрачные объекты
+    считаются диффузными и непрозрачными: радиосити описывает только
+    диффузный обмен светом.
+
+    object_patches=False - патчи только на стенах, объекты лишь заслоняют
+    лучи (свет от них не отражается). Так число патчей не зависит от
+    числа объектов: матрица форм-факторов n x n тысяч объектов с
+    патчами на гранях не поместилась бы в память.
+    """
+    def __init__(self, wall_resolution=12, cube_resolution=3, sphere_slices=12,
+                 sphere_stacks=8, samples=4, cache_dir=CACHE_DIR, object_patches=True):
+        self.wall_resolution = wall_resolution
+        self.object_patches = object_patches
+        self.cube_resolution = cube_resolution
+        self.sphere_slices = sphere_slices
+        self.sphere_stacks = sphere_stacks
+        self.samples = samples
+        self.cache_dir = cache_dir
+
+        self.geometry_key = None
+        self.solution_key = None
+        self.surfaces = []  # (вид, номер стены или объекта, строк, столбцов, первый патч)
+        self.transfer = None
+        self.light_visibility = {}
+        self.radiosity = None
+        self.exposure = 1.0
+
+        self.form_factor_seconds = 0.0
+        self.loaded_from_cache = False
+        self.solve_ms = 0.0
+        self.shots = 0
+
+    def __len__(self):
+        return 0 if self.radiosity is None else len(self.radiosity)
+
+    def geometry_hash(self, walls, objects):
+        """Хэш всего, от чего зависят патчи и форм-факторы"""
+        digest = hashlib.sha1()
+        digest.update(np.array([FORM_FACTOR_FORMAT, self.wall_resolution, self.cube_resolution,
+                                self.sphere_slices, self.sphere_stacks,
+                                self.samples, self.object_patches]).tobytes())
+        for name, vertices, normal in walls:
+            digest.update(name.encode())
+            digest.update(np.asarray(vertices, dtype=np.float64).tobytes())
+        digest.update(objects.types.tobytes())
+        digest.update(objects.positions.tobytes())
+        digest.update(objects.scales.tobytes())
+        return digest.hexdigest()
+
+    def sync(self, walls, objects):
+        """Перестраивает патчи и форм-факторы, если геометрия изменилась"""
+        key = self.geometry_hash(walls, objects)
+        if key == self.geometry_key:
+            return
+        self.geometry_key = key
+        self.solution_key = None
+        self.light_visibility = {}
+        self.occluders = Occluders(objects)
+        self.build_patches(walls, objects)
+
+        path = os.path.join(self.cache_dir, f'form_factors_{key}.npz')
+        start = time.perf_counter()
+        self.loaded_from_cache = os.path.exists(path)
+        if self.loaded_from_cache:
+            with np.load(path) as data:
+                form_factors = data['form_factors']
+        else:
+            form_factors = self.compute_form_factors()
+            os.makedirs(self.cache_dir, exist_ok=True)
+            np.savez_compressed(path, form_factors=form_factors)
+        self.form_factor_seconds = time.perf_counter() - start
+
+        # Строка i - доля света патча i, которая достаётся каждому j: F_ji = F_ij A_i / A_j
+        # (в float32 на месте - без временной матрицы float64 того же размера)
+        areas = self.areas.astype(np.float32)
+        self.transfer = form_factors.astype(np.float32, copy=False)
+        self.transfer *= areas[:, None]
+        self.transfer /= areas[None, :]
+
+    def build_patches(self, walls, objects):
+        """Делит стены и грани объектов на патчи; сетки вершин идут на отрисовку"""
+        parts = []
+        grids = []
+        self.surfaces = []
+        count = 0
+
+        def add(kind, index, grid, outward, ellipsoid=None):
+            nonlocal count
+            rows, cols = grid.shape[0] - 1, grid.shape[1] - 1
+            patches = grid_patches(grid, outward)
+            if ellipsoid is not None:
+                # Центр плоского квада лежит внутри сферы - переносим его на поверхность,
+                # иначе лучи из патча сразу упирались бы в свою же сферу
+                center, scale = ellipsoid
+                local = (patches[0] - center) / scale
+                local /= np.linalg.norm(local, axis=1, keepdims=True)
+                patches = (center + local * scale,) + patches[1:]
+            parts.append(patches)
+            grids.append(grid)
+            self.surfaces.append((kind, index, rows, cols, count))
+            count += rows * cols
+
+        for index, (name, vertices, normal) in enumerate(walls):
+            n = self.wall_resolution
+            add('wall', index, wall_grid(vertices, n), np.broadcast_to(normal, (n, n, 3)))
+
+        n = self.cube_resolution
+        sphere_vertices, _ = unit_sphere_arrays(self.sphere_slices, self.sphere_stacks)
+        sphere_vertices = sphere_vertices.reshape(self.sphere_stacks + 1,
+                                                  self.sphere_slices + 1, 3).astype(np.float64)
+        for index in range(len(objects) if self.object_patches else 0):
+            center = objects.positions[index].astype(np.float64)
+            scale = objects.scales[index].astype(np.float64)
+            if objects.types[index] == 0:
+                for normal, quad in CUBE_FACES:
+                    grid = wall_grid(np.asarray(quad) * scale + center, n)
+                    add('object', index, grid, np.broadcast_to(normal, (n, n, 3)))
+            else:
+                grid = sphere_vertices * scale + center
+                middle = (grid[:-1, :-1] + grid[1:, 1:]) / 2.0
+                add('object', index, grid, middle - center, (center, scale))
+
+        self.centers, self.normals, self.areas, self.axis_u, self.axis_v = (
+            np.concatenate(arrays) for arrays in zip(*parts))
+        # Вырожденные патчи у полюсов сфер не должны делить на ноль
+        self.areas = np.maximum(self.areas, 1e-9)
+
+        # Все вершины сеток подряд и индексы квадов для отрисовки
+        self.grid_starts = np.cumsum([0] + [g.shape[0] * g.shape[1] for g in grids])
+        self.vertices = np.concatenate([g.reshape(-1, 3) for g in grids]).astype(np.float32)
+        quads = []
+        for grid, start in zip(grids, self.grid_starts):
+            rows, cols = grid.shape[0] - 1, grid.shape[1] - 1
+            a = (start + np.arange(rows)[:, None] * (cols + 1) + np.arange(cols)[None, :]).ravel()
+            quads.append(np.stack([a, a + cols + 1, a + cols + 2, a + 1], axis=1))
+        self.quads = np.ascontiguousarray(np.concatenate(quads).ravel(), dtype=np.uint32)
+        self.colors = np.zeros_like(self.vertices)
+
+    def compute_form_factors(self):
+        """Матрица F[i, j]: доля света, уходящего с патча i, которая попадает на j
+
+        Приближение диском cos_i cos_j A_j / (pi r^2 + A_j) не расходится на
+        соседних патчах; видимость - доля незаслонённых лучей между
+        случайными точками двух патчей.
+        """
+        n = len(self.areas)
+        rng = np.random.default_rng(0)
+        form_factors = np.zeros((n, n), dtype=np.float32)
+        for start in range(0, n, FORM_FACTOR_CHUNK):
+            rows = np.arange(start, min(start + FORM_FACTOR_CHUNK, n))
+            offsets = self.centers[None, :] - self.centers[rows, None]  # (m, n, 3)
+            r2 = np.maximum(np.einsum('ijk,ijk->ij', offsets, offsets), 1e-12)
+            r = np.sqrt(r2)
+            cos_i = np.einsum('ik,ijk->ij', self.normals[rows], offsets) / r
+            cos_j = -np.einsum('jk,ijk->ij', self.normals, offsets) / r
+            unoccluded = (cos_i > 0.0) & (cos_j > 0.0)
+            unoccluded[np.arange(len(rows)), rows] = False
+            factors = np.where(unoccluded, cos_i * cos_j * self.areas[None, :] /
+                               (np.pi * r2 + self.areas[None, :]), 0.0)
+
+            pair_i, pair_j = np.nonzero(unoccluded)
+            pair_i = rows[pair_i]
+            if len(pair_i) and len(self.occluders.bvh):
+                visible = np.zeros(len(pair_i))
+                for _ in range(self.samples):
+                    a = self.sample_points(pair_i, rng)
+                    b = self.sample_points(pair_j, rng)
+                    directions = b - a
+                    distances = np.linalg.norm(directions, axis=1)
+                    directions /= np.maximum(distances, 1e-12)[:, None]
+                    _, hit = intersect_objects(self.occluders, a, directions,
+                                               np.maximum(distances - 2.0 * EPSILON, 0.0))
+                    visible += hit < 0
+                factors[pair_i - start, pair_j] *= visible / self.samples
+            form_factors[rows] = factors
+        return form_factors
+
+    def sample_points(self, patches, rng):
+        """Случайные точки патчей, чуть приподнятые над поверхностью"""
+        s = rng.uniform(-1.0, 1.0, (len(patches), 1))
+        t = rng.uniform(-1.0, 1.0, (len(patches), 1))
+        return (self.centers[patches] + s * self.axis_u[patches] + t * self.axis_v[patches] +
+                self.normals[patches] * EPSILON)
+
+    def visibility(self, position):
+        """Видит ли центр каждого патча точку position (кэш по позиции)"""
+        key = position.tobytes()
+        visible = self.light_visibility.get(key)
+        if visible is None:
+            origins = self.centers + self.normals * EPSILON
+            directions = position[None, :] - origins
+            distances = np.linalg.norm(directions, axis=1)
+            directions /= np.maximum(distances, 1e-12)[:, None]
+            _, hit = intersect_objects(self.occluders, origins, directions, distances)
+            visible = self.light_visibility[key] = hit < 0
+        return visible
+
+    def albedo(self, walls, wall_colors, objects):
+        """Диффузный цвет каждого патча"""
+        albedo = np.empty((len(self.areas), 3))
+        for kind, index, rows, cols, start in self.surfaces:
+            if kind == 'wall':
+                color = wall_colors[walls[index][0]][:3]
+            else:
+                color = objects.colors[index, :3]
+            albedo[start:start + rows * cols] = color
+        return albedo
+
+    def direct_light(self, lights):
+        """Яркость, отражённая патчами от источников напрямую (без albedo)
+
+        Та же модель, что в трассировщике: pi * diffuse / pi * cos с
+        затуханием по радиусу кластерного шейдера.
+        """
+        irradiance = np.zeros((len(self.areas), 3))
+        for index in np.flatnonzero(lights.enabled):
+            position = lights.positions[index, :3].astype(np.float64)
+            to_light = position[None, :] - self.centers
+            distances = np.linalg.norm(to_light, axis=1)
+            cosines = np.einsum('ij,ij->i', self.normals, to_light) / np.maximum(distances, 1e-12)
+            radius = lights.radius[index]
+            if np.isfinite(radius):
+                x = np.clip(distances / radius, 0.0, 1.0)
+                attenuation = (1.0 - x * x) ** 2
+            else:
+                attenuation = 1.0
+            weight = np.maximum(cosines, 0.0) * attenuation * self.visibility(position)
+            irradiance += weight[:, None] * lights.diffuse[index, :3]
+        return irradiance
+
+    def solve(self, walls, wall_colors, objects, lights, tolerance=1e-3, batch=64,
+              max_steps=1000):
+        """Прогрессивный выстрел: за шаг отдаёт энергию batch патчей с наибольшей
+        непереданной мощностью, пока её не останется меньше tolerance от исходной
+        """
+        start = time.perf_counter()
+        albedo = self.albedo(walls, wall_colors, objects)
+        emitted = albedo * self.direct_light(lights)
+        radiosity = emitted.copy()
+        unshot = emitted.copy()
+        total = (emitted.sum(axis=1) * self.areas).sum()
+        batch = min(batch, len(self.areas))
+        shots = 0
+
+        for _ in range(max_steps):
+            power = unshot.sum(axis=1) * self.areas
+            if total <= 0.0 or power.sum() <= tolerance * total:
+                break
+            shooters = np.argpartition(power, -batch)[-batch:]
+            gathered = albedo * (self.transfer[shooters].T @ unshot[shooters])
+            unshot[shooters] = 0.0
+            radiosity += gathered
+            unshot += gathered
+            shots += batch
+
+        self.radiosity = radiosity
+        self.shots = shots
+        self.solve_ms = (time.perf_counter() - start) * 1000.0
+        self.update_colors()
+        return radiosity
+
+    def update(self, key, walls, wall_colors, objects, lights):
+        """sync() и solve(), если key (версии сцены и источников) изменился"""
+        self.sync(walls, objects)
+        key = (key, self.geometry_key)
+        if key != self.solution_key:
+            self.solution_key = key
+            self.solve(walls, wall_colors, objects, lights)
+
+    def update_colors(self):
+        """Цвета вершин: среднее соседних патчей той же поверхности"""
+        for (kind, index, rows, cols, start), vertex_start in zip(self.surfaces,
+                                                                   self.grid_starts):
+            patches = self.radiosity[start:start + rows * cols].reshape(rows, cols, 3)
+            padded = np.pad(patches, ((1, 1), (1, 1), (0, 0)), mode='edge')
+            vertex_colors = (padded[:-1, :-1] + padded[1:, :-1] + padded[:-1, 1:] +
+                             padded[1:, 1:]) / 4.0
+            count = (rows + 1) * (cols + 1)
+            self.colors[vertex_start:vertex_start + count] = vertex_colors.reshape(-1, 3)
+
+    def draw(self):
+        """Рисует все патчи цветом решения (освещение должно быть выключено)"""
+        if self.radiosity is None:
+            return
+        colors = np.ascontiguousarray(np.clip(self.colors * self.exposure, 0.0, 1.0),
+                                      dtype=np.float32)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_COLOR_ARRAY)
+        glVertexPointer(3, GL_FLOAT, 0, self.vertices)
+        glColorPointer(3, GL_FLOAT, 0, colors)
+        glDrawElements(GL_QUADS, len(self.quads), GL_UNSIGNED_INT, self.quads)
+        glDisableClientState(GL_COLOR_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
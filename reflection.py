@@ -0,0 +1,136 @@
+import numpy as np
+from OpenGL.GL import *
+
+from transforms import to_gl
+
+
+# Перевод координат отсечения [-1, 1] в текстурные [0, 1]
+TEXTURE_BIAS = np.array([
+    [0.5, 0.0, 0.0, 0.5],
+    [0.0, 0.5, 0.0, 0.5],
+    [0.0, 0.0, 0.5, 0.5],
+    [0.0, 0.0, 0.0, 1.0]
+])
+
+
+class PlanarReflection:
+    """Отражение сцены в плоском зеркале, отрисованное в текстуру.
+
+    Отражённая сцена рисуется во framebuffer object с разрешением
+    scale от экранного. Результат помечается ключом (камера, версии
+    объектов и источников, зеркальная стена...): пока ключ не меняется,
+    текстура используется повторно и второй проход не выполняется.
+
+    Зеркало накладывает текстуру проективно: texgen EYE_LINEAR выдаёт
+    координаты вида, а матрица текстуры = bias * проекция. Точка на
+    плоскости зеркала при отражении остаётся на месте, поэтому попадает
+    в тот же пиксель, что и в отражённом проходе.
+    """
+    def __init__(self, width, height, scale=0.5):
+        self.scale = scale
+        self.width = 0
+        self.height = 0
+        self.texture = glGenTextures(1)
+        self.depth = glGenRenderbuffers(1)
+        self.fbo = glGenFramebuffers(1)
+        self.key = None
+        self.renders = 0
+        self.saved_fbo = 0
+        self.saved_viewport = None
+        self.resize(width, height)
+
+    def resize(self, width, height):
+        """Пересоздаёт текстуру под размер экрана width x height"""
+        self.width = max(1, int(width * self.scale))
+        self.height = max(1, int(height * self.scale))
+
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA8, self.width, self.height, 0,
+                     GL_RGBA, GL_UNSIGNED_BYTE, None)
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+        glBindRenderbuffer(GL_RENDERBUFFER, self.depth)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH_COMPONENT24, self.width, self.height)
+        glBindRenderbuffer(GL_RENDERBUFFER, 0)
+
+        previous = glGetIntegerv(GL_DRAW_FRAMEBUFFER_BINDING)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D,
+                               self.texture, 0)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, GL_RENDERBUFFER,
+                                  self.depth)
+        status = glCheckFramebufferStatus(GL_FRAMEBUFFER)
+        glBindFramebuffer(GL_FRAMEBUFFER, previous)
+        if status != GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError(f"Framebuffer отражения неполный: 0x{int(status):x}")
+        self.key = None
+
+    def set_scale(self, scale, width, height):
+        """Меняет долю экранного разрешения"""
+        if scale != self.scale:
+            self.scale = scale
+            self.resize(width, height)
+
+    def needs_update(self, key):
+        """True, если сохранённое отражение снято для другого состояния сцены"""
+        return key != self.key
+
+    def begin(self, key):
+        """Начинает отражённый проход: framebuffer отражения, свой viewport"""
+        self.key = key
+        self.renders += 1
+        self.saved_fbo = glGetIntegerv(GL_DRAW_FRAMEBUFFER_BINDING)
+        self.saved_viewport = glGetIntegerv(GL_VIEWPORT)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        glViewport(0, 0, self.width, self.height)
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        # Отражение меняет обход вершин на противоположный
+        glFrontFace(GL_CW)
+
+    def end(self):
+        """Возвращает framebuffer и viewport экрана"""
+        glFrontFace(GL_CCW)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.saved_fbo)
+        glViewport(*self.saved_viewport)
+
+    def bind(self, gl, projection):
+        """Включает проективное наложение текстуры отражения"""
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glTexEnvi(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_MODULATE)
+        gl.enable(GL_TEXTURE_2D)
+
+        # Плоскости texgen задаются при единичной матрице вида: s, t, r, q = координаты вида
+        glMatrixMode(GL_MODELVIEW)
+        glPushMatrix()
+        glLoadIdentity()
+        for coord, cap, plane in ((GL_S, GL_TEXTURE_GEN_S, (1.0, 0.0, 0.0, 0.0)),
+                                  (GL_T, GL_TEXTURE_GEN_T, (0.0, 1.0, 0.0, 0.0)),
+                                  (GL_R, GL_TEXTURE_GEN_R, (0.0, 0.0, 1.0, 0.0)),
+                                  (GL_Q, GL_TEXTURE_GEN_Q, (0.0, 0.0, 0.0, 1.0))):
+            glTexGeni(coord, GL_TEXTURE_GEN_MODE, GL_EYE_LINEAR)
+            glTexGenfv(coord, GL_EYE_PLANE, plane)
+            gl.enable(cap)
+        glPopMatrix()
+
+        glMatrixMode(GL_TEXTURE)
+        glLoadMatrixf(to_gl(TEXTURE_BIAS @ projection))
+        glMatrixMode(GL_MODELVIEW)
+
+    def unbind(self, gl):
+        """Выключает наложение отражения"""
+        glMatrixMode(GL_TEXTURE)
+        glLoadIdentity()
+        glMatrixMode(GL_MODELVIEW)
+        for cap in (GL_TEXTURE_GEN_S, GL_TEXTURE_GEN_T, GL_TEXTURE_GEN_R, GL_TEXTURE_GEN_Q):
+            gl.disable(cap)
+        gl.disable(GL_TEXTURE_2D)
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+    def delete(self):
+        glDeleteFramebuffers(1, [self.fbo])
+        glDeleteRenderbuffers(1, [self.depth])
+        glDeleteTextures([self.texture])
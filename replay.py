@@ -0,0 +1,202 @@
+"""Воспроизводимый замер render(): сценарий камеры и клавиш на наборе сцен
+
+Камера и переключения берутся из сценария (timeline.py: записанного
+main.py --record или встроенного облёта), а не из ввода, поэтому
+одинаковые кадры рисуются при каждом запуске. Для каждой сцены из
+SCENARIOS отчёт содержит среднее, p50, p95, p99 и максимум времени
+кадра и те же числа по фазам (PhaseTimer). Фазы мерятся с glFinish в
+конце и вкладываются (walls, opaque и т.д. входят в scene, reflection и
+probes), поэтому складывать их времена нельзя. С --allocations отчёт
+содержит и выделения памяти по фазам (AllocationTracker), но времена
+тогда завышены tracemalloc.
+
+Запуск: python replay.py --frames 600 --output results.json
+        python replay.py --scenarios default objects_1k --compare results.json
+        python replay.py --headless egl --timeline recorded.json
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+# headless - раньше OpenGL: по --headless выбирает платформу PyOpenGL
+from headless import HEADLESS_BACKENDS, parse_size
+import pygame
+from OpenGL.GL import *
+
+from main import CornellBoxApp, SCREEN_WIDTH, SCREEN_HEIGHT
+from profiler import AllocationTracker, summarize
+from timeline import Timeline, scripted_timeline
+
+
+def all_effects(app):
+    """Все объекты зеркальные и прозрачные"""
+    app.objects.reset_effects()
+    app.objects.toggle_mirror(slice(None))
+    app.objects.toggle_transparency(slice(None))
+
+
+# Сцены замера: имя -> подготовка приложения
+SCENARIOS = {
+    'default': lambda app: None,
+    'objects_1k': lambda app: app.create_stress_objects(1000),
+    'objects_10k': lambda app: app.create_stress_objects(10000),
+    'effects': all_effects
+}
+
+
+def git_revision():
+    """Текущий коммит (для сравнения отчётов) или None вне git"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def replay(app, timeline, frames, warmup):
+    """Рисует warmup + frames кадров по сценарию; времена кадров и фаз последних frames"""
+    frame_times = []
+    phase_times = {}
+    app.profiler.enabled = True
+    tracker = app.profiler.allocations
+    for frame in range(warmup + frames):
+        if frame == warmup and tracker is not None:
+            tracker.reset_totals()
+        pygame.event.pump()
+        # Разогрев - с камерой первого кадра; после конца сценарий начинается сначала
+        if frame < warmup:
+            timeline.apply(app, 0, keys=False)
+        else:
+            timeline.apply(app, (frame - warmup) % timeline.length)
+        app.profiler.begin_frame()
+        start = time.perf_counter()
+        app.render()
+        glFinish()  # Ждём GPU, чтобы мерить полный кадр
+        elapsed = (time.perf_counter() - start) * 1000.0
+        phases = app.profiler.end_frame()
+        if frame < warmup:
+            continue
+        frame_times.append(elapsed)
+        for name in set(phase_times) | set(phases):
+            # Фаза, пропущенная в кадре, заняла в нём 0 мс
+            phase_times.setdefault(name, [0.0] * (len(frame_times) - 1)).append(
+                phases.get(name, 0.0))
+    app.profiler.enabled = False
+    return frame_times, phase_times
+
+
+def run_scenario(name, args, timeline):
+    """Отдельное приложение на сцену: кэши одной сцены не ускоряют другую"""
+    app = CornellBoxApp(*args.size, headless=args.headless)
+    pygame.event.set_grab(False)
+    app.show_panels = not args.no_panel
+    app.instanced_rendering = args.instanced
+    app.clustered_lighting = args.clustered
+    app.deferred_shading = args.renderer == 'deferred'
+    app.shadows = args.shadows
+    # Запекание лайтмапов (в фоне или при промахе кэша) сделало бы кадры невоспроизводимыми
+    app.lightmapping = False
+    SCENARIOS[name](app)
+    objects = len(app.objects)
+    tracker = None
+    if args.allocations:
+        tracker = app.profiler.allocations = AllocationTracker()
+        tracker.start()
+    try:
+        frame_times, phase_times = replay(app, timeline, args.frames, args.warmup)
+    finally:
+        app.shutdown()
+    result = {
+        'objects': objects,
+        'frame_ms': summarize(frame_times),
+        'phases_ms': {phase: summarize(times) for phase, times in sorted(phase_times.items())}
+    }
+    if tracker is not None:
+        # Средние на кадр: пик и рост памяти (байты), блоки, сборки мусора и их пауза
+        result['allocations'] = dict(sorted(tracker.averages().items()))
+    return result
+
+
+def print_report(report, baseline=None):
+    """Таблица отчёта; с baseline - изменение среднего и p95 относительно него"""
+    for name, result in report['scenarios'].items():
+        frame = result['frame_ms']
+        print(f"{name} ({result['objects']} объектов): среднее {frame['mean']:.2f} мс, "
+              f"p50 {frame['p50']:.2f}, p95 {frame['p95']:.2f}, p99 {frame['p99']:.2f}")
+        old = baseline['scenarios'].get(name) if baseline else None
+        if old is not None:
+            for key in ('mean', 'p95'):
+                before, after = old['frame_ms'][key], frame[key]
+                change = 100.0 * (after - before) / before if before else 0.0
+                print(f"    {key}: {before:.2f} -> {after:.2f} мс ({change:+.1f}%)")
+        for phase, times in result['phases_ms'].items():
+            print(f"    {phase:>12}: среднее {times['mean']:.2f} мс, p95 {times['p95']:.2f}")
+        for phase, stats in result.get('allocations', {}).items():
+            print(f"    {phase:>12}: пик {stats['peak'] / 1024.0:.1f} КБ, рост {stats['net']:.0f} Б, "
+                  f"сборок {stats['collections']:.2f} ({stats['gc_ms']:.2f} мс)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер render() по сценарию камеры на наборе сцен")
+    parser.add_argument('--frames', type=int, default=300, help="измеряемых кадров на сцену")
+    parser.add_argument('--warmup', type=int, default=10, help="кадров до начала замера")
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS),
+                        default=list(SCENARIOS), help="какие сцены мерить")
+    parser.add_argument('--timeline', default=None,
+                        help="файл сценария JSON (по умолчанию - встроенный облёт комнаты)")
+    parser.add_argument('--output', default=None, help="записать отчёт JSON в файл")
+    parser.add_argument('--compare', default=None,
+                        help="отчёт JSON прошлого замера: показать изменения")
+    parser.add_argument('--size', type=parse_size, default=(SCREEN_WIDTH, SCREEN_HEIGHT),
+                        help="размер кадра ШИРИНАxВЫСОТА")
+    parser.add_argument('--headless', choices=HEADLESS_BACKENDS,
+                        help="без окна и видеокарты: EGL без поверхности или программный OSMesa")
+    parser.add_argument('--no-panel', action='store_true',
+                        help="не рисовать информационные панели")
+    parser.add_argument('--instanced', action='store_true', help="рисовать объекты инстансингом")
+    parser.add_argument('--clustered', action='store_true',
+                        help="освещение по пикселям с кластерным списком источников")
+    parser.add_argument('--renderer', choices=['forward', 'deferred'], default='forward',
+                        help="прямое или отложенное освещение")
+    parser.add_argument('--shadows', action='store_true', help="тени точечных источников")
+    parser.add_argument('--allocations', action='store_true',
+                        help="считать выделения памяти и сборки мусора по фазам (медленнее)")
+    args = parser.parse_args()
+    if args.frames < 1:
+        parser.error("--frames должно быть не меньше 1")
+
+    if args.timeline:
+        timeline = Timeline.load(args.timeline)
+    else:
+        timeline = scripted_timeline(args.frames)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    report = {
+        'revision': git_revision(),
+        'frames': args.frames,
+        'warmup': args.warmup,
+        'size': list(args.size),
+        'timeline': args.timeline,
+        'settings': {'headless': args.headless, 'panel': not args.no_panel,
+                     'instanced': args.instanced, 'clustered': args.clustered,
+                     'renderer': args.renderer, 'shadows': args.shadows,
+                     'allocations': args.allocations},
+        'scenarios': {}
+    }
+    for name in args.scenarios:
+        print(f"Сцена {name}...", file=sys.stderr)
+        report['scenarios'][name] = run_scenario(name, args, timeline)
+
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""Корнуэльская комната без OpenGL: стены, цвета, объекты и источники света
+
+CornellBoxApp берёт данные сцены отсюда, поэтому офлайн-инструменты
+(pathtracer.py, denoise.py) строят ровно ту же комнату без окна и
+контекста OpenGL - например, на сервере без дисплея.
+"""
+import math
+
+import numpy as np
+
+from scene import SceneStore, LightStore, OBJECT_TYPES
+
+
+def camera_vectors(yaw, pitch):
+    """Векторы front, right, up камеры по углам Эйлера (градусы)"""
+    front = np.array([
+        math.cos(math.radians(yaw)) * math.cos(math.radians(pitch)),
+        math.sin(math.radians(pitch)),
+        math.sin(math.radians(yaw)) * math.cos(math.radians(pitch))
+    ])
+    front = front / np.linalg.norm(front)
+    right = np.cross(front, np.array([0.0, 1.0, 0.0]))
+    right = right / np.linalg.norm(right)
+    up = np.cross(right, front)
+    up = up / np.linalg.norm(up)
+    return front, right, up
+
+
+class ViewPoint:
+    """Неподвижная камера (положение и векторы) - без ввода, для офлайн-рендера"""
+    def __init__(self, position=(0.0, 1.0, 2.0), yaw=-90.0, pitch=0.0):
+        self.position = np.array(position, dtype=np.float64)
+        self.yaw = yaw
+        self.pitch = pitch
+        self.front, self.right, self.up = camera_vectors(yaw, pitch)
+
+
+class CornellRoom:
+    """Данные сцены приложения: стены, их цвета, зеркальная стена, объекты и источники
+
+    camera - стартовая точка обзора приложения.
+    """
+    def __init__(self, room_size=5.0):
+        # Цвета для разных стен (как в классической Корнуэльской комнате)
+        self.wall_colors = {
+            'left': [0.8, 0.2, 0.2, 1.0],    # Красная стена
+            'right': [0.2, 0.8, 0.2, 1.0],   # Зелёная стена
+            'back': [0.8, 0.8, 0.8, 1.0],    # Белая задняя стена
+            'floor': [0.8, 0.8, 0.8, 1.0],   # Серый пол
+            'ceiling': [0.8, 0.8, 0.8, 1.0], # Серый потолок
+            'front': [0.5, 0.5, 0.5, 1.0]    # Серая передняя стена
+        }
+
+        # Параметры зеркальной стены (изначально - задняя стена)
+        self.mirror_wall = 'back'  # 'left', 'right', 'back', 'floor', 'ceiling'
+        self.mirror_enabled = False
+
+        # ИСТОЧНИКИ СВЕТА (теперь их 3!) - хранятся массивами NumPy в LightStore
+        self.lights = LightStore([
+            {
+                'id': 0,
+                'position': [0.0, 4.5, 0.0, 1.0],  # Основной свет (сверху)
+                'diffuse': [1.0, 1.0, 1.0, 1.0],
+                'ambient': [0.3, 0.3, 0.3, 1.0],
+                'specular': [1.0, 1.0, 1.0, 1.0],
+                'color': (1.0, 1.0, 0.0),  # Жёлтый
+                'enabled': True,
+                'movable': False  # Основной свет не двигается
+            },
+            {
+                'id': 1,
+                'position': [0.5, 3.0, -2.0, 1.0],  # Второй свет
+                'diffuse': [0.6, 0.8, 0.6, 1.0],  # Зелёноватый
+                'ambient': [0.1, 0.1, 0.1, 1.0],
+                'specular': [0.5, 0.6, 0.5, 1.0],
+                'color': (0.6, 1.0, 0.6),  # Светло-зелёный
+                'enabled': True,
+                'movable': True
+            },
+            {
+                'id': 2,
+                'position': [-1.5, 2.0, -1.5, 1.0],  # Третий свет (новый!)
+                'diffuse': [0.8, 0.6, 0.8, 1.0],  # Фиолетовый
+                'ambient': [0.1, 0.1, 0.1, 1.0],
+                'specular': [0.6, 0.5, 0.6, 1.0],
+                'color': (0.8, 0.6, 1.0),  # Фиолетовый
+                'enabled': True,
+                'movable': True
+            }
+        ])
+
+        # Стены комнаты (вершины не меняются, поэтому считаем их один раз)
+        self.room_size = room_size
+        self.walls = self.create_room_walls()
+
+        # Объекты в комнате (структура массивов; version растёт при каждом изменении)
+        self.objects = SceneStore()
+        self.create_test_objects()
+
+        self.camera = ViewPoint()
+
+    def create_test_objects(self):
+        """Создаем тестовые объекты в комнате (ВСЕ объекты без спецэффектов по умолчанию!)"""
+        # 1. Жёлтый куб - ПРАВЫЙ ПЕРЕДНИЙ УГОЛ
+        self.objects.append({
+            'id': 0,
+            'type': 'cube',
+            'position': [1.2, -1.5, -1.0],
+            'scale': [0.5, 0.5, 0.5],
+            'color': [0.9, 0.9, 0.0, 1.0],
+            'mirror': False,
+            'transparent': False,
+            'shininess': 50.0
+        })
+
+        # 2. Синяя сфера - ЛЕВЫЙ СРЕДНИЙ ПЛАН
+        self.objects.append({
+            'id': 1,
+            'type': 'sphere',
+            'position': [-1.2, -1.0, -1.5],
+            'scale': [0.4, 0.4, 0.4],
+            'color': [0.2, 0.4, 0.9, 1.0],
+            'mirror': False,
+            'transparent': False,
+            'shininess': 100.0
+        })
+
+        # 3. Красный КУБ (НЕПРОЗРАЧНЫЙ по умолчанию!)
+        self.objects.append({
+            'id': 2,
+            'type': 'cube',
+            'position': [0.0, -1.2, -2.0],
+            'scale': [0.5, 0.5, 0.5],
+            'color': [0.9, 0.3, 0.3, 1.0],  # Альфа = 1.0 (непрозрачный)
+            'mirror': False,
+            'transparent': False,  # НЕ прозрачный по умолчанию
+            'shininess': 30.0
+        })
+
+        # 4. Зелёная сфера (НЕЗЕРКАЛЬНАЯ по умолчанию!)
+        self.objects.append({
+            'id': 3,
+            'type': 'sphere',
+            'position': [0.8, -0.3, -2.2],
+            'scale': [0.4, 0.4, 0.4],
+            'color': [0.2, 1.0, 0.2, 1.0],
+            'mirror': False,  # НЕ зеркальная по умолчанию
+            'transparent': False,
+            'shininess': 50.0
+        })
+
+        # 5. Фиолетовая сфера
+        self.objects.append({
+            'id': 4,
+            'type': 'sphere',
+            'position': [-1.0, -1.5, -0.8],
+            'scale': [0.3, 0.3, 0.3],
+            'color': [0.9, 0.2, 0.9, 1.0],
+            'mirror': False,
+            'transparent': False,
+            'shininess': 75.0
+        })
+
+    def create_room_walls(self):
+        """Возвращает стены комнаты: (имя, вершины, нормаль внутрь комнаты)"""
+        half_size = self.room_size / 2.0
+
+        # Задняя стена
+        back_wall = [
+            [-half_size, -half_size, -half_size],
+            [half_size, -half_size, -half_size],
+            [half_size, half_size, -half_size],
+            [-half_size, half_size, -half_size]
+        ]
+
+        # Пол
+        floor = [
+            [-half_size, -half_size, half_size],
+            [half_size, -half_size, half_size],
+            [half_size, -half_size, -half_size],
+            [-half_size, -half_size, -half_size]
+        ]
+
+        # Потолок
+        ceiling = [
+            [-half_size, half_size, -half_size],
+            [half_size, half_size, -half_size],
+            [half_size, half_size, half_size],
+            [-half_size, half_size, half_size]
+        ]
+
+        # Левая стена (красная)
+        left_wall = [
+            [-half_size, -half_size, half_size],
+            [-half_size, -half_size, -half_size],
+            [-half_size, half_size, -half_size],
+            [-half_size, half_size, half_size]
+        ]
+
+        # Правая стена (зелёная)
+        right_wall = [
+            [half_size, -half_size, -half_size],
+            [half_size, -half_size, half_size],
+            [half_size, half_size, half_size],
+            [half_size, half_size, -half_size]
+        ]
+
+        # ПЕРЕДНЯЯ СТЕНА (ПОЛНАЯ)
+        front_wall = [
+            [-half_size, -half_size, half_size],
+            [half_size, -half_size, half_size],
+            [half_size, half_size, half_size],
+            [-half_size, half_size, half_size]
+        ]
+
+        return [
+            ('back', back_wall, [0, 0, 1]),
+            ('floor', floor, [0, 1, 0]),
+            ('ceiling', ceiling, [0, -1, 0]),
+            ('left', left_wall, [1, 0, 0]),
+            ('right', right_wall, [-1, 0, 0]),
+            ('front', front_wall, [0, 0, -1])
+        ]
+
+    def create_stress_objects(self, count, seed=0):
+        """Добавляет в комнату count случайных маленьких кубов и сфер (стресс-сцена)"""
+        rng = np.random.default_rng(seed)
+        limit = self.room_size / 2.0 - 0.3
+        sizes = rng.uniform(0.03, 0.12, count)
+        colors = np.ones((count, 4))
+        colors[:, :3] = rng.random((count, 3))
+        self.objects.extend(
+            types=rng.integers(0, len(OBJECT_TYPES), count),
+            positions=rng.uniform(-limit, limit, (count, 3)),
+            scales=np.repeat(sizes[:, None], 3, axis=1),
+            colors=colors,
+            shininess=rng.uniform(10.0, 100.0, count)
+        )
+
+    def create_stress_lights(self, count, seed=0):
+        """Добавляет count неподвижных точечных источников с ограниченным радиусом"""
+        rng = np.random.default_rng(seed)
+        limit = self.room_size / 2.0 - 0.2
+        self.lights.add_point_lights(
+            positions=rng.uniform(-limit, limit, (count, 3)),
+            colors=rng.uniform(0.1, 0.5, (count, 3)),
+            radius=rng.uniform(0.3, 0.8, count)
+        )
@@ -0,0 +1,416 @@
+import numpy as np
+
+
+# Типы объектов (в массиве хранится номер типа)
+OBJECT_TYPES = ('cube', 'sphere')
+
+# Битовые флаги объектов
+FLAG_MIRROR = 1
+FLAG_TRANSPARENT = 2
+
+# Прозрачность объекта в режиме "прозрачный"
+TRANSPARENT_ALPHA = 0.6
+
+
+class SceneStore:
+    """Объекты сцены в виде структуры массивов NumPy.
+
+    Позиции, масштабы, цвета, блеск, флаги и типы лежат в непрерывных
+    массивах (46 байт на объект), поэтому массовые операции - сброс,
+    переключение флагов на диапазонах, упаковка в буфер экземпляров -
+    векторизуются. Для старого кода store[i] возвращает ObjectView,
+    который ведёт себя как прежний словарь объекта.
+    """
+    def __init__(self, capacity=16):
+        self.count = 0
+        self.version = 0  # Растёт при каждом изменении
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        """Выделяет массивы заданной ёмкости, сохраняя текущие данные"""
+        old = getattr(self, '_types', None)
+        count = self.count
+
+        types = np.zeros(capacity, dtype=np.uint8)
+        positions = np.zeros((capacity, 3), dtype=np.float32)
+        scales = np.ones((capacity, 3), dtype=np.float32)
+        colors = np.ones((capacity, 4), dtype=np.float32)
+        shininess = np.zeros(capacity, dtype=np.float32)
+        flags = np.zeros(capacity, dtype=np.uint8)
+
+        if old is not None and count:
+            types[:count] = self._types[:count]
+            positions[:count] = self._positions[:count]
+            scales[:count] = self._scales[:count]
+            colors[:count] = self._colors[:count]
+            shininess[:count] = self._shininess[:count]
+            flags[:count] = self._flags[:count]
+
+        self._types = types
+        self._positions = positions
+        self._scales = scales
+        self._colors = colors
+        self._shininess = shininess
+        self._flags = flags
+
+    def _reserve(self, extra):
+        """Гарантирует место ещё под extra объектов"""
+        needed = self.count + extra
+        capacity = len(self._types)
+        if needed > capacity:
+            self._allocate(max(needed, 2 * capacity))
+
+    # Массивы только живых объектов (представления, без копирования)
+    @property
+    def types(self):
+        return self._types[:self.count]
+
+    @property
+    def positions(self):
+        return self._positions[:self.count]
+
+    @property
+    def scales(self):
+        return self._scales[:self.count]
+
+    @property
+    def colors(self):
+        return self._colors[:self.count]
+
+    @property
+    def shininess(self):
+        return self._shininess[:self.count]
+
+    @property
+    def flags(self):
+        return self._flags[:self.count]
+
+    @property
+    def mirror(self):
+        """Маска зеркальных объектов"""
+        return (self.flags & FLAG_MIRROR) != 0
+
+    @property
+    def transparent(self):
+        """Маска прозрачных объектов"""
+        return (self.flags & FLAG_TRANSPARENT) != 0
+
+    def type_mask(self, obj_type):
+        """Маска объектов заданного типа ('cube' или 'sphere')"""
+        return self.types == OBJECT_TYPES.index(obj_type)
+
+    def mark_changed(self):
+        """Отмечает изменение объектов"""
+        self.version += 1
+
+    def append(self, obj):
+        """Добавляет объект в формате старого словаря; возвращает его номер"""
+        self._reserve(1)
+        i = self.count
+        self.count += 1
+        self._types[i] = OBJECT_TYPES.index(obj['type'])
+        self._positions[i] = obj['position'][:3]
+        self._scales[i] = obj['scale'][:3]
+        self._colors[i] = obj['color'][:4]
+        self._shininess[i] = obj['shininess']
+        self._flags[i] = ((FLAG_MIRROR if obj.get('mirror') else 0) |
+                          (FLAG_TRANSPARENT if obj.get('transparent') else 0))
+        self.mark_changed()
+        return i
+
+    def extend(self, types, positions, scales, colors, shininess, flags=None):
+        """Добавляет сразу много объектов (массивы одинаковой длины)"""
+        n = len(types)
+        self._reserve(n)
+        start, end = self.count, self.count + n
+        self._types[start:end] = types
+        self._positions[start:end] = positions
+        self._scales[start:end] = scales
+        self._colors[start:end] = colors
+        self._shininess[start:end] = shininess
+        self._flags[start:end] = 0 if flags is None else flags
+        self.count = end
+        self.mark_changed()
+
+    def clear(self):
+        """Удаляет все объекты"""
+        self.count = 0
+        self.mark_changed()
+
+    def _select(self, index):
+        """Нормализует индекс (число, срез, range, массив); None - вне диапазона"""
+        if isinstance(index, (int, np.integer)):
+            if not 0 <= index < self.count:
+                return None
+            return np.array([index])
+        if isinstance(index, range):
+            index = np.arange(index.start, index.stop, index.step)
+        if isinstance(index, slice):
+            return np.arange(self.count)[index]
+        index = np.asarray(index)
+        if index.dtype == bool:
+            return np.flatnonzero(index)
+        return index[(index >= 0) & (index < self.count)]
+
+    def toggle_mirror(self, index):
+        """Переключает зеркальность объекта или диапазона объектов"""
+        selected = self._select(index)
+        if selected is None or len(selected) == 0:
+            return
+        self._flags[selected] ^= FLAG_MIRROR
+        self.mark_changed()
+
+    def toggle_transparency(self, index):
+        """Переключает прозрачность (и альфу цвета) объекта или диапазона"""
+        selected = self._select(index)
+        if selected is None or len(selected) == 0:
+            return
+        self._flags[selected] ^= FLAG_TRANSPARENT
+        transparent = (self._flags[selected] & FLAG_TRANSPARENT) != 0
+        self._colors[selected, 3] = np.where(transparent, TRANSPARENT_ALPHA, 1.0)
+        self.mark_changed()
+
+    def reset_effects(self):
+        """Снимает зеркальность и прозрачность со всех объектов"""
+        self.flags[:] = 0
+        self.colors[:, 3] = 1.0
+        self.mark_changed()
+
+    def bytes_per_object(self):
+        """Сколько байт занимает один объект во всех массивах"""
+        arrays = (self._types, self._positions, self._scales, self._colors,
+                  self._shininess, self._flags)
+        return sum(a.itemsize * (a.size // len(a)) for a in arrays)
+
+    # Совместимость со списком словарей
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [ObjectView(self, i) for i in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return ObjectView(self, index)
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield ObjectView(self, i)
+
+
+def _readonly(view):
+    """Представление строки хранилища только для чтения"""
+    view.flags.writeable = False
+    return view
+
+
+class ObjectView:
+    """Объект сцены с интерфейсом прежнего словаря: obj['position'], obj['mirror']...
+
+    Векторы возвращаются как представления массивов хранилища только для
+    чтения: запись по элементам (obj['color'][3] = 0.6) не увеличила бы
+    version, и кэши сцены (BVH, инстансы, сортировка, зонды) устарели бы.
+    Менять вектор можно только целиком: obj['color'] = (r, g, b, 0.6).
+    """
+    __slots__ = ('store', 'index')
+
+    KEYS = ('id', 'type', 'position', 'scale', 'color', 'mirror', 'transparent', 'shininess')
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    def __getitem__(self, key):
+        store = self.store
+        i = self.index
+        if key == 'position':
+            return _readonly(store._positions[i])
+        if key == 'scale':
+            return _readonly(store._scales[i])
+        if key == 'color':
+            return _readonly(store._colors[i])
+        if key == 'mirror':
+            return bool(store._flags[i] & FLAG_MIRROR)
+        if key == 'transparent':
+            return bool(store._flags[i] & FLAG_TRANSPARENT)
+        if key == 'shininess':
+            return float(store._shininess[i])
+        if key == 'type':
+            return OBJECT_TYPES[store._types[i]]
+        if key == 'id':
+            return i
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        store = self.store
+        i = self.index
+        if key == 'position':
+            store._positions[i] = value[:3]
+        elif key == 'scale':
+            store._scales[i] = value[:3]
+        elif key == 'color':
+            store._colors[i] = value[:4]
+        elif key in ('mirror', 'transparent'):
+            flag = FLAG_MIRROR if key == 'mirror' else FLAG_TRANSPARENT
+            if value:
+                store._flags[i] |= flag
+            else:
+                store._flags[i] &= ~flag & 0xFF
+        elif key == 'shininess':
+            store._shininess[i] = value
+        elif key == 'type':
+            store._types[i] = OBJECT_TYPES.index(value)
+        else:
+            raise KeyError(key)
+        store.mark_changed()
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return self.KEYS
+
+    def __contains__(self, key):
+        return key in self.KEYS
+
+
+class LightStore:
+    """Источники света в виде структуры массивов NumPy.
+
+    Как и SceneStore, отдаёт LightView с интерфейсом прежнего словаря.
+    radius - радиус действия точечного источника (inf - без затухания,
+    как у фиксированного конвейера).
+    """
+    def __init__(self, lights=()):
+        lights = list(lights)
+        n = len(lights)
+        self.count = n
+        self.version = 0
+        self.positions = np.array([l['position'] for l in lights], dtype=np.float32).reshape(n, 4)
+        self.diffuse = np.array([l['diffuse'] for l in lights], dtype=np.float32).reshape(n, 4)
+        self.ambient = np.array([l['ambient'] for l in lights], dtype=np.float32).reshape(n, 4)
+        self.specular = np.array([l['specular'] for l in lights], dtype=np.float32).reshape(n, 4)
+        self.colors = np.array([l['color'] for l in lights], dtype=np.float32).reshape(n, 3)
+        self.enabled = np.array([l['enabled'] for l in lights], dtype=bool)
+        self.movable = np.array([l['movable'] for l in lights], dtype=bool)
+        self.radius = np.array([l.get('radius', np.inf) for l in lights], dtype=np.float32)
+
+    def mark_changed(self):
+        """Отмечает изменение источников"""
+        self.version += 1
+
+    def move(self, index, delta):
+        """Сдвигает источник на вектор delta (xyz)"""
+        self.positions[index, :3] += delta
+        self.mark_changed()
+
+    def add_point_lights(self, positions, colors, radius, ambient=0.0, specular=0.5):
+        """Добавляет неподвижные точечные источники (массивы (N, 3), радиусы (N,))"""
+        n = len(positions)
+        colors = np.asarray(colors, dtype=np.float32).reshape(n, 3)
+        rgba = np.ones((n, 4), dtype=np.float32)
+
+        def extend(array, values):
+            return np.concatenate([array, np.asarray(values, dtype=array.dtype)])
+
+        points = np.ones((n, 4), dtype=np.float32)
+        points[:, :3] = positions
+        self.positions = extend(self.positions, points)
+        rgba[:, :3] = colors
+        self.diffuse = extend(self.diffuse, rgba)
+        self.ambient = extend(self.ambient, np.where(np.arange(4) < 3, rgba * ambient, 1.0))
+        self.specular = extend(self.specular, np.where(np.arange(4) < 3, rgba * specular, 1.0))
+        self.colors = extend(self.colors, colors)
+        self.enabled = extend(self.enabled, np.ones(n, dtype=bool))
+        self.movable = extend(self.movable, np.zeros(n, dtype=bool))
+        self.radius = extend(self.radius, np.broadcast_to(radius, (n,)))
+        self.count += n
+        self.mark_changed()
+
+    def clamp_positions(self, low, high, index=slice(None)):
+        """Ограничивает позиции источников коробкой [low, high] (векторно)"""
+        np.clip(self.positions[index, :3], low, high, out=self.positions[index, :3])
+        self.mark_changed()
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [LightView(self, i) for i in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return LightView(self, index)
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield LightView(self, i)
+
+
+class LightView:
+    """Источник света с интерфейсом прежнего словаря
+
+    Векторы, как и у ObjectView, только для чтения: меняются целиком через
+    light['position'] = ..., чтобы увеличить version хранилища.
+    """
+    __slots__ = ('store', 'index')
+
+    ARRAYS = {
+        'position': 'positions',
+        'diffuse': 'diffuse',
+        'ambient': 'ambient',
+        'specular': 'specular',
+        'color': 'colors'
+    }
+    KEYS = ('id', 'position', 'diffuse', 'ambient', 'specular', 'color', 'enabled', 'movable',
+            'radius')
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    def __getitem__(self, key):
+        if key in self.ARRAYS:
+            return _readonly(getattr(self.store, self.ARRAYS[key])[self.index])
+        if key == 'enabled':
+            return bool(self.store.enabled[self.index])
+        if key == 'movable':
+            return bool(self.store.movable[self.index])
+        if key == 'radius':
+            return float(self.store.radius[self.index])
+        if key == 'id':
+            return self.index
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self.ARRAYS:
+            array = getattr(self.store, self.ARRAYS[key])
+            array[self.index] = value[:array.shape[1]]
+        elif key == 'enabled':
+            self.store.enabled[self.index] = value
+        elif key == 'movable':
+            self.store.movable[self.index] = value
+        elif key == 'radius':
+            self.store.radius[self.index] = value
+        else:
+            raise KeyError(key)
+        self.store.mark_changed()
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return self.KEYS
+
+    def __contains__(self, key):
+        return key in self.KEYS
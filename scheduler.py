@@ -0,0 +1,71 @@
+"""Симуляция с фиксированным шагом и выдержка темпа кадров
+
+Ввод и движение считаются тиками фиксированной длины (FixedStepScheduler),
+а кадр рисует состояние, интерполированное между двумя последними
+тиками. Поэтому скорость движения не зависит от FPS, а тяжёлый кадр не
+замедляет симуляцию: после него просто выполнится несколько тиков.
+
+FramePacer выдерживает темп кадров точнее pygame.time.Clock.tick: спит
+до момента чуть раньше срока, а остаток дожидается по perf_counter.
+"""
+import time
+
+
+class FixedStepScheduler:
+    """Сколько тиков симуляции выполнить перед кадром и доля до следующего тика
+
+    max_frame_time - сколько реального времени за кадр симуляция догоняет
+    не больше (после долгой паузы, например запекания, она не выполняет
+    сотни тиков подряд, а пропускает лишнее время).
+    """
+    def __init__(self, tick_rate=120, max_frame_time=0.25):
+        self.tick_rate = tick_rate
+        self.dt = 1.0 / tick_rate
+        self.max_frame_time = max_frame_time
+        self.accumulator = 0.0
+        self.last_time = None
+        self.alpha = 0.0
+        self.ticks = 0
+
+    def advance(self, now=None):
+        """Сколько тиков выполнить к моменту now (секунды perf_counter)"""
+        if now is None:
+            now = time.perf_counter()
+        if self.last_time is None:
+            self.last_time = now
+        elapsed = min(now - self.last_time, self.max_frame_time)
+        self.last_time = now
+        self.accumulator += elapsed
+        ticks = int(self.accumulator / self.dt)
+        self.accumulator -= ticks * self.dt
+        self.alpha = self.accumulator / self.dt
+        self.ticks += ticks
+        return ticks
+
+
+class FramePacer:
+    """Выдерживает fps кадров в секунду (fps=0 - без ограничения)
+
+    Срок следующего кадра отсчитывается от срока предыдущего, а не от
+    момента пробуждения, поэтому ошибки сна не накапливаются; отставший
+    больше чем на кадр темп начинается заново.
+    """
+    def __init__(self, fps, spin=0.002):
+        self.fps = fps
+        self.spin = spin            # Последние секунды до срока ждём без сна
+        self.deadline = None
+
+    def wait(self):
+        if not self.fps:
+            return
+        period = 1.0 / self.fps
+        now = time.perf_counter()
+        if self.deadline is None or now - self.deadline > period:
+            self.deadline = now + period
+            return
+        remaining = self.deadline - now
+        if remaining > self.spin:
+            time.sleep(remaining - self.spin)
+        while time.perf_counter() < self.deadline:
+            pass
+        self.deadline += period
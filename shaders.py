@@ -0,0 +1,69 @@
+from OpenGL.GL import *
+
+
+def compile_shader(source, shader_type):
+    """Компилирует шейдер; при ошибке бросает RuntimeError с логом компилятора"""
+    shader = glCreateShader(shader_type)
+    glShaderSource(shader, source)
+    glCompileShader(shader)
+    if glGetShaderiv(shader, GL_COMPILE_STATUS) != GL_TRUE:
+        log = glGetShaderInfoLog(shader)
+        glDeleteShader(shader)
+        if isinstance(log, bytes):
+            log = log.decode('utf-8', 'replace')
+        raise RuntimeError(f"Ошибка компиляции шейдера:\n{log}")
+    return shader
+
+
+def compile_program(vertex_source, fragment_source, attributes=None):
+    """Собирает программу из вершинного и фрагментного шейдеров.
+
+    attributes - словарь {имя атрибута: номер}, номера назначаются до линковки.
+    """
+    vertex = compile_shader(vertex_source, GL_VERTEX_SHADER)
+    fragment = compile_shader(fragment_source, GL_FRAGMENT_SHADER)
+
+    program = glCreateProgram()
+    glAttachShader(program, vertex)
+    glAttachShader(program, fragment)
+    for name, location in (attributes or {}).items():
+        glBindAttribLocation(program, location, name)
+    glLinkProgram(program)
+
+    glDetachShader(program, vertex)
+    glDetachShader(program, fragment)
+    glDeleteShader(vertex)
+    glDeleteShader(fragment)
+
+    if glGetProgramiv(program, GL_LINK_STATUS) != GL_TRUE:
+        log = glGetProgramInfoLog(program)
+        glDeleteProgram(program)
+        if isinstance(log, bytes):
+            log = log.decode('utf-8', 'replace')
+        raise RuntimeError(f"Ошибка линковки программы:\n{log}")
+    return program
+
+
+class ShaderProgram:
+    """Программа GLSL с кэшем расположения uniform-переменных"""
+    def __init__(self, vertex_source, fragment_source, attributes=None):
+        self.program = compile_program(vertex_source, fragment_source, attributes)
+        self.locations = {}
+
+    def location(self, name):
+        """Расположение uniform (запрашивается у драйвера один раз)"""
+        location = self.locations.get(name)
+        if location is None:
+            location = glGetUniformLocation(self.program, name)
+            self.locations[name] = location
+        return location
+
+    def use(self):
+        glUseProgram(self.program)
+
+    @staticmethod
+    def stop():
+        glUseProgram(0)
+
+    def delete(self):
+        glDeleteProgram(self.program)
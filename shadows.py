@@ -0,0 +1,219 @@
+import numpy as np
+from OpenGL.GL import *
+
+from culling import object_bounds
+from instancing import INSTANCE_ATTRIBUTES
+from probes import CUBE_FACES
+from shaders import ShaderProgram
+from transforms import perspective_matrix, look_at_matrix, to_gl
+
+
+# Тени есть у первых MAX_SHADOW_LIGHTS источников (у каждого свой samplerCube)
+MAX_SHADOW_LIGHTS = 4
+
+# Проекция грани: 90 градусов, квадрат
+SHADOW_NEAR = 0.05
+SHADOW_FAR = 100.0
+SHADOW_PROJECTION = perspective_matrix(90.0, 1.0, SHADOW_NEAR, SHADOW_FAR)
+
+# Карта хранит расстояние от источника до ближайшей поверхности
+DISTANCE_VERTEX_SHADER = """
+#version 130
+
+out vec3 v_eye;
+
+void main()
+{
+    vec4 eye = gl_ModelViewMatrix * gl_Vertex;
+    v_eye = eye.xyz;
+    gl_Position = gl_ProjectionMatrix * eye;
+}
+"""
+
+DISTANCE_INSTANCED_VERTEX_SHADER = """
+#version 130
+
+in vec4 instance_position;
+in vec4 instance_scale;
+
+out vec3 v_eye;
+
+void main()
+{
+    vec4 world = vec4(gl_Vertex.xyz * instance_scale.xyz + instance_position.xyz, 1.0);
+    vec4 eye = gl_ModelViewMatrix * world;
+    v_eye = eye.xyz;
+    gl_Position = gl_ProjectionMatrix * eye;
+}
+"""
+
+# Вид грани смотрит из источника, поэтому расстояние - это длина координат вида
+DISTANCE_FRAGMENT_SHADER = """
+#version 130
+
+in vec3 v_eye;
+
+void main()
+{
+    gl_FragColor = vec4(length(v_eye));
+}
+"""
+
+
+class ShadowCubeMap:
+    """Кубическая карта расстояний одного точечного источника"""
+    def __init__(self, size):
+        self.size = size
+        self.key = None           # Состояние, для которого карта нужна сейчас
+        self.rendered_key = None  # Состояние, для которого она снята
+        self.renders = 0
+
+        self.texture = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_CUBE_MAP, self.texture)
+        glTexParameteri(GL_TEXTURE_CUBE_MAP, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_CUBE_MAP, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        for param in (GL_TEXTURE_WRAP_S, GL_TEXTURE_WRAP_T, GL_TEXTURE_WRAP_R):
+            glTexParameteri(GL_TEXTURE_CUBE_MAP, param, GL_CLAMP_TO_EDGE)
+        for target, _, _ in CUBE_FACES:
+            glTexImage2D(target, 0, GL_R32F, size, size, 0, GL_RED, GL_FLOAT, None)
+        glBindTexture(GL_TEXTURE_CUBE_MAP, 0)
+
+        self.depth = glGenRenderbuffers(1)
+        glBindRenderbuffer(GL_RENDERBUFFER, self.depth)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH_COMPONENT24, size, size)
+        glBindRenderbuffer(GL_RENDERBUFFER, 0)
+
+        self.fbo = glGenFramebuffers(1)
+
+    @property
+    def ready(self):
+        """Карта снята для текущего состояния"""
+        return self.key is not None and self.rendered_key == self.key
+
+    def delete(self):
+        glDeleteFramebuffers(1, [self.fbo])
+        glDeleteRenderbuffers(1, [self.depth])
+        glDeleteTextures([self.texture])
+
+
+class ShadowMaps:
+    """Всенаправленные карты теней точечных источников с кэшем.
+
+    Ключ карты - позиция источника и геометрия объектов, которые могут
+    отбрасывать тень в его радиусе (у источника без радиуса - всех).
+    Карта перерисовывается (все шесть граней сразу), только когда ключ
+    меняется: источник сдвинули или объекты рядом с ним изменились.
+    Выключенный источник карту не теряет - после включения она готова,
+    если за это время ничего не поменялось. Неподвижный источник без
+    изменений сцены снимается один раз.
+    """
+    def __init__(self, size=512, max_lights=MAX_SHADOW_LIGHTS):
+        self.size = size
+        self.max_lights = max_lights
+        self.maps = {}  # номер источника -> ShadowCubeMap
+        self.version = None
+        self.map_renders = 0
+
+        self.program = ShaderProgram(DISTANCE_VERTEX_SHADER, DISTANCE_FRAGMENT_SHADER)
+        self.instanced_program = ShaderProgram(DISTANCE_INSTANCED_VERTEX_SHADER,
+                                               DISTANCE_FRAGMENT_SHADER, INSTANCE_ATTRIBUTES)
+
+    def sync(self, store, lights):
+        """Заводит карты включённых источников и пересчитывает их ключи"""
+        version = (store.version, lights.version)
+        if version == self.version:
+            return
+        self.version = version
+
+        # Цвета и флаги объектов на тени не влияют - в ключ идёт только геометрия
+        mins, maxs = object_bounds(store)
+        for index in range(min(len(lights), self.max_lights)):
+            if not lights.enabled[index]:
+                continue
+            shadow_map = self.maps.get(index)
+            if shadow_map is None:
+                shadow_map = self.maps[index] = ShadowCubeMap(self.size)
+
+            center = lights.positions[index, :3]
+            radius = lights.radius[index]
+            if np.isfinite(radius):
+                gap = np.maximum(np.maximum(mins - center, center - maxs), 0.0)
+                near = np.flatnonzero(np.einsum('ij,ij->i', gap, gap) <= radius ** 2)
+            else:
+                near = np.arange(len(store))
+            shadow_map.key = (center.tobytes(), near.tobytes(), store.positions[near].tobytes(),
+                              store.scales[near].tobytes(), store.types[near].tobytes())
+
+    def update(self, render_casters):
+        """Перерисовывает карты, у которых сменился ключ.
+
+        render_casters() рисует всё, что отбрасывает тень: программа
+        расстояния (use()) уже включена, матрицы грани загружены.
+        """
+        stale = [shadow_map for shadow_map in self.maps.values() if not shadow_map.ready and
+                 shadow_map.key is not None]
+        if not stale:
+            return
+
+        saved_fbo = glGetIntegerv(GL_DRAW_FRAMEBUFFER_BINDING)
+        saved_viewport = glGetIntegerv(GL_VIEWPORT)
+        glMatrixMode(GL_PROJECTION)
+        glPushMatrix()
+        glLoadMatrixf(to_gl(SHADOW_PROJECTION))
+        glMatrixMode(GL_MODELVIEW)
+        glPushMatrix()
+        # Пустые направления - "тени нет": расстояние дальше любой поверхности
+        glClearColor(SHADOW_FAR, SHADOW_FAR, SHADOW_FAR, SHADOW_FAR)
+        self.use()
+
+        for shadow_map in stale:
+            center = np.frombuffer(shadow_map.key[0], dtype=np.float32).astype(float)
+            glBindFramebuffer(GL_FRAMEBUFFER, shadow_map.fbo)
+            glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, GL_RENDERBUFFER,
+                                      shadow_map.depth)
+            glViewport(0, 0, shadow_map.size, shadow_map.size)
+            for target, direction, up in CUBE_FACES:
+                glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, target,
+                                       shadow_map.texture, 0)
+                glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+                glLoadMatrixf(to_gl(look_at_matrix(center, center + np.array(direction), up)))
+                render_casters()
+            shadow_map.rendered_key = shadow_map.key
+            shadow_map.renders += 1
+            self.map_renders += 1
+
+        ShaderProgram.stop()
+        glClearColor(0.0, 0.0, 0.0, 1.0)
+        glPopMatrix()
+        glMatrixMode(GL_PROJECTION)
+        glPopMatrix()
+        glMatrixMode(GL_MODELVIEW)
+        glBindFramebuffer(GL_FRAMEBUFFER, saved_fbo)
+        glViewport(*saved_viewport)
+
+    def use(self, instanced=False):
+        """Включает программу расстояния"""
+        program = self.instanced_program if instanced else self.program
+        program.use()
+        return program
+
+    def slots(self, lights, indices):
+        """Номер карты теней для источников indices (-1 - без тени)"""
+        slots = np.full(len(indices), -1, dtype=np.int64)
+        for k, index in enumerate(np.asarray(indices).tolist()):
+            shadow_map = self.maps.get(index)
+            if shadow_map is not None and shadow_map.ready and lights.enabled[index]:
+                slots[k] = index
+        return slots
+
+    def textures(self):
+        """Текстуры карт по номерам (0 - карты нет)"""
+        return [self.maps[i].texture if i in self.maps else 0 for i in range(self.max_lights)]
+
+    def delete(self):
+        for shadow_map in self.maps.values():
+            shadow_map.delete()
+        self.maps.clear()
+        self.version = None
+        self.program.delete()
+        self.instanced_program.delete()
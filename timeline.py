@@ -0,0 +1,107 @@
+"""Сценарий кадров: положение камеры и нажатия клавиш по номерам кадров
+
+Файл сценария - JSON:
+{"keyframes": [{"frame": 0, "position": [0, 1, 2], "yaw": -90, "pitch": 0}, ...],
+ "keys": [{"frame": 30, "key": "n"}, ...]}
+Между ключевыми кадрами камера интерполируется линейно, до первого и
+после последнего стоит на месте. Клавиши - имена pygame.key.name
+("n", "f2", "1") и нажимаются через CornellBoxApp.handle_key, как из
+окна. Сценарий записывается из окна (main.py --record) или пишется руками.
+"""
+import json
+
+import numpy as np
+import pygame
+
+
+class Timeline:
+    """Ключевые кадры камеры и нажатия клавиш"""
+    def __init__(self, keyframes, keys=()):
+        if not keyframes:
+            raise ValueError("в сценарии нет ключевых кадров камеры")
+        self.keyframes = sorted(keyframes, key=lambda k: k['frame'])
+        self.keys = sorted(keys, key=lambda k: k['frame'])
+        self.frames = np.array([k['frame'] for k in self.keyframes], dtype=np.float64)
+        self.positions = np.array([k['position'] for k in self.keyframes], dtype=np.float64)
+        self.angles = np.array([[k['yaw'], k['pitch']] for k in self.keyframes],
+                               dtype=np.float64)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data['keyframes'], data.get('keys', ()))
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'keyframes': self.keyframes, 'keys': self.keys}, f, indent=1)
+
+    @property
+    def length(self):
+        """Номер последнего кадра, на котором что-то происходит"""
+        last_key = self.keys[-1]['frame'] if self.keys else 0
+        return int(max(self.frames[-1], last_key)) + 1
+
+    def camera_at(self, frame):
+        """(позиция, yaw, pitch) камеры на кадре frame"""
+        position = [np.interp(frame, self.frames, self.positions[:, axis]) for axis in range(3)]
+        yaw = np.interp(frame, self.frames, self.angles[:, 0])
+        pitch = np.interp(frame, self.frames, self.angles[:, 1])
+        return np.array(position, dtype=np.float32), float(yaw), float(pitch)
+
+    def apply(self, app, frame, keys=True):
+        """Ставит камеру приложения и нажимает клавиши кадра frame (keys=False - только камера)"""
+        camera = app.camera
+        position, camera.yaw, camera.pitch = self.camera_at(frame)
+        camera.place(position)
+        camera.update_camera_vectors()
+        if not keys:
+            return
+        for event in self.keys:
+            if event['frame'] == frame:
+                app.handle_key(pygame.key.key_code(event['key']))
+
+
+def scripted_timeline(frames):
+    """Сценарий по умолчанию на frames кадров: облёт комнаты с переключениями
+
+    Камера обходит комнату, по дороге включается зеркальная стена,
+    второй источник выключается и включается, выбранный источник
+    сдвигается - так в замер попадают обновления отражений, теней и зондов.
+    """
+    keyframes = [
+        {'frame': 0, 'position': [0.0, 1.0, 2.0], 'yaw': -90.0, 'pitch': 0.0},
+        {'frame': frames // 4, 'position': [1.5, 0.5, 1.5], 'yaw': -120.0, 'pitch': -10.0},
+        {'frame': frames // 2, 'position': [1.5, -1.0, -1.0], 'yaw': -180.0, 'pitch': -20.0},
+        {'frame': 3 * frames // 4, 'position': [-1.5, 0.0, -1.0], 'yaw': -20.0, 'pitch': 5.0},
+        {'frame': frames - 1, 'position': [0.0, 1.0, 2.0], 'yaw': -90.0, 'pitch': 0.0}
+    ]
+    keys = [
+        {'frame': frames // 8, 'key': 'n'},        # Зеркальная стена
+        {'frame': 3 * frames // 8, 'key': 'f2'},   # Второй источник выключается...
+        {'frame': 5 * frames // 8, 'key': 'f2'},   # ...и включается
+        {'frame': 5 * frames // 8 + 1, 'key': 'u'},  # Выбранный источник вверх
+        {'frame': 7 * frames // 8, 'key': 'n'}
+    ]
+    return Timeline(keyframes, keys)
+
+
+class TimelineRecorder:
+    """Запись сценария из окна: камера каждого кадра и нажатые клавиши"""
+    def __init__(self):
+        self.frame = 0
+        self.keyframes = []
+        self.keys = []
+
+    def record_key(self, key):
+        self.keys.append({'frame': self.frame, 'key': pygame.key.name(key)})
+
+    def record_frame(self, camera):
+        """Запоминает камеру кадра и переходит к следующему"""
+        self.keyframes.append({'frame': self.frame,
+                               'position': [float(v) for v in camera.position],
+                               'yaw': float(camera.yaw), 'pitch': float(camera.pitch)})
+        self.frame += 1
+
+    def timeline(self):
+        return Timeline(self.keyframes, self.keys)
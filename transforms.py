@@ -0,0 +1,58 @@
+import math
+
+import numpy as np
+
+
+def perspective_matrix(fov_y, aspect, near, far):
+    """Матрица перспективной проекции, как у gluPerspective (строки - по математике)"""
+    f = 1.0 / math.tan(math.radians(fov_y) / 2.0)
+    return np.array([
+        [f / aspect, 0.0, 0.0, 0.0],
+        [0.0, f, 0.0, 0.0],
+        [0.0, 0.0, (far + near) / (near - far), 2.0 * far * near / (near - far)],
+        [0.0, 0.0, -1.0, 0.0]
+    ])
+
+
+def look_at_matrix(eye, target, up):
+    """Матрица вида, как у gluLookAt"""
+    eye = np.asarray(eye, dtype=float)
+    forward = np.asarray(target, dtype=float) - eye
+    forward /= np.linalg.norm(forward)
+    side = np.cross(forward, up)
+    side /= np.linalg.norm(side)
+    true_up = np.cross(side, forward)
+
+    view = np.identity(4)
+    view[0, :3] = side
+    view[1, :3] = true_up
+    view[2, :3] = -forward
+    view[:3, 3] = -view[:3, :3] @ eye
+    return view
+
+
+def camera_view_matrix(camera):
+    """Матрица вида камеры (та же, что строит Camera.get_view_matrix)"""
+    return look_at_matrix(camera.position, camera.position + camera.front, camera.up)
+
+
+def to_gl(matrix):
+    """Матрица в порядке столбцов для glLoadMatrixf/glMultMatrixf"""
+    return np.ascontiguousarray(np.asarray(matrix, dtype=np.float32).T)
+
+
+def plane_from_point_normal(point, normal):
+    """Плоскость (a, b, c, d): a*x + b*y + c*z + d = 0, нормаль нормирована"""
+    normal = np.asarray(normal, dtype=float)
+    normal = normal / np.linalg.norm(normal)
+    return np.append(normal, -normal @ np.asarray(point, dtype=float))
+
+
+def reflection_matrix(plane):
+    """Матрица отражения относительно плоскости (a, b, c, d) с единичной нормалью"""
+    plane = np.asarray(plane, dtype=float)
+    normal = plane[:3]
+    reflect = np.identity(4)
+    reflect[:3, :3] -= 2.0 * np.outer(normal, normal)
+    reflect[:3, 3] = -2.0 * plane[3] * normal
+    return reflect
@@ -0,0 +1,48 @@
+import numpy as np
+
+
+class DepthSorter:
+    """Порядок прозрачных объектов от дальнего к ближнему с кэшем.
+
+    Глубина объекта - (p - c) . front, где c - позиция камеры. Разность
+    глубин двух объектов (p_i - p_j) . front от позиции камеры не
+    зависит, поэтому перемещение камеры порядок не меняет. При повороте
+    она меняется не больше чем на |p_i - p_j| * |d front| <= 2R * |d front|
+    (R - радиус облака объектов), и пока это меньше минимального зазора
+    между соседними глубинами, сохранённый порядок остаётся верным.
+    """
+    def __init__(self):
+        self.key = None
+        self.front = None
+        self.order = None
+        self.radius = 0.0
+        self.min_gap = 0.0
+        self.sorts = 0
+        self.reuses = 0
+
+    def sort(self, store, indices, eye, front):
+        """Номера indices (объекты SceneStore), от дальнего объекта к ближнему"""
+        front = np.asarray(front, dtype=np.float64)
+        if len(indices) < 2:
+            return indices
+
+        key = (store.version, indices.tobytes())
+        if key == self.key:
+            drift = 2.0 * self.radius * np.linalg.norm(front - self.front)
+            if drift <= self.min_gap:
+                self.reuses += 1
+                return self.order
+
+        points = store.positions[indices].astype(np.float64)
+        depths = (points - eye) @ front
+        order = np.argsort(-depths, kind='stable')
+        sorted_depths = depths[order]
+
+        self.key = key
+        self.order = indices[order]
+        self.front = front
+        self.min_gap = float(np.min(sorted_depths[:-1] - sorted_depths[1:]))
+        centered = points - points.mean(axis=0)
+        self.radius = float(np.sqrt(np.max(np.einsum('ij,ij->i', centered, centered))))
+        self.sorts += 1
+        return self.order